@@ -0,0 +1,92 @@
+from typing import Optional
+
+import typer
+from rich.console import Console
+from rich.markup import escape
+from rich.table import Table
+
+from benchmarking.handler import compare_runs, run_benchmarks
+from benchmarking.utils import append_history, load_history
+from evaluate_and_align.aligners import ALIGNERS
+from image_stacking.handler import STACKING_METHODS
+
+app = typer.Typer(help="Galilean - Benchmarks on synthetic planetary captures")
+console = Console()
+
+def parse_list(value: str, cast=str) -> list:
+    return [cast(item.strip()) for item in value.split(",") if item.strip()]
+
+@app.command()
+def main(
+    sizes: str = typer.Option("360", "--sizes", help="Comma-separated crop sizes, e.g. 360,720,1080"),
+    frames: str = typer.Option("100", "--frames", help="Comma-separated frame counts, e.g. 100,1000,20000"),
+    align_frames: int = typer.Option(100, "--align-frames", min=2, help="Number of frames aligned per capture"),
+    aligners: str = typer.Option("ecc,fft", "--aligners", help=f"Comma-separated aligners from: {', '.join(ALIGNERS)}"),
+    methods: str = typer.Option(",".join(STACKING_METHODS), "--methods", help="Comma-separated stacking methods"),
+    history: str = typer.Option("benchmark_history.json", "--history", help="JSON file the run is appended to"),
+    work_dir: Optional[str] = typer.Option(None, "--work-dir", help="Directory for the temporary memory-mapped crops"),
+    seed: int = typer.Option(0, "--seed", help="Seed of the synthetic captures"),
+):
+    """
+    Time each stage on synthetic captures, record throughput, memory and alignment accuracy,
+    and compare against the previous run in the history file
+    """
+    aligner_names = parse_list(aligners)
+    method_names = parse_list(methods)
+    for name in aligner_names:
+        if name not in ALIGNERS:
+            console.print(f"[red]Error:[/red] Unknown alignment method '{name}'. Choose from: {', '.join(ALIGNERS)}")
+            raise typer.Exit(1)
+    for name in method_names:
+        if name not in STACKING_METHODS:
+            console.print(f"[red]Error:[/red] Unknown stacking method '{name}'. Choose from: {', '.join(STACKING_METHODS)}")
+            raise typer.Exit(1)
+
+    previous_runs = load_history(history)
+    with console.status("Running benchmarks..."):
+        run = run_benchmarks(
+            parse_list(sizes, int), parse_list(frames, int), align_frames, aligner_names, method_names, seed, work_dir
+        )
+    append_history(history, run)
+
+    speedups = {}
+    if previous_runs:
+        speedups = {
+            (row["stage"], row["crop_size"], row["frames"]): row["speedup"]
+            for row in compare_runs(previous_runs[-1], run)
+        }
+
+    results = Table(title=f"Benchmark Results ({run['revision'] or 'unknown revision'})")
+    for column in ["Stage", "Crop", "Frames", "Seconds", "Frames/s", "Peak MiB", "Max RSS MiB (running)", "vs. previous"]:
+        results.add_column(column)
+    for result in run["results"]:
+        speedup = speedups.get((result["stage"], result["crop_size"], result["frames"]))
+        results.add_row(
+            escape(result["stage"]),
+            str(result["crop_size"]),
+            str(result["frames"]),
+            f"{result['seconds']:.3f}",
+            f"{result['fps']:.1f}" if result["fps"] else "-",
+            f"{result['peak_mb']:.1f}",
+            f"{result['max_rss_mb']:.0f}",
+            f"{speedup:.2f}x" if speedup else "-",
+        )
+    console.print(results)
+
+    accuracy = Table(title="Alignment Accuracy")
+    for column in ["Aligner", "Crop", "Frames", "RMS error (px)", "Max error (px)", "Failures"]:
+        accuracy.add_column(column)
+    for row in run["accuracy"]:
+        accuracy.add_row(
+            row["aligner"],
+            str(row["crop_size"]),
+            str(row["frames"]),
+            f"{row['rms_error_px']:.3f}" if row["rms_error_px"] is not None else "-",
+            f"{row['max_error_px']:.3f}" if row["max_error_px"] is not None else "-",
+            str(row["failures"]),
+        )
+    console.print(accuracy)
+    console.print(f"History: {history}")
+
+if __name__ == "__main__":
+    app()
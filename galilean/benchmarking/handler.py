@@ -0,0 +1,209 @@
+import os
+import platform
+import tempfile
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from benchmarking.utils import (StageMeter, git_revision, injected_shifts,
+                             render_planet, synthetic_frames)
+from detect_and_crop.handler import detect_and_crop, track_and_crop
+from detect_and_crop.tracking import CentroidTracker
+from evaluate_and_align.aligners import create_aligner
+from evaluate_and_align.utils import evaluate_image_quality
+from image_stacking.handler import STACKING_METHODS, image_stacking
+from postprocessing.handler import postprocessing
+
+# Per-frame stages are traced for memory on this many leading frames only.
+MEMORY_SAMPLE_FRAMES = 8
+
+
+def _record(
+    results: List[Dict[str, Any]],
+    stage: str,
+    crop_size: int,
+    frames: int,
+    meter: StageMeter,
+) -> None:
+    timing = meter.timing()
+    results.append({
+        "stage": stage,
+        "crop_size": crop_size,
+        "frames": frames,
+        "seconds": timing.seconds,
+        "fps": frames / timing.seconds if timing.seconds > 0 else None,
+        "peak_mb": timing.peak_mb,
+        "max_rss_mb": timing.max_rss_mb,
+    })
+
+def _measure(meter: StageMeter, function: Callable[..., Any], *args, **kwargs) -> Any:
+    """Time one call of a whole stage, then run it again traced for its peak memory."""
+    with meter.timed():
+        result = function(*args, **kwargs)
+    with meter.traced():
+        function(*args, **kwargs)
+    return result
+
+def benchmark_alignment(
+    crop_size: int,
+    frame_count: int,
+    aligners: List[str],
+    seed: int = 0,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """Time each aligner on synthetic crops and measure its error against the injected shifts."""
+    scene = render_planet(crop_size, seed)
+    frames = list(synthetic_frames(scene, crop_size, frame_count, seed=seed))
+    # The first frame is the template, so warps translate by the shifts relative to its own.
+    expected = injected_shifts(frame_count, seed=seed)
+    expected = expected - expected[0]
+
+    results, accuracy = [], {}
+    for method in aligners:
+        meter = StageMeter()
+        estimated = np.full((frame_count, 2), np.nan)
+        with meter.timed():
+            aligner = create_aligner(method, frames[0])
+            for index, frame in enumerate(frames):
+                try:
+                    _, warp, _ = aligner.align(frame)
+                except cv2.error:
+                    continue
+                estimated[index] = warp[:, 2]
+        with meter.traced():
+            aligner = create_aligner(method, frames[0])
+            for frame in frames[:MEMORY_SAMPLE_FRAMES]:
+                try:
+                    aligner.align(frame)
+                except cv2.error:
+                    pass
+        _record(results, f"align[{method}]", crop_size, frame_count, meter)
+
+        converged = ~np.isnan(estimated[:, 0])
+        errors = np.linalg.norm(estimated[converged] - expected[converged], axis=1)
+        accuracy[method] = {
+            "crop_size": crop_size,
+            "frames": frame_count,
+            "rms_error_px": float(np.sqrt(np.mean(errors ** 2))) if len(errors) else None,
+            "max_error_px": float(errors.max()) if len(errors) else None,
+            "failures": int(frame_count - converged.sum()),
+        }
+    return results, accuracy
+
+def benchmark_capture(
+    crop_size: int,
+    frame_count: int,
+    align_frames: int = 100,
+    aligners: Optional[List[str]] = None,
+    methods: Optional[List[str]] = None,
+    seed: int = 0,
+    work_dir: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """Benchmark every stage on one synthetic capture and return stage results and alignment accuracy."""
+    aligners = aligners or ["ecc"]
+    methods = methods or STACKING_METHODS
+    scene = render_planet(crop_size, seed)
+    results = []
+
+    # Frames are generated outside the timed blocks and cropped to a memory-mapped file, so captures
+    # larger than RAM only need disk space.
+    with tempfile.TemporaryDirectory(dir=work_dir) as temporary_dir:
+        crops = np.lib.format.open_memmap(
+            os.path.join(temporary_dir, "crops.npy"), mode="w+", dtype=np.uint8,
+            shape=(frame_count, crop_size, crop_size, 3),
+        )
+        meter = StageMeter()
+        for index, frame in enumerate(synthetic_frames(scene, crop_size * 3 // 2, frame_count, seed=seed)):
+            with meter.timed():
+                crops[index] = detect_and_crop(frame, crop_size)
+            if index < MEMORY_SAMPLE_FRAMES:
+                with meter.traced():
+                    detect_and_crop(frame, crop_size)
+        crops.flush()
+        _record(results, "detect_and_crop", crop_size, frame_count, meter)
+
+        meter = StageMeter()
+        tracker, traced_tracker = CentroidTracker(), CentroidTracker()
+        for index, frame in enumerate(synthetic_frames(scene, crop_size * 3 // 2, frame_count, seed=seed)):
+            with meter.timed():
+                track_and_crop(frame, tracker, crop_size)
+            if index < MEMORY_SAMPLE_FRAMES:
+                with meter.traced():
+                    track_and_crop(frame, traced_tracker, crop_size)
+        _record(results, "detect_and_crop[tracking]", crop_size, frame_count, meter)
+
+        meter = StageMeter()
+        _measure(meter, evaluate_image_quality, crops)
+        _record(results, "evaluate_image_quality", crop_size, frame_count, meter)
+
+        # Drizzle only needs the sub-pixel remainders, which the injected shifts stand in for.
+        warp_matrices = np.tile(np.eye(2, 3, dtype=np.float32), (frame_count, 1, 1))
+        warp_matrices[:, :, 2] = injected_shifts(frame_count, seed=seed)
+        for method in methods:
+            meter = StageMeter()
+            stacked_image = _measure(meter, image_stacking, crops, method, warp_matrices=warp_matrices)
+            _record(results, f"image_stacking[{method}]", crop_size, frame_count, meter)
+        del crops
+
+    meter = StageMeter()
+    _measure(meter, postprocessing, stacked_image, 1.2, 1)
+    _record(results, "postprocessing", crop_size, 1, meter)
+
+    # Alignment dominates the run time of long captures, so it only runs on the first frames.
+    alignment_results, accuracy = benchmark_alignment(
+        crop_size, min(align_frames, frame_count), aligners, seed
+    )
+    return results + alignment_results, accuracy
+
+def run_benchmarks(
+    crop_sizes: List[int],
+    frame_counts: List[int],
+    align_frames: int = 100,
+    aligners: Optional[List[str]] = None,
+    methods: Optional[List[str]] = None,
+    seed: int = 0,
+    work_dir: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Benchmark every combination of crop size and frame count and return one history record."""
+    results, accuracy = [], []
+    for crop_size in crop_sizes:
+        for frame_count in frame_counts:
+            capture_results, capture_accuracy = benchmark_capture(
+                crop_size, frame_count, align_frames, aligners, methods, seed, work_dir
+            )
+            results += capture_results
+            accuracy += [{"aligner": method, **values} for method, values in capture_accuracy.items()]
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(os.path.dirname(os.path.abspath(__file__))),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+        },
+        "results": results,
+        "accuracy": accuracy,
+    }
+
+def compare_runs(previous: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Match the stages of two runs by stage, crop size and frame count and report the current speedup."""
+    previous_seconds = {
+        (result["stage"], result["crop_size"], result["frames"]): result["seconds"]
+        for result in previous["results"]
+    }
+    comparison = []
+    for result in current["results"]:
+        key = (result["stage"], result["crop_size"], result["frames"])
+        if key in previous_seconds and result["seconds"] > 0:
+            comparison.append({
+                "stage": result["stage"],
+                "crop_size": result["crop_size"],
+                "frames": result["frames"],
+                "previous_seconds": previous_seconds[key],
+                "seconds": result["seconds"],
+                "speedup": previous_seconds[key] / result["seconds"],
+            })
+    return comparison
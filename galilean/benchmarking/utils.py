@@ -0,0 +1,122 @@
+import json
+import os
+import resource
+import subprocess
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+class StageTiming(NamedTuple):
+    """Wall time and memory high-water marks of one benchmarked stage."""
+    seconds: float
+    peak_mb: float
+    max_rss_mb: float  # never decreases within a process, so it covers every earlier stage too
+
+
+def render_planet(crop_size: int, seed: int = 0) -> np.ndarray:
+    """Render a banded, limb-darkened planetary disc with random surface texture as float32 BGR."""
+    rng = np.random.default_rng(seed)
+    # The scene is twice the crop size, so the disc spanning 60% of a crop can be shifted freely.
+    size = 2 * crop_size
+    radius = 0.3 * crop_size
+    y, x = np.mgrid[:size, :size].astype(np.float32) - size / 2
+    r2 = (x * x + y * y) / (radius * radius)
+    disc = r2 < 1.0
+
+    latitude = y / radius
+    bands = 0.7 + 0.15 * np.sin(latitude * 9.0 + 0.5) + 0.08 * np.sin(latitude * 23.0)
+    texture = cv2.GaussianBlur(rng.standard_normal((size, size)).astype(np.float32), (0, 0), crop_size / 120)
+    texture /= np.abs(texture).max() + 1e-8
+    limb = np.sqrt(np.clip(1.0 - r2, 0.0, 1.0)) ** 0.4
+    intensity = np.where(disc, (bands + 0.15 * texture) * limb, 0.0)
+
+    tint = np.array([0.75, 0.9, 1.0], dtype=np.float32)
+    return (200.0 * intensity[..., None] * tint).astype(np.float32)
+
+def synthetic_frames(
+    scene: np.ndarray,
+    frame_size: int,
+    count: int,
+    jitter: float = 8.0,
+    seeing: Tuple[float, float] = (0.5, 2.5),
+    noise: float = 4.0,
+    seed: int = 0,
+) -> Iterator[np.ndarray]:
+    """Yield reproducible frames of a scene with the jitter of injected_shifts, seeing blur and noise."""
+    rng = np.random.default_rng(seed)
+    shifts = injected_shifts(count, jitter, seed)
+    center = (scene.shape[1] - frame_size) / 2, (scene.shape[0] - frame_size) / 2
+    for shift in shifts:
+        warp = np.float32([[1, 0, center[0] - shift[0]], [0, 1, center[1] - shift[1]]])
+        frame = cv2.warpAffine(
+            scene, warp, (frame_size, frame_size), flags=cv2.INTER_LINEAR + cv2.WARP_INVERSE_MAP
+        )
+        frame = cv2.GaussianBlur(frame, (0, 0), rng.uniform(*seeing))
+        frame += rng.normal(0.0, noise, frame.shape).astype(np.float32)
+        yield np.clip(frame, 0, 255).astype(np.uint8)
+
+def injected_shifts(count: int, jitter: float = 8.0, seed: int = 0) -> np.ndarray:
+    """The (dx, dy) displacement of the disc in each synthetic frame, in pixels."""
+    return np.random.default_rng(seed + 1).uniform(-jitter, jitter, (count, 2)).astype(np.float32)
+
+
+class StageMeter:
+    """Accumulates the wall time of the blocks it times and the peak memory of the blocks it traces."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.peak_bytes = 0
+
+    @contextmanager
+    def timed(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds += time.perf_counter() - started
+
+    # Timed blocks run without tracemalloc, whose allocation hooks would slow them down. Only NumPy
+    # allocations are traced; OpenCV ones only show up in the RSS high-water mark.
+    @contextmanager
+    def traced(self) -> Iterator[None]:
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            self.peak_bytes = max(self.peak_bytes, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    def timing(self) -> StageTiming:
+        max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return StageTiming(self.seconds, self.peak_bytes / 2**20, max_rss_kb / 2**10)
+
+
+def git_revision(path: str = ".") -> Optional[str]:
+    """Short hash of the checked-out commit, or None outside a git work tree."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=path, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_history(path: str) -> List[Dict[str, Any]]:
+    """Read the list of recorded benchmark runs, or an empty list if there is none yet."""
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return json.load(file)
+
+def append_history(path: str, run: Dict[str, Any]) -> None:
+    """Append a benchmark run to the history file, replacing it atomically."""
+    history = load_history(path)
+    history.append(run)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(history, file, indent=2)
+    os.replace(temporary_path, path)
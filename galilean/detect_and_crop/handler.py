@@ -1,18 +1,15 @@
-from typing import Union
+from typing import Iterable, Iterator, Tuple, Union
 
 import cv2
 import numpy as np
 
+from detect_and_crop.tracking import CentroidTracker
 from detect_and_crop.utils import get_binary, get_grayscale, read_image
+from profiling.handler import profiled
 
 
-def detect_and_crop(
-    source: Union[str, np.ndarray],
-    crop_size: int,
-) -> np.ndarray:
-    """Detect the centroid of an object in an image and crop around it, 
-    padding with interpolated edges if needed."""
-    image = read_image(source)
+def find_centroid(image: np.ndarray) -> Tuple[int, int]:
+    """Detect the centroid of the object in an image."""
     binary = get_binary(get_grayscale(image))
     
     M = cv2.moments(binary)
@@ -21,6 +18,11 @@ def detect_and_crop(
     
     centroid_x = int(M["m10"] / M["m00"])
     centroid_y = int(M["m01"] / M["m00"])
+    return centroid_x, centroid_y
+
+def crop_around(image: np.ndarray, centroid: Tuple[int, int], crop_size: int) -> np.ndarray:
+    """Crop a square around a centroid, padding with interpolated edges if needed."""
+    centroid_x, centroid_y = centroid
     
     h, w = image.shape[:2]
     min_dimension = min(h, w)
@@ -52,3 +54,35 @@ def detect_and_crop(
     
     result = cv2.resize(result, (crop_size, crop_size), interpolation=cv2.INTER_LINEAR)
     return result
+
+@profiled("detect_and_crop", frames=lambda *args, **kwargs: 1)
+def detect_and_crop(
+    source: Union[str, np.ndarray],
+    crop_size: int,
+) -> np.ndarray:
+    """Detect the centroid of an object in an image and crop around it, 
+    padding with interpolated edges if needed."""
+    image = read_image(source)
+    return crop_around(image, find_centroid(image), crop_size)
+
+@profiled("detect_and_crop", frames=lambda *args, **kwargs: 1)
+def track_and_crop(image: np.ndarray, tracker: CentroidTracker, crop_size: int) -> np.ndarray:
+    """Crop around the object centroid found by a tracker that has seen the previous frames."""
+    return crop_around(image, tracker.update(image), crop_size)
+
+def detect_and_crop_frames(
+    frames: Iterable[np.ndarray],
+    crop_size: int,
+    tracking: bool = False,
+) -> Iterator[np.ndarray]:
+    """Crop each frame as it arrives, so raw frames can be released immediately.
+
+    With tracking, the object is followed from frame to frame instead of being detected on
+    each full frame.
+    """
+    tracker = CentroidTracker() if tracking else None
+    for frame in frames:
+        if tracker is None:
+            yield detect_and_crop(frame, crop_size)
+        else:
+            yield track_and_crop(frame, tracker, crop_size)
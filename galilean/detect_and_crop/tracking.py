@@ -0,0 +1,113 @@
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from detect_and_crop.utils import get_binary, get_grayscale
+
+# The adaptive threshold (11x11) and the 3x3 dilation only see this far, so a binary computed on
+# a window padded by this much matches the full-frame binary everywhere inside the window.
+BINARY_REACH = 8
+
+Window = Tuple[int, int, int, int]
+
+
+def _clip_window(window: Window, shape: Tuple[int, ...]) -> Window:
+    x0, y0, x1, y1 = window
+    h, w = shape[:2]
+    return max(x0, 0), max(y0, 0), min(x1, w), min(y1, h)
+
+def window_images(image: np.ndarray, window: Window) -> Tuple[np.ndarray, np.ndarray]:
+    """Grayscale and binary object mask inside a window, identical to the same region of the full-frame ones."""
+    x0, y0, x1, y1 = window
+    px0, py0, px1, py1 = _clip_window((x0 - BINARY_REACH, y0 - BINARY_REACH, x1 + BINARY_REACH, y1 + BINARY_REACH), image.shape)
+    grayscale = get_grayscale(image[py0:py1, px0:px1])
+    inner = slice(y0 - py0, y1 - py0), slice(x0 - px0, x1 - px0)
+    return grayscale[inner], get_binary(grayscale)[inner]
+
+def bright_extent(grayscale: np.ndarray) -> Tuple[int, int, int, int]:
+    """Bounding rectangle of the pixels above the Otsu threshold, which sensor noise does not reach."""
+    _, foreground = cv2.threshold(grayscale, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return cv2.boundingRect(foreground)
+
+def touches_border(rect: Tuple[int, int, int, int], window: Window, shape: Tuple[int, ...]) -> bool:
+    """Whether a rectangle inside the window reaches an edge of it that is not also an edge of the frame."""
+    x, y, width, height = rect
+    x0, y0, x1, y1 = window
+    h, w = shape[:2]
+    return bool(
+        (x0 > 0 and x == 0) or (x1 < w and x + width == x1 - x0)
+        or (y0 > 0 and y == 0) or (y1 < h and y + height == y1 - y0)
+    )
+
+
+class CentroidTracker:
+    """Finds the object centroid of consecutive frames while computing the mask only around the object.
+
+    The first frame, and any frame where the object is lost, is located on a downsampled min/max
+    proxy that bounds every region where the mask can be set, so its centroid equals find_centroid.
+    Later frames take the moments inside a window around the previous centroid, sized from the
+    bright object rather than from the mask, which sensor noise spreads over the whole frame, and
+    are located again when the object reaches the window edge; they match find_centroid as long as
+    the mask outside that window is negligible or balanced around the object.
+    """
+
+    def __init__(self, proxy_size: int = 480, margin: int = 32):
+        self.proxy_size = proxy_size
+        self.margin = margin
+        self.extent: Optional[Window] = None
+        self.centroid: Optional[Tuple[int, int]] = None
+
+    def _locate(self, image: np.ndarray) -> Window:
+        h, w = image.shape[:2]
+        factor = int(np.ceil(max(h, w) / self.proxy_size))
+        if factor <= 1:
+            return 0, 0, w, h
+
+        # Block minima and maxima, from a min/max filter anchored at each block's corner.
+        grayscale = get_grayscale(image)
+        block = cv2.getStructuringElement(cv2.MORPH_RECT, (factor, factor))
+        block_min = cv2.erode(grayscale, block, anchor=(0, 0))[::factor, ::factor]
+        block_max = cv2.dilate(grayscale, block, anchor=(0, 0))[::factor, ::factor]
+
+        # A pixel can only be set in the mask if a pixel within BINARY_REACH is at least 2 levels
+        # brighter, so blocks where that cannot happen are left out of the window.
+        reach = 2 * int(np.ceil(BINARY_REACH / factor)) + 1
+        neighborhood_max = cv2.dilate(block_max, cv2.getStructuringElement(cv2.MORPH_RECT, (reach, reach)))
+        candidates = (cv2.subtract(neighborhood_max, block_min) >= 2).astype(np.uint8)
+        x, y, width, height = cv2.boundingRect(candidates)
+        if width == 0:
+            return 0, 0, w, h
+        return x * factor - 1, y * factor - 1, (x + width) * factor + 1, (y + height) * factor + 1
+
+    def _measure(self, image: np.ndarray, window: Window) -> Optional[Tuple[int, int]]:
+        window = _clip_window(window, image.shape)
+        grayscale, binary = window_images(image, window)
+        M = cv2.moments(binary)
+        extent = bright_extent(grayscale)
+        if M["m00"] == 0 or extent[2] == 0 or touches_border(extent, window, image.shape):
+            return None
+        x0, y0 = window[:2]
+        centroid = int(M["m10"] / M["m00"] + x0), int(M["m01"] / M["m00"] + y0)
+
+        x, y, width, height = extent
+        self.extent = (
+            x + x0 - centroid[0] - self.margin, y + y0 - centroid[1] - self.margin,
+            x + x0 + width - centroid[0] + self.margin, y + y0 + height - centroid[1] + self.margin,
+        )
+        return centroid
+
+    def update(self, image: np.ndarray) -> Tuple[int, int]:
+        """Return the centroid of the object in the next frame."""
+        centroid = None
+        if self.centroid is not None:
+            cx, cy = self.centroid
+            left, top, right, bottom = self.extent
+            centroid = self._measure(image, (cx + left, cy + top, cx + right, cy + bottom))
+        if centroid is None:
+            centroid = self._measure(image, self._locate(image))
+        if centroid is None:
+            self.centroid = None
+            raise Exception("No object detected in the image")
+        self.centroid = centroid
+        return centroid
@@ -3,6 +3,8 @@ from typing import Union
 import cv2
 import numpy as np
 
+DILATION_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+
 
 def read_image(source: Union[str, np.ndarray]) -> np.ndarray:
     """Read an image from either a file path or numpy array."""
@@ -29,6 +31,4 @@ def get_binary(grayscale_image: np.ndarray) -> np.ndarray:
         11,
         2
     )
-    
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-    return cv2.dilate(binary_image, kernel, iterations=1)
+    return cv2.dilate(binary_image, DILATION_KERNEL, iterations=1)
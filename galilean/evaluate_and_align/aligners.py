@@ -0,0 +1,228 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Tuple, Type
+
+import cv2
+import numpy as np
+
+from evaluate_and_align.utils import (alignment_residual, find_warp_matrix,
+                                      warp_image, whole_pixel_warp)
+
+
+class Aligner(ABC):
+    """Translation aligner holding everything that can be precomputed from the template."""
+
+    def __init__(self, template: np.ndarray):
+        self.shape = template.shape
+        self.template_gray = template if template.ndim == 2 else cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+
+    @abstractmethod
+    def find_warp_matrix(self, image: np.ndarray) -> np.ndarray:
+        """Estimate the inverse warp matrix that maps the template onto the image."""
+
+    def align(self, image: np.ndarray, whole_pixels: bool = False) -> Tuple[np.ndarray, np.ndarray, float]:
+        """Align an image to the template, returning the aligned image, its warp matrix and residual.
+
+        With whole_pixels, the image is only shifted by the rounded warp so no pixel is resampled,
+        and the returned warp matrix keeps the sub-pixel remainder for drizzle stacking.
+        """
+        warp_matrix = self.find_warp_matrix(image)
+        aligned = warp_image(image, whole_pixel_warp(warp_matrix) if whole_pixels else warp_matrix, self.shape)
+        return aligned, warp_matrix, alignment_residual(self.template_gray, aligned, warp_matrix)
+
+
+class EccAligner(Aligner):
+    """Full-resolution ECC maximization, identical to align_image_to_template."""
+
+    def find_warp_matrix(self, image: np.ndarray) -> np.ndarray:
+        return find_warp_matrix(self.template_gray, image)
+
+
+class FftAligner(Aligner):
+    """Sub-pixel phase correlation against a template spectrum computed once."""
+
+    def __init__(self, template: np.ndarray):
+        super().__init__(template)
+        h, w = self.template_gray.shape
+        self.window = cv2.createHanningWindow((w, h), cv2.CV_32F)
+        self.template_spectrum = self._spectrum(self.template_gray)
+
+    def _spectrum(self, gray: np.ndarray) -> np.ndarray:
+        return cv2.dft(gray.astype(np.float32) * self.window, flags=cv2.DFT_COMPLEX_OUTPUT)
+
+    def find_shift(self, image: np.ndarray) -> Tuple[float, float, float]:
+        """Return the (dx, dy) shift of the image relative to the template and the peak response."""
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        cross = cv2.mulSpectrums(self._spectrum(gray), self.template_spectrum, 0, conjB=True)
+        magnitude = cv2.magnitude(cross[..., 0], cross[..., 1]) + 1e-12
+        cross /= magnitude[..., None]
+        correlation = cv2.idft(cross, flags=cv2.DFT_REAL_OUTPUT | cv2.DFT_SCALE)
+
+        h, w = correlation.shape
+        peak_y, peak_x = np.unravel_index(np.argmax(correlation), correlation.shape)
+
+        # Weighted centroid of the 5x5 neighbourhood around the peak, wrapping at the edges.
+        offsets = np.arange(-2, 3)
+        rows = (peak_y + offsets) % h
+        cols = (peak_x + offsets) % w
+        neighbourhood = np.maximum(correlation[np.ix_(rows, cols)], 0)
+        total = neighbourhood.sum() + 1e-12
+        sub_y = peak_y + (neighbourhood.sum(axis=1) @ offsets) / total
+        sub_x = peak_x + (neighbourhood.sum(axis=0) @ offsets) / total
+
+        dx = sub_x - w if sub_x > w / 2 else sub_x
+        dy = sub_y - h if sub_y > h / 2 else sub_y
+        return float(dx), float(dy), float(correlation[peak_y, peak_x])
+
+    def find_warp_matrix(self, image: np.ndarray) -> np.ndarray:
+        dx, dy, _ = self.find_shift(image)
+        return np.array([[1, 0, dx], [0, 1, dy]], dtype=np.float32)
+
+
+class PyramidEccAligner(FftAligner):
+    """Coarse-to-fine ECC refinement on an image pyramid, seeded by the phase correlation shift."""
+
+    def __init__(self, template: np.ndarray, levels: int = 3, iterations: int = 50, eps: float = 1e-4):
+        super().__init__(template)
+        self.criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, iterations, eps)
+        self.template_pyramid = self._pyramid(self.template_gray, levels)
+
+    @staticmethod
+    def _pyramid(gray: np.ndarray, levels: int) -> list:
+        pyramid = [gray.astype(np.float32)]
+        while len(pyramid) < levels and min(pyramid[-1].shape) >= 64:
+            pyramid.append(cv2.pyrDown(pyramid[-1]))
+        return pyramid
+
+    def find_warp_matrix(self, image: np.ndarray) -> np.ndarray:
+        warp_matrix = super().find_warp_matrix(image)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        image_pyramid = self._pyramid(gray, len(self.template_pyramid))
+
+        for level in reversed(range(len(self.template_pyramid))):
+            scale = 2 ** level
+            level_warp = warp_matrix.copy()
+            level_warp[:, 2] /= scale
+            try:
+                _, level_warp = cv2.findTransformECC(
+                    self.template_pyramid[level],
+                    image_pyramid[level],
+                    level_warp,
+                    cv2.MOTION_TRANSLATION,
+                    self.criteria,
+                    None,
+                    1
+                )
+            except cv2.error:
+                continue  # keep the previous estimate if this level does not converge
+            level_warp[:, 2] *= scale
+            warp_matrix = level_warp
+        return warp_matrix
+
+
+class LocalAligner(FftAligner):
+    """Multi-point registration: a global phase correlation shift refined by a grid of alignment points.
+
+    Each alignment point's shift is estimated with one batched FFT correlation over all tiles,
+    interpolated into a dense shift field and applied together with the global shift in a single
+    remap per frame.
+    """
+
+    def __init__(self, template: np.ndarray, tile_size: int = 64, step: int = 32, min_brightness: float = 0.2):
+        super().__init__(template)
+        h, w = self.template_gray.shape
+        tile_size = min(tile_size, h, w)
+        self.tile_size = tile_size
+        self.max_shift = tile_size / 4
+
+        self.grid_y = np.arange(0, h - tile_size + 1, step)
+        self.grid_x = np.arange(0, w - tile_size + 1, step)
+        tiles = self._tiles(self.template_gray, self.grid_y, self.grid_x)
+        tile_means = tiles.mean(axis=(-2, -1))
+        self.active = tile_means >= min_brightness * tile_means.max()
+
+        self.tile_window = np.outer(np.hanning(tile_size), np.hanning(tile_size)).astype(np.float32)
+        self.tile_spectra = np.conj(np.fft.rfft2(self._normalize(tiles[self.active])))
+
+        # Dense maps from pixel coordinates to fractional grid indices, used to upsample the shift field.
+        centers = tile_size / 2 - 0.5
+        grid_index_x = (np.arange(w, dtype=np.float32) - centers) / step
+        grid_index_y = (np.arange(h, dtype=np.float32) - centers) / step
+        self.grid_map_x, self.grid_map_y = np.meshgrid(grid_index_x, grid_index_y)
+        self.pixel_x, self.pixel_y = np.meshgrid(np.arange(w, dtype=np.float32), np.arange(h, dtype=np.float32))
+
+    def _tiles(self, gray: np.ndarray, grid_y: np.ndarray, grid_x: np.ndarray) -> np.ndarray:
+        windows = np.lib.stride_tricks.sliding_window_view(gray, (self.tile_size, self.tile_size))
+        return windows[grid_y[:, None], grid_x[None, :]].astype(np.float32)
+
+    def _normalize(self, tiles: np.ndarray) -> np.ndarray:
+        return (tiles - tiles.mean(axis=(-2, -1), keepdims=True)) * self.tile_window
+
+    def find_local_shifts(self, globally_aligned_gray: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Estimate per-tile (dx, dy) shift grids of an image already aligned by the global shift."""
+        tiles = self._tiles(globally_aligned_gray, self.grid_y, self.grid_x)[self.active]
+        cross = np.fft.rfft2(self._normalize(tiles)) * self.tile_spectra
+        cross /= np.abs(cross) + 1e-12
+        correlation = np.fft.irfft2(cross, s=(self.tile_size, self.tile_size))
+
+        count, size = len(correlation), self.tile_size
+        flat_peaks = np.argmax(correlation.reshape(count, -1), axis=1)
+        peak_y, peak_x = np.divmod(flat_peaks, size)
+        tile_index = np.arange(count)
+
+        def parabolic(before: np.ndarray, peak: np.ndarray, after: np.ndarray) -> np.ndarray:
+            denominator = before - 2 * peak + after
+            safe = np.where(np.abs(denominator) > 1e-12, denominator, 1)
+            return np.where(np.abs(denominator) > 1e-12, 0.5 * (before - after) / safe, 0)
+
+        peak = correlation[tile_index, peak_y, peak_x]
+        dx = peak_x + parabolic(correlation[tile_index, peak_y, (peak_x - 1) % size], peak,
+                                correlation[tile_index, peak_y, (peak_x + 1) % size])
+        dy = peak_y + parabolic(correlation[tile_index, (peak_y - 1) % size, peak_x], peak,
+                                correlation[tile_index, (peak_y + 1) % size, peak_x])
+        dx = np.where(dx > size / 2, dx - size, dx)
+        dy = np.where(dy > size / 2, dy - size, dy)
+        valid = np.hypot(dx, dy) <= self.max_shift
+
+        shift_x = np.zeros(self.active.shape, dtype=np.float32)
+        shift_y = np.zeros(self.active.shape, dtype=np.float32)
+        weights = np.zeros(self.active.shape, dtype=np.float32)
+        shift_x[self.active] = np.where(valid, dx, 0)
+        shift_y[self.active] = np.where(valid, dy, 0)
+        weights[self.active] = valid
+
+        # Normalized convolution fills inactive or rejected points from their neighbours.
+        smoothed_weights = cv2.GaussianBlur(weights, (3, 3), 0) + 1e-6
+        shift_x = cv2.GaussianBlur(shift_x * weights, (3, 3), 0) / smoothed_weights
+        shift_y = cv2.GaussianBlur(shift_y * weights, (3, 3), 0) / smoothed_weights
+        return shift_x, shift_y
+
+    def _upsample_shifts(self, grid: np.ndarray) -> np.ndarray:
+        """Interpolate a grid of alignment point shifts to every pixel."""
+        return cv2.remap(grid, self.grid_map_x, self.grid_map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+    def align(self, image: np.ndarray, whole_pixels: bool = False) -> Tuple[np.ndarray, np.ndarray, float]:
+        if whole_pixels:
+            return super().align(image, whole_pixels)  # a local shift field cannot be drizzled
+        warp_matrix = FftAligner.find_warp_matrix(self, image)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        globally_aligned_gray = warp_image(gray, warp_matrix, gray.shape)
+        shift_x, shift_y = self.find_local_shifts(globally_aligned_gray)
+
+        map_x = self.pixel_x + warp_matrix[0, 2] + self._upsample_shifts(shift_x)
+        map_y = self.pixel_y + warp_matrix[1, 2] + self._upsample_shifts(shift_y)
+        aligned = cv2.remap(image, map_x, map_y, cv2.INTER_LINEAR)
+        return aligned, warp_matrix, alignment_residual(self.template_gray, aligned, warp_matrix)
+
+
+ALIGNERS: Dict[str, Type[Aligner]] = {
+    "ecc": EccAligner,
+    "fft": FftAligner,
+    "pyramid-ecc": PyramidEccAligner,
+    "local": LocalAligner,
+}
+
+def create_aligner(method: str, template: np.ndarray) -> Aligner:
+    """Create the aligner registered under the given method name for a template."""
+    if method not in ALIGNERS:
+        raise ValueError(f"Unknown alignment method: {method}")
+    return ALIGNERS[method](template)
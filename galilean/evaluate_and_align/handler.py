@@ -1,19 +1,235 @@
-from typing import List, Tuple
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
 
 import numpy as np
 
-from evaluate_and_align.utils import align_image_to_template, select_template
+from detect_and_crop.handler import crop_around, find_centroid
+from detect_and_crop.tracking import CentroidTracker
+from evaluate_and_align.aligners import create_aligner
+from evaluate_and_align.utils import (compute_image_metrics,
+                                      compute_proxy_sharpness,
+                                      evaluate_image_quality,
+                                      prefilter_candidates, rank_images,
+                                      score_candidates)
+from frame_store.utils import map_frames, write_frames
+from profiling.handler import profiled, span
+from video_reader.handler import read_frames, read_selected_frames
 
 
-def evaluate_and_align(images: List[np.ndarray], threshold: float=0.95) -> Tuple[np.ndarray, int, float, float]:
-    """Align all images to template and return aligned images and their shifts."""
-    best_index, best_image, best_score, avg_quality, top_images_indices = select_template(images, threshold)
+class AlignmentResult(NamedTuple):
+    """Aligned frames together with the scoring and registration details of the run."""
+    aligned_images: List[np.ndarray]
+    best_index: int
+    best_score: float
+    avg_quality: float
+    residuals: np.ndarray
+    warp_matrices: np.ndarray
+    scores: np.ndarray
+    selected: np.ndarray
+
+
+@profiled("evaluate_and_align", frames=lambda images, *args, **kwargs: len(images))
+def evaluate_and_align(
+    images: List[np.ndarray],
+    threshold: float = 0.95,
+    method: str = "ecc",
+    prefilter: float = 1.0,
+    whole_pixels: bool = False,
+) -> AlignmentResult:
+    """Align the top images to the best one and return aligned images, template stats and per-frame residuals.
+
+    With whole_pixels, frames are only shifted by whole pixels for drizzle stacking.
+    """
+    with span("evaluate_image_quality", len(images)):
+        scores, avg_quality = evaluate_image_quality(images, max(prefilter, threshold))
+    best_index, top_images_mask = rank_images(scores, threshold)
+    aligner = create_aligner(method, images[best_index])
     
     aligned_images = []
+    residuals = []
+    warp_matrices = []
     
-    for index, image in enumerate(images):
-        if index in top_images_indices:
-            aligned = align_image_to_template(best_image, image)
-            aligned_images.append(aligned)
+    with span("align", int(top_images_mask.sum())):
+        for index, image in enumerate(images):
+            if top_images_mask[index]:
+                aligned, warp_matrix, residual = aligner.align(image, whole_pixels)
+                aligned_images.append(aligned)
+                residuals.append(residual)
+                warp_matrices.append(warp_matrix)
     
-    return aligned_images, best_index, best_score, avg_quality
+    return AlignmentResult(
+        aligned_images, best_index, scores[best_index], avg_quality, np.array(residuals),
+        np.array(warp_matrices).reshape(-1, 2, 3), scores, np.flatnonzero(top_images_mask)
+    )
+
+def score_streamed_frames(
+    frames: Iterable[np.ndarray],
+    crop_size: int,
+    proxy: bool = False,
+    on_progress: Optional[Callable[[int], None]] = None,
+    tracking: bool = False,
+) -> Tuple[List[Tuple[int, int]], np.ndarray, Optional[np.ndarray]]:
+    """Crop and score frames one at a time, keeping only their centroids and metrics.
+
+    Returns the centroid, the raw quality metrics and, with proxy, the proxy sharpness of each frame.
+    """
+    all_metrics = []
+    all_proxy = []
+    centroids = []
+    tracker = CentroidTracker() if tracking else None
+    for frame in frames:
+        with span("detect_and_crop", 1):
+            centroid = find_centroid(frame) if tracker is None else tracker.update(frame)
+            cropped = crop_around(frame, centroid, crop_size)
+        with span("evaluate_image_quality", 1):
+            all_metrics.append(compute_image_metrics(cropped))
+            if proxy:
+                all_proxy.append(compute_proxy_sharpness(cropped[None])[0])
+        centroids.append(centroid)
+        if on_progress is not None:
+            on_progress(1)
+    return centroids, np.array(all_metrics), np.array(all_proxy) if proxy else None
+
+def rank_streamed_frames(
+    metrics_array: np.ndarray,
+    proxy: Optional[np.ndarray],
+    threshold: float,
+    prefilter: float = 1.0,
+) -> Tuple[np.ndarray, float, int, np.ndarray]:
+    """Score and rank streamed frames as evaluate_and_align would, returning scores, average quality, best index and selection.
+
+    The prefilter applies to the proxy sharpness, so the same frames are ranked as in a single pass.
+    """
+    if not len(metrics_array):
+        raise ValueError("No frames were decoded from the selected videos")
+    candidates = prefilter_candidates(len(metrics_array), proxy, max(prefilter, threshold))
+    scores, avg_quality = score_candidates(metrics_array[candidates], candidates, len(metrics_array))
+    best_index, top_images_mask = rank_images(scores, threshold)
+    return scores, avg_quality, best_index, np.flatnonzero(top_images_mask)
+
+def read_selected_crops(
+    video_paths: List[str],
+    centroids: List[Tuple[int, int]],
+    scores: np.ndarray,
+    selected: np.ndarray,
+    best_index: int,
+    crop_size: int,
+    prefetch: int = 0,
+    frame_counts: Optional[List[int]] = None,
+) -> Tuple[Dict[int, np.ndarray], np.ndarray, int]:
+    """Re-decode and crop the selected frames and the template frame around their scored centroids.
+
+    Frames are found by the per-video frame_counts of the first pass, as in read_selected_frames.
+    Frames that fail to decode a second time are dropped from the selection, and the template
+    falls back to the best scored frame that did decode. Returns the crops by frame index, the
+    remaining selection and the template index.
+    """
+    cropped_images = {}
+    for index, frame in read_selected_frames(video_paths, [*selected, best_index], prefetch,
+                                             frame_counts=frame_counts):
+        cropped_images[index] = crop_around(frame, centroids[index], crop_size)
+    if not cropped_images:
+        raise ValueError("None of the selected frames could be decoded again")
+    selected = np.array([index for index in selected if index in cropped_images], dtype=int)
+    if best_index not in cropped_images:
+        best_index = max(cropped_images, key=lambda index: scores[index])
+    return cropped_images, selected, best_index
+
+def align_selected_to_file(
+    video_paths: List[str],
+    centroids: List[Tuple[int, int]],
+    scores: np.ndarray,
+    selected: np.ndarray,
+    best_index: int,
+    crop_size: int,
+    method: str,
+    aligned_path: str,
+    prefetch: int = 0,
+    whole_pixels: bool = False,
+    frame_counts: Optional[List[int]] = None,
+) -> Tuple[np.ndarray, int, np.ndarray, np.ndarray, np.ndarray]:
+    """Re-decode the selected frames one at a time and align them into a .npy file mapped from disk."""
+    # The template is seeked to and falls back to the best scored selected frame that decodes.
+    template = None
+    for index in [best_index, *sorted(selected, key=lambda index: -scores[index])]:
+        for _, frame in read_selected_frames(video_paths, [index], seek=True, frame_counts=frame_counts):
+            template, best_index = crop_around(frame, centroids[index], crop_size), int(index)
+        if template is not None:
+            break
+    if template is None:
+        raise ValueError("None of the selected frames could be decoded again")
+
+    aligner = create_aligner(method, template)
+    aligned_images = np.lib.format.open_memmap(
+        aligned_path, mode="w+", dtype=template.dtype, shape=(len(selected),) + template.shape
+    )
+    kept, residuals, warp_matrices = [], [], []
+    # Frames that fail to decode are dropped, as in read_selected_crops.
+    with span("align", len(selected)):
+        for index, frame in read_selected_frames(video_paths, selected, prefetch, frame_counts=frame_counts):
+            cropped = crop_around(frame, centroids[index], crop_size)
+            aligned_images[len(kept)], warp_matrix, residual = aligner.align(cropped, whole_pixels)
+            kept.append(index)
+            residuals.append(residual)
+            warp_matrices.append(warp_matrix)
+    aligned_images.flush()
+    if len(kept) < len(selected):
+        write_frames(aligned_path, aligned_images[:len(kept)], len(kept))
+    del aligned_images
+    return (
+        map_frames(aligned_path), best_index, np.array(kept, dtype=int), np.array(residuals),
+        np.array(warp_matrices).reshape(-1, 2, 3),
+    )
+
+def evaluate_and_align_two_pass(
+    video_paths: List[str],
+    crop_size: int,
+    threshold: float = 0.95,
+    method: str = "ecc",
+    on_progress: Optional[Callable[[int], None]] = None,
+    prefetch: int = 0,
+    tracking: bool = False,
+    whole_pixels: bool = False,
+    prefilter: float = 1.0,
+    aligned_path: Optional[str] = None,
+) -> AlignmentResult:
+    """Score every frame while streaming, then re-decode, crop and align only the selected frames.
+
+    The first pass keeps just the quality metrics and centroid of each frame, so memory scales
+    with the number of kept frames rather than the length of the capture. Every frame gets its
+    full metrics, since the prefilter candidates are only known once the capture has been read.
+    With aligned_path, see align_selected_to_file.
+    """
+    frame_counts: List[int] = []
+    centroids, metrics_array, proxy = score_streamed_frames(
+        read_frames(video_paths, prefetch, frame_counts), crop_size, prefilter < 1.0, on_progress,
+        tracking,
+    )
+    scores, avg_quality, best_index, selected = rank_streamed_frames(metrics_array, proxy, threshold, prefilter)
+    if aligned_path is not None:
+        aligned_images, best_index, selected, residuals, warp_matrices = align_selected_to_file(
+            video_paths, centroids, scores, selected, best_index, crop_size, method, aligned_path, prefetch,
+            whole_pixels, frame_counts,
+        )
+        return AlignmentResult(
+            aligned_images, best_index, scores[best_index], avg_quality, residuals, warp_matrices, scores,
+            selected,
+        )
+    cropped_images, selected, best_index = read_selected_crops(
+        video_paths, centroids, scores, selected, best_index, crop_size, prefetch, frame_counts
+    )
+
+    aligner = create_aligner(method, cropped_images[best_index])
+    aligned_images = []
+    residuals = []
+    warp_matrices = []
+    with span("align", len(selected)):
+        for index in selected:
+            aligned, warp_matrix, residual = aligner.align(cropped_images.pop(index), whole_pixels)
+            aligned_images.append(aligned)
+            residuals.append(residual)
+            warp_matrices.append(warp_matrix)
+
+    return AlignmentResult(
+        aligned_images, best_index, scores[best_index], avg_quality, np.array(residuals),
+        np.array(warp_matrices).reshape(-1, 2, 3), scores, selected
+    )
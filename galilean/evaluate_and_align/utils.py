@@ -1,20 +1,49 @@
-from typing import Tuple
+from typing import List, Optional, Sequence, Tuple
 
 import cv2
 import numpy as np
 
 
-def evaluate_image_quality(images: np.ndarray) -> Tuple[np.ndarray, float]:
-    """Evaluate quality metrics for all images and return normalized scores and average quality."""
-    all_metrics = []
-    for image in images:
-        grayscale = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        contrast = np.std(grayscale)
-        sharpness = cv2.Laplacian(grayscale, cv2.CV_64F).var()
-        snr = np.mean(grayscale) / (np.std(grayscale) + 1e-8)
-        all_metrics.append([contrast, sharpness, snr])
-    
-    metrics_array = np.array(all_metrics)
+def _batch_grayscale(images: np.ndarray) -> np.ndarray:
+    """Convert a batch of BGR images to grayscale with a single cvtColor call."""
+    count, h, w = images.shape[:3]
+    stacked = np.ascontiguousarray(images).reshape(count * h, w, 3)
+    return cv2.cvtColor(stacked, cv2.COLOR_BGR2GRAY).reshape(count, h, w)
+
+def _laplacian_variance(grayscale: np.ndarray) -> float:
+    _, laplacian_std = cv2.meanStdDev(cv2.Laplacian(grayscale, cv2.CV_32F))
+    return laplacian_std[0, 0] ** 2
+
+def compute_batch_metrics(images: np.ndarray) -> np.ndarray:
+    """Compute the raw contrast, sharpness and SNR metrics of a batch of images.
+
+    The batch is converted to grayscale in one call and the Laplacian is taken in float32,
+    with statistics from cv2.meanStdDev instead of float64 NumPy reductions.
+    """
+    metrics = np.empty((len(images), 3))
+    for index, grayscale in enumerate(_batch_grayscale(images)):
+        mean, std = cv2.meanStdDev(grayscale)
+        contrast = std[0, 0]
+        sharpness = _laplacian_variance(grayscale)
+        snr = mean[0, 0] / (contrast + 1e-8)
+        metrics[index] = contrast, sharpness, snr
+    return metrics
+
+def compute_image_metrics(image: np.ndarray) -> np.ndarray:
+    """Compute the raw contrast, sharpness and SNR metrics of a single image."""
+    return compute_batch_metrics(image[None])[0]
+
+def compute_proxy_sharpness(images: np.ndarray, factor: int = 4) -> np.ndarray:
+    """Cheap sharpness estimate of a batch: Laplacian variance of a downsampled grayscale proxy."""
+    count, h, w = images.shape[:3]
+    h, w = h // factor * factor, w // factor * factor
+    stacked = np.ascontiguousarray(images[:, :h, :w]).reshape(count * h, w, 3)
+    proxies = cv2.resize(stacked, (w // factor, count * h // factor), interpolation=cv2.INTER_AREA)
+    grayscale = cv2.cvtColor(proxies, cv2.COLOR_BGR2GRAY).reshape(count, h // factor, w // factor)
+    return np.array([_laplacian_variance(proxy) for proxy in grayscale])
+
+def score_metrics(metrics_array: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Normalize raw metrics across all images and combine them into weighted scores."""
     min_vals = np.min(metrics_array, axis=0)
     max_vals = np.max(metrics_array, axis=0)
     normalized = (metrics_array - min_vals) / (max_vals - min_vals + 1e-8)
@@ -24,18 +53,72 @@ def evaluate_image_quality(images: np.ndarray) -> Tuple[np.ndarray, float]:
     avg_quality = np.mean(scores)
     return scores, avg_quality
 
-def select_template(images: np.ndarray, threshold: float = 0.95) -> Tuple[int, np.ndarray, float, float, int]:
-    """Select best template based on quality score and also return the top images based on threshold."""
-    scores, avg_quality = evaluate_image_quality(images)
-    best_index = np.argmax(scores)
-    sorted_indices = np.argsort(scores)[::-1]
-    num_top_images = int(len(images) * threshold)
-    top_images_indices = sorted_indices[:num_top_images]
-    return best_index, images[best_index], scores[best_index], avg_quality, top_images_indices
+def top_k_mask(scores: np.ndarray, k: int) -> np.ndarray:
+    """Boolean mask of the k highest scores, found with a partial sort."""
+    mask = np.zeros(len(scores), dtype=bool)
+    k = min(max(k, 0), len(scores))
+    if k > 0:
+        mask[np.argpartition(scores, len(scores) - k)[len(scores) - k:]] = True
+    return mask
 
-def align_image_to_template(template: np.ndarray, image: np.ndarray) -> np.ndarray:
-    """Aligns an input image to a template image using ECC maximization."""
-    template_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+def prefilter_candidates(count: int, proxy: Optional[np.ndarray], prefilter: float = 1.0) -> np.ndarray:
+    """Indices of the count frames whose proxy sharpness is in the top prefilter fraction, all without a proxy."""
+    if proxy is None or prefilter >= 1.0:
+        return np.arange(count)
+    return np.flatnonzero(top_k_mask(proxy, int(np.ceil(prefilter * count))))
+
+def score_candidates(metrics_array: np.ndarray, candidates: np.ndarray, count: int) -> Tuple[np.ndarray, float]:
+    """Scores of count frames from the raw metrics of the candidates among them; the others score -inf."""
+    candidate_scores, avg_quality = score_metrics(metrics_array)
+    scores = np.full(count, -np.inf)
+    scores[candidates] = candidate_scores
+    return scores, avg_quality
+
+def _take(images: Sequence[np.ndarray], indices: np.ndarray) -> np.ndarray:
+    if isinstance(images, np.ndarray):
+        return images[indices]
+    return np.stack([images[index] for index in indices])
+
+def evaluate_image_quality(
+    images: Sequence[np.ndarray],
+    prefilter: float = 1.0,
+    chunk_size: int = 64,
+) -> Tuple[np.ndarray, float]:
+    """Evaluate quality metrics for all images and return normalized scores and average quality.
+
+    Images are scored in chunks. With prefilter < 1, a cheap proxy sharpness first keeps only
+    that fraction of images for the full metrics; rejected images get a score of -inf and the
+    normalization and average quality cover the kept images only.
+    """
+    count = len(images)
+    proxy = None
+    if prefilter < 1.0:
+        proxy = np.concatenate([compute_proxy_sharpness(_take(images, np.arange(start, min(start + chunk_size, count))))
+                                for start in range(0, count, chunk_size)])
+    candidates = prefilter_candidates(count, proxy, prefilter)
+
+    metrics_array = np.concatenate([compute_batch_metrics(_take(images, candidates[start:start + chunk_size]))
+                                    for start in range(0, len(candidates), chunk_size)])
+    return score_candidates(metrics_array, candidates, count)
+
+def rank_images(scores: np.ndarray, threshold: float = 0.95) -> Tuple[int, np.ndarray]:
+    """Return the index of the best score and a boolean mask of the top images based on threshold."""
+    best_index = int(np.argmax(scores))
+    num_top_images = int(len(scores) * threshold)
+    return best_index, top_k_mask(scores, num_top_images)
+
+def select_template(
+    images: Sequence[np.ndarray],
+    threshold: float = 0.95,
+    prefilter: float = 1.0,
+) -> Tuple[int, np.ndarray, float, float, np.ndarray]:
+    """Select best template based on quality score and also return a mask of the top images based on threshold."""
+    scores, avg_quality = evaluate_image_quality(images, max(prefilter, threshold))
+    best_index, top_images_mask = rank_images(scores, threshold)
+    return best_index, images[best_index], scores[best_index], avg_quality, top_images_mask
+
+def find_warp_matrix(template_gray: np.ndarray, image: np.ndarray) -> np.ndarray:
+    """Estimate the translation that maps an image onto a grayscale template using ECC maximization."""
     image_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     
     warp_mode = cv2.MOTION_TRANSLATION
@@ -50,10 +133,49 @@ def align_image_to_template(template: np.ndarray, image: np.ndarray) -> np.ndarr
         warp_mode, 
         criteria
     )
-    
+    return warp_matrix
+
+def warp_image(image: np.ndarray, warp_matrix: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+    """Apply an inverse warp matrix to an image, producing an output of the given shape."""
     return cv2.warpAffine(
         image,
         warp_matrix, 
-        (template.shape[1], template.shape[0]),
+        (shape[1], shape[0]),
         flags=cv2.INTER_LINEAR + cv2.WARP_INVERSE_MAP
     )
+
+def whole_pixel_warp(warp_matrix: np.ndarray) -> np.ndarray:
+    """The translation of a warp matrix rounded to whole pixels."""
+    rounded = warp_matrix.copy()
+    rounded[..., 2] = np.rint(rounded[..., 2])
+    return rounded
+
+def resample_whole_pixel_aligned(images: Sequence[np.ndarray], warp_matrices: np.ndarray) -> List[np.ndarray]:
+    """Finish aligning images shifted by whole pixels by resampling their sub-pixel remainder.
+
+    Shifting by the rounded warp and then by the remainder reads the same source pixels with the
+    same bilinear weights as the full warp, so this matches the default alignment away from the
+    uncovered border.
+    """
+    remainders = warp_matrices - whole_pixel_warp(warp_matrices)
+    remainders[..., 0, 0] = remainders[..., 1, 1] = 1
+    return [warp_image(image, remainder, image.shape) for image, remainder in zip(images, remainders)]
+
+def alignment_residual(template_gray: np.ndarray, aligned: np.ndarray, warp_matrix: np.ndarray) -> float:
+    """Root-mean-square grayscale difference between an aligned image and the template, in [0, 1].
+
+    The border uncovered by the warp is excluded so that larger shifts are not penalized.
+    """
+    aligned_gray = cv2.cvtColor(aligned, cv2.COLOR_BGR2GRAY)
+    margin = int(np.ceil(np.abs(warp_matrix[:, 2]).max())) + 1
+    h, w = template_gray.shape
+    if 2 * margin >= min(h, w):
+        margin = 0
+    difference = cv2.absdiff(template_gray, aligned_gray)[margin:h - margin, margin:w - margin]
+    return float(np.sqrt(np.mean(np.square(difference, dtype=np.float32)))) / 255.0
+
+def align_image_to_template(template: np.ndarray, image: np.ndarray) -> np.ndarray:
+    """Aligns an input image to a template image using ECC maximization."""
+    template_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+    warp_matrix = find_warp_matrix(template_gray, image)
+    return warp_image(image, warp_matrix, template.shape)
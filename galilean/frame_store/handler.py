@@ -0,0 +1,80 @@
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from evaluate_and_align.handler import AlignmentResult
+from frame_store.utils import map_frames, store_key, write_frames
+
+DEFAULT_STORE_DIR = "cache"
+
+
+def cropped_dir(store_dir: str, video_paths: List[str], crop_size: int, tracking: bool = False) -> str:
+    """Directory holding the cropped frames of the videos at the given crop size."""
+    parameters = {"crop_size": crop_size, **({"tracking": True} if tracking else {})}
+    return os.path.join(store_dir, store_key(video_paths, **parameters))
+
+def alignment_dir(store_dir: str, video_paths: List[str], crop_size: int,
+                  threshold: float, method: str, prefilter: float, tracking: bool = False,
+                  whole_pixels: bool = False) -> str:
+    """Directory holding the alignment of the cropped frames for the given selection and aligner."""
+    parameters = {"threshold": threshold, "method": method, "prefilter": prefilter,
+                  **({"whole_pixels": True} if whole_pixels else {})}
+    key = store_key(video_paths, crop_size=crop_size, **parameters)
+    return os.path.join(cropped_dir(store_dir, video_paths, crop_size, tracking), key)
+
+def save_cropped(directory: str, cropped_images: List[np.ndarray]) -> None:
+    """Spill cropped frames to the store."""
+    os.makedirs(directory, exist_ok=True)
+    write_frames(os.path.join(directory, "cropped.npy"), cropped_images, len(cropped_images))
+
+def load_cropped(directory: str) -> Optional[np.ndarray]:
+    """Map stored cropped frames, or return None if they were never stored."""
+    path = os.path.join(directory, "cropped.npy")
+    return map_frames(path) if os.path.exists(path) else None
+
+def aligned_path(directory: str) -> str:
+    """File of the stored aligned frames, which two-pass alignment may write directly."""
+    return os.path.join(directory, "aligned.npy")
+
+def save_alignment(directory: str, result: AlignmentResult) -> None:
+    """Spill aligned frames, their scores, residuals and warp matrices to the store."""
+    os.makedirs(directory, exist_ok=True)
+    path = aligned_path(directory)
+    # Aligned frames already mapped from the store's own file are left in place.
+    stored = isinstance(result.aligned_images, np.memmap) and os.path.exists(path) \
+        and os.path.samefile(result.aligned_images.filename, path)
+    if not stored:
+        write_frames(path, result.aligned_images, len(result.aligned_images))
+    np.save(os.path.join(directory, "scores.npy"), result.scores)
+    np.save(os.path.join(directory, "residuals.npy"), result.residuals)
+    np.save(os.path.join(directory, "warp_matrices.npy"), result.warp_matrices)
+    np.save(os.path.join(directory, "selected.npy"), result.selected)
+
+    summary = {
+        "best_index": int(result.best_index),
+        "best_score": float(result.best_score),
+        "avg_quality": float(result.avg_quality),
+    }
+    with open(os.path.join(directory, "summary.json.partial"), "w") as file:
+        json.dump(summary, file)
+    os.replace(os.path.join(directory, "summary.json.partial"), os.path.join(directory, "summary.json"))
+
+def load_alignment(directory: str) -> Optional[AlignmentResult]:
+    """Map a stored alignment zero-copy, or return None if it is missing or incomplete."""
+    summary_path = os.path.join(directory, "summary.json")
+    if not os.path.exists(summary_path):
+        return None
+    with open(summary_path) as file:
+        summary = json.load(file)
+    return AlignmentResult(
+        map_frames(aligned_path(directory)),
+        summary["best_index"],
+        summary["best_score"],
+        summary["avg_quality"],
+        np.load(os.path.join(directory, "residuals.npy")),
+        np.load(os.path.join(directory, "warp_matrices.npy")),
+        np.load(os.path.join(directory, "scores.npy")),
+        np.load(os.path.join(directory, "selected.npy")),
+    )
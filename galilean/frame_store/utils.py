@@ -0,0 +1,49 @@
+import hashlib
+import json
+import os
+from typing import Iterable, List
+
+import numpy as np
+
+SAMPLE_BYTES = 1 << 20
+
+
+def video_fingerprint(video_path: str) -> str:
+    """Hash a video's size and its first and last megabyte, which is cheap even for huge captures."""
+    digest = hashlib.sha256()
+    size = os.path.getsize(video_path)
+    digest.update(str(size).encode())
+    with open(video_path, "rb") as file:
+        digest.update(file.read(SAMPLE_BYTES))
+        if size > SAMPLE_BYTES:
+            file.seek(max(size - SAMPLE_BYTES, SAMPLE_BYTES))
+            digest.update(file.read(SAMPLE_BYTES))
+    return digest.hexdigest()
+
+def store_key(video_paths: List[str], **parameters) -> str:
+    """Build a short key from the input videos and the parameters that produced the stored frames."""
+    payload = {
+        "videos": [video_fingerprint(video_path) for video_path in video_paths],
+        "parameters": parameters,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+
+def write_frames(path: str, frames: Iterable[np.ndarray], count: int) -> None:
+    """Write frames one by one into a .npy file through a memory map, then publish it atomically."""
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        np.save(path, np.empty((0,), dtype=np.uint8))
+        return
+    temporary_path = f"{path}.partial.npy"
+    stored = np.lib.format.open_memmap(temporary_path, mode="w+", dtype=first.dtype, shape=(count,) + first.shape)
+    stored[0] = first
+    for index, frame in enumerate(frames, 1):
+        stored[index] = frame
+    stored.flush()
+    del stored
+    os.replace(temporary_path, path)
+
+def map_frames(path: str) -> np.ndarray:
+    """Map a stored .npy frame file read-only without loading it into memory."""
+    return np.load(path, mmap_mode="r")
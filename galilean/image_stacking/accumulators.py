@@ -0,0 +1,269 @@
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+
+FrameSource = Callable[[], Iterable[np.ndarray]]
+
+
+class MeanAccumulator:
+    """Running per-pixel mean and variance of pushed frames using Welford's algorithm."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean: Optional[np.ndarray] = None
+        self.m2: Optional[np.ndarray] = None
+        self._delta: Optional[np.ndarray] = None
+
+    def push(self, frame: np.ndarray) -> None:
+        """Add one frame to the running statistics."""
+        if self.mean is None:
+            self.mean = np.zeros(frame.shape, dtype=np.float64)
+            self.m2 = np.zeros(frame.shape, dtype=np.float64)
+            self._delta = np.empty(frame.shape, dtype=np.float64)
+        self.count += 1
+        np.subtract(frame, self.mean, out=self._delta)
+        self.mean += self._delta / self.count
+        self._delta *= frame - self.mean
+        self.m2 += self._delta
+
+    def variance(self) -> np.ndarray:
+        """Population variance of the pushed frames."""
+        return self.m2 / max(self.count, 1)
+
+    def std(self) -> np.ndarray:
+        """Population standard deviation of the pushed frames."""
+        return np.sqrt(self.variance())
+
+
+class ClippedMeanAccumulator:
+    """Running mean of pushed frames after clipping each pixel to fixed per-pixel bounds."""
+
+    def __init__(self, lower_bound: np.ndarray, upper_bound: np.ndarray):
+        self.lower_bound = lower_bound
+        self.upper_bound = upper_bound
+        self.count = 0
+        self.total = np.zeros(lower_bound.shape, dtype=np.float64)
+        self.total_sq = np.zeros(lower_bound.shape, dtype=np.float64)
+        self._clipped = np.empty(lower_bound.shape, dtype=np.float64)
+
+    def push(self, frame: np.ndarray) -> None:
+        """Clip one frame to the bounds and add it to the running sums."""
+        np.clip(frame, self.lower_bound, self.upper_bound, out=self._clipped)
+        self.total += self._clipped
+        self._clipped *= self._clipped
+        self.total_sq += self._clipped
+        self.count += 1
+
+    def mean(self) -> np.ndarray:
+        """Mean of the clipped frames."""
+        return self.total / max(self.count, 1)
+
+    def std(self) -> np.ndarray:
+        """Population standard deviation of the clipped frames."""
+        mean = self.mean()
+        return np.sqrt(np.maximum(self.total_sq / max(self.count, 1) - mean * mean, 0))
+
+
+def stream_mean_stacking(frames: FrameSource) -> np.ndarray:
+    """Stack a stream of frames using average (mean) stacking in a single pass."""
+    accumulator = MeanAccumulator()
+    for frame in frames():
+        accumulator.push(frame)
+    if accumulator.mean is None:
+        raise ValueError("No frames to stack")
+    return accumulator.mean.astype(np.float32)
+
+def stream_mean_stacking_with_clipping(frames: FrameSource, kappa: float = 3.0, iterations: int = 1) -> np.ndarray:
+    """Stack a stream of frames by clipping pixel values beyond (mean +/- kappa * sigma).
+
+    The first pass estimates the per-pixel mean and sigma; every further pass clips against
+    the current bounds and re-estimates them from the clipped values, so iterations > 1 gives
+    iterative kappa-sigma clipping. Only a few frames' worth of statistics are held in memory.
+    """
+    accumulator = MeanAccumulator()
+    for frame in frames():
+        accumulator.push(frame)
+    if accumulator.mean is None:
+        raise ValueError("No frames to stack")
+    mean, sigma = accumulator.mean, accumulator.std()
+
+    for _ in range(max(iterations, 1)):
+        clipped = ClippedMeanAccumulator(mean - kappa * sigma, mean + kappa * sigma)
+        for frame in frames():
+            clipped.push(frame)
+        mean, sigma = clipped.mean(), clipped.std()
+
+    return mean.astype(np.float32)
+
+
+def counts_dtype(count: int) -> np.dtype:
+    """Smallest unsigned type holding histogram counts of count frames."""
+    for dtype in (np.uint8, np.uint16):
+        if count <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint32)
+
+
+class HistogramAccumulator:
+    """Per-pixel 256-bin counting histograms of pushed uint8 frames.
+
+    Memory depends only on the frame shape, and the median, mean, sigma and both clipped means
+    are all read from the cumulative counts without revisiting the frames. Counts may use a
+    narrower dtype, such as counts_dtype of the number of frames that will be pushed.
+    """
+
+    def __init__(self, shape: tuple, moments: bool = True, dtype: np.dtype = np.uint32):
+        self.shape = tuple(shape)
+        size = int(np.prod(self.shape))
+        self.count = 0
+        self.counts = np.zeros((size, 256), dtype=dtype)
+        self.moments = moments
+        self.total = np.zeros(size, dtype=np.uint64) if moments else None
+        self.total_sq = np.zeros(size, dtype=np.uint64) if moments else None
+        self._offsets = np.arange(size, dtype=np.intp) * 256
+
+    def push(self, frame: np.ndarray) -> None:
+        """Add one uint8 frame to the histograms."""
+        if frame.dtype != np.uint8:
+            raise ValueError(f"Histogram stacking requires uint8 frames, got {frame.dtype}")
+        pixels = frame.reshape(-1)
+        self.counts.reshape(-1)[self._offsets + pixels] += 1
+        if self.moments:
+            self.total += pixels
+            self.total_sq += pixels.astype(np.uint32) ** 2
+        self.count += 1
+
+    def push_batch(self, frames: np.ndarray) -> None:
+        """Add a batch of uint8 frames at once by counting them pixel by pixel."""
+        if frames.dtype != np.uint8:
+            raise ValueError(f"Histogram stacking requires uint8 frames, got {frames.dtype}")
+        pixels = np.ascontiguousarray(frames.reshape(len(frames), -1).T)
+        counts = np.bincount((pixels + self._offsets[:, None]).reshape(-1), minlength=self.counts.size)
+        np.add(self.counts, counts.reshape(self.counts.shape), out=self.counts, casting="unsafe")
+        if self.moments:
+            self.total += pixels.sum(axis=1, dtype=np.uint64)
+            self.total_sq += (pixels.astype(np.uint32) ** 2).sum(axis=1, dtype=np.uint64)
+        self.count += len(frames)
+
+    def add_counts(self, counts: np.ndarray, count: int,
+                   total: Optional[np.ndarray] = None, total_sq: Optional[np.ndarray] = None) -> None:
+        """Add histograms and moments of count frames that were pushed to another accumulator."""
+        np.add(self.counts, counts.reshape(self.counts.shape), out=self.counts, casting="unsafe")
+        if self.moments:
+            self.total += total.reshape(-1)
+            self.total_sq += total_sq.reshape(-1)
+        self.count += count
+
+    def reduce(self, method: str, kappa: float = 3.0) -> np.ndarray:
+        """Compute the stacked values of the pushed frames with the given method."""
+        if self.count == 0:
+            raise ValueError("No frames to stack")
+        if method != "median" and not self.moments:
+            raise ValueError(f"Stacking method {method} requires an accumulator tracking moments")
+
+        if method == "mean":
+            return (self.total / self.count).reshape(self.shape).astype(np.float32)
+
+        cumulative = np.cumsum(self.counts, axis=1, dtype=np.uint32)
+
+        def value_at_rank(rank: int) -> np.ndarray:
+            return np.argmax(cumulative > rank, axis=1)
+
+        lower_rank, upper_rank = (self.count - 1) // 2, self.count // 2
+        median = value_at_rank(lower_rank).astype(np.float64)
+        if upper_rank != lower_rank:
+            median = (median + value_at_rank(upper_rank)) / 2.0
+        if method == "median":
+            return median.reshape(self.shape).astype(np.float32)
+
+        mean = self.total / self.count
+        sigma = np.sqrt(np.maximum(self.total_sq / self.count - mean * mean, 0))
+        lower_bound = mean - kappa * sigma
+        upper_bound = mean + kappa * sigma
+
+        # Integer values v with lower_bound <= v <= upper_bound are kept as they are.
+        first = np.clip(np.ceil(lower_bound), 0, 256).astype(np.intp)
+        last = np.clip(np.floor(upper_bound), -1, 255).astype(np.intp)
+        cumulative_sum = np.cumsum(self.counts * np.arange(256, dtype=np.uint32), axis=1, dtype=np.uint64)
+
+        def cumulative_at(table: np.ndarray, index: np.ndarray) -> np.ndarray:
+            gathered = np.take_along_axis(table, np.clip(index, 0, 255)[:, None], axis=1)[:, 0]
+            return np.where(index < 0, 0, gathered).astype(np.float64)
+
+        below = cumulative_at(cumulative, first - 1)
+        inside = cumulative_at(cumulative, last) - below
+        inside_sum = cumulative_at(cumulative_sum, last) - cumulative_at(cumulative_sum, first - 1)
+        above = self.count - below - inside
+
+        if method == "mean_with_clipping":
+            stacked = (inside_sum + lower_bound * below + upper_bound * above) / self.count
+        elif method == "mean_with_median_clipping":
+            stacked = (inside_sum + median * (below + above)) / self.count
+        else:
+            raise ValueError(f"Unknown stacking method: {method}")
+        return stacked.reshape(self.shape).astype(np.float32)
+
+
+def histogram_median(images: np.ndarray) -> np.ndarray:
+    """Exact median of a uint8 stack from a binary search over the cumulative histogram of each pixel.
+
+    Each of the eight probes counts, one frame at a time, the frames below a per-pixel candidate
+    value, so the stack is read nine times instead of being sorted, in a few bytes per pixel.
+    """
+    if images.dtype != np.uint8:
+        raise ValueError(f"Histogram stacking requires uint8 frames, got {images.dtype}")
+    count = len(images)
+    if count == 0:
+        raise ValueError("No frames to stack")
+    frames = images.reshape(count, -1)
+    lower_rank, upper_rank = (count - 1) // 2, count // 2
+    value = np.zeros(frames.shape[1], dtype=np.uint8)
+    probe = np.empty_like(value)
+    mask = np.empty(frames.shape[1], dtype=bool)
+    counts = np.empty(frames.shape[1], dtype=counts_dtype(count))
+
+    for bit in (128, 64, 32, 16, 8, 4, 2, 1):
+        np.bitwise_or(value, bit, out=probe)
+        counts.fill(0)
+        for frame in frames:
+            np.less(frame, probe, out=mask)
+            np.add(counts, mask.view(np.uint8), out=counts)
+        np.copyto(value, probe, where=counts <= lower_rank)
+
+    upper = value
+    if upper_rank != lower_rank:
+        # Subtracting value + 1 wraps the frames at or below value above all others, so the
+        # smallest difference gives the next value up.
+        np.add(value, 1, out=probe)
+        nearest = np.full_like(value, 255)
+        difference = np.empty_like(value)
+        counts.fill(0)
+        for frame in frames:
+            np.less(value, frame, out=mask)
+            np.add(counts, mask.view(np.uint8), out=counts)
+            np.minimum(nearest, np.subtract(frame, probe, out=difference), out=nearest)
+        upper = np.where(count - counts > upper_rank, value, nearest + probe)
+    return ((value.astype(np.float32) + upper) / 2).reshape(images.shape[1:])
+
+def histogram_image_stacking(images: np.ndarray, method: str, kappa: float = 3.0,
+                             strip_bins: int = 1 << 18, batch_size: int = 256) -> np.ndarray:
+    """Stack an in-memory uint8 stack exactly from per-pixel histograms.
+
+    The median goes to histogram_median. For other methods, row strips are kept small enough for
+    their histograms to stay in cache, and frames are counted in batches, so working memory is
+    bounded by strip_bins and batch_size.
+    """
+    if len(images) == 0:
+        raise ValueError("No frames to stack")
+    if method == "median":
+        return histogram_median(images)
+    stacked = np.empty(images.shape[1:], dtype=np.float32)
+    bins_per_row = int(np.prod(images.shape[2:])) * 256
+    rows_per_strip = max(1, strip_bins // bins_per_row)
+    for row in range(0, images.shape[1], rows_per_strip):
+        strip = images[:, row:row + rows_per_strip]
+        accumulator = HistogramAccumulator(strip.shape[1:])
+        for start in range(0, len(strip), batch_size):
+            accumulator.push_batch(strip[start:start + batch_size])
+        stacked[row:row + rows_per_strip] = accumulator.reduce(method, kappa)
+    return stacked
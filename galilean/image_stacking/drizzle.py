@@ -0,0 +1,70 @@
+from typing import Sequence, Tuple
+
+import cv2
+import numpy as np
+
+
+def subpixel_offsets(warp_matrices: np.ndarray) -> np.ndarray:
+    """Per-frame (dx, dy) remainders of translation warps after rounding them to whole pixels."""
+    translations = np.asarray(warp_matrices, dtype=np.float64).reshape(-1, 2, 3)[:, :, 2]
+    return translations - np.rint(translations)
+
+def drop_weights(offset: float, scale: int, pixfrac: float) -> Tuple[int, np.ndarray]:
+    """Overlap of the drop of input pixel 0 with output pixels along one axis.
+
+    The pixel lands at template position -offset, and its drop is pixfrac input pixels wide. Returns
+    the first output pixel it covers and the overlap lengths from there; every other input pixel i
+    covers the same lengths from scale * i further on.
+    """
+    center = (0.5 - offset) * scale
+    half = pixfrac * scale / 2
+    low, high = center - half, center + half
+    cells = np.arange(np.floor(low), np.ceil(high))
+    return int(cells[0]), np.clip(np.minimum(cells + 1, high) - np.maximum(cells, low), 0, None)
+
+def drizzle_stacking(
+    images: Sequence[np.ndarray],
+    offsets: np.ndarray,
+    scale: int = 2,
+    pixfrac: float = 0.7,
+) -> np.ndarray:
+    """Drizzle frames aligned to whole pixels onto a grid scale times finer.
+
+    Each input pixel is shrunk to a square drop pixfrac pixels wide, placed at its sub-pixel
+    position and added to the output pixels it overlaps, weighted by the overlap area; the result
+    is the weighted mean. With translation-only warps the overlaps are the same for every pixel
+    of a frame, so each frame is added with one strided slice per covered output offset. Output
+    pixels that no drop reached, possible with few frames and a small pixfrac, are filled from
+    the upscaled mean.
+    """
+    height, width = images[0].shape[:2]
+    pad = scale + 1
+    data = np.zeros((height * scale + 2 * pad, width * scale + 2 * pad) + images[0].shape[2:], dtype=np.float32)
+    weights = np.zeros(data.shape[:2], dtype=np.float32)
+    mean = np.zeros(images[0].shape, dtype=np.float64)
+
+    for image, (dx, dy) in zip(images, offsets):
+        x0, weights_x = drop_weights(dx, scale, pixfrac)
+        y0, weights_y = drop_weights(dy, scale, pixfrac)
+        pixels = image.astype(np.float32)
+        mean += pixels
+        for row, weight_y in enumerate(weights_y, pad + y0):
+            for column, weight_x in enumerate(weights_x, pad + x0):
+                weight = weight_y * weight_x
+                if weight == 0:
+                    continue
+                rows = slice(row, row + height * scale, scale)
+                columns = slice(column, column + width * scale, scale)
+                data[rows, columns] += weight * pixels
+                weights[rows, columns] += weight
+
+    data = data[pad:-pad, pad:-pad]
+    weights = weights[pad:-pad, pad:-pad]
+    if data.ndim == 3:
+        weights = weights[..., None]
+    stacked = np.divide(data, weights, out=np.zeros_like(data), where=weights > 0)
+    if not (weights > 0).all():
+        upscaled = cv2.resize((mean / len(images)).astype(np.float32), (width * scale, height * scale),
+                              interpolation=cv2.INTER_LINEAR)
+        stacked = np.where(weights > 0, stacked, upscaled.reshape(stacked.shape))
+    return stacked
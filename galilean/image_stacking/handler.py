@@ -1,17 +1,54 @@
+from functools import partial
+from typing import Optional, Union
+
 import numpy as np
 
-from image_stacking.utils import (mean_image_stacking,
-                                  mean_image_stacking_with_clipping,
-                                  mean_image_stacking_with_median_clipping,
-                                  median_image_stacking)
+from image_stacking.accumulators import (FrameSource, histogram_median,
+                                         stream_mean_stacking,
+                                         stream_mean_stacking_with_clipping)
+from image_stacking.drizzle import drizzle_stacking, subpixel_offsets
+from image_stacking.tiling import STACKING_FUNCTIONS, tiled_image_stacking
+from profiling.handler import profiled
+
+DRIZZLE = "drizzle"
+STACKING_METHODS = list(STACKING_FUNCTIONS) + [DRIZZLE]
 
 
-def image_stacking(images: np.ndarray, method: str = "mean_with_median_clipping") -> np.ndarray:
+@profiled("image_stacking", frames=lambda images, *args, **kwargs: 0 if callable(images) else len(images))
+def image_stacking(
+    images: Union[np.ndarray, FrameSource],
+    method: str = "mean_with_median_clipping",
+    max_memory: Optional[int] = None,
+    warp_matrices: Optional[np.ndarray] = None,
+    scale: int = 2,
+) -> np.ndarray:
     """Stack and perform superresolution on images using the specified method."""
-    method_map = {
-        "mean": mean_image_stacking,
-        "median": median_image_stacking,
-        "mean_with_clipping": mean_image_stacking_with_clipping,
-        "mean_with_median_clipping": mean_image_stacking_with_median_clipping
+    stream_method_map = {
+        "mean": stream_mean_stacking,
+        "mean_with_clipping": stream_mean_stacking_with_clipping,
     }
-    return method_map.get(method)(images)
+
+    # Drizzle needs frames aligned to whole pixels and their warp matrices.
+    if method == DRIZZLE:
+        if warp_matrices is None:
+            raise ValueError("Drizzle stacking requires the warp matrices of the frames")
+        if callable(images):
+            images = list(images())
+        return drizzle_stacking(images, subpixel_offsets(warp_matrices), scale)
+    # Tiles stacked with the reference functions give the same bits within max_memory bytes.
+    if max_memory is not None and not callable(images):
+        return tiled_image_stacking(images, [method], max_memory)[0]
+    # Images may also be a callable returning a fresh iterator of frames, which mean-based methods
+    # consume one at a time, as they do for memory-mapped stacks that may be larger than RAM.
+    if isinstance(images, np.memmap) and method in stream_method_map:
+        images = partial(iter, images)
+    if callable(images):
+        if method in stream_method_map:
+            return stream_method_map[method](images)
+        images = list(images())
+
+    images = np.asarray(images)
+    # Per-pixel histograms give the exact median of uint8 frames faster than the reference function.
+    if method == "median" and images.dtype == np.uint8:
+        return histogram_median(images)
+    return STACKING_FUNCTIONS.get(method)(images)
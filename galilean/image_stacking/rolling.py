@@ -0,0 +1,114 @@
+from typing import Iterator, Sequence, Tuple
+
+import numpy as np
+
+from image_stacking.accumulators import HistogramAccumulator, counts_dtype
+from image_stacking.tiling import STACKING_FUNCTIONS
+
+ROLLING_METHODS = list(STACKING_FUNCTIONS)
+
+
+def window_starts(frame_count: int, window: int, step: int) -> range:
+    """First frame of every window of window frames advancing by step; a short capture gives one window."""
+    return range(0, max(frame_count - window, 0) + 1, step)
+
+
+class RollingStack:
+    """Per-pixel sums and histograms of a sliding window of uint8 frames.
+
+    Frames entering the window are added and frames leaving it removed, so advancing the window
+    by S frames costs S frame updates whatever its length, and reading a stack costs the same
+    for every window. Histograms take 256 counters per pixel, sized for window frames.
+    """
+
+    def __init__(self, shape: tuple, method: str, window: int, kappa: float = 3.0, strip_bins: int = 1 << 18):
+        if method not in ROLLING_METHODS:
+            raise ValueError(f"Rolling stacking supports {', '.join(ROLLING_METHODS)}, not {method}")
+        self.shape = tuple(shape)
+        self.method = method
+        self.kappa = kappa
+        self.count = 0
+        size = int(np.prod(self.shape))
+        self.total = np.zeros(size, dtype=np.uint64)
+        self.total_sq = np.zeros(size, dtype=np.uint64)
+        self.counts = np.zeros((size, 256), dtype=counts_dtype(window)) if method != "mean" else None
+        self._offsets = np.arange(size, dtype=np.intp) * 256
+        self._rows_per_strip = max(1, strip_bins // (int(np.prod(self.shape[1:])) * 256))
+
+    def _update(self, frame: np.ndarray, sign: int) -> None:
+        if frame.dtype != np.uint8:
+            raise ValueError(f"Rolling stacking requires uint8 frames, got {frame.dtype}")
+        pixels = frame.reshape(-1)
+        squares = pixels.astype(np.uint32) ** 2
+        # Bins of one frame are distinct, so the buffered fancy-index updates count each once.
+        bins = self._offsets + pixels if self.counts is not None else None
+        if sign > 0:
+            self.total += pixels
+            self.total_sq += squares
+            if bins is not None:
+                self.counts.reshape(-1)[bins] += 1
+        else:
+            self.total -= pixels
+            self.total_sq -= squares
+            if bins is not None:
+                self.counts.reshape(-1)[bins] -= 1
+        self.count += sign
+
+    def add(self, frame: np.ndarray) -> None:
+        """Add a frame entering the window."""
+        self._update(frame, 1)
+
+    def remove(self, frame: np.ndarray) -> None:
+        """Remove a frame leaving the window; it must have been added before."""
+        self._update(frame, -1)
+
+    def reduce(self) -> np.ndarray:
+        """Stack of the frames currently in the window, reduced one row strip at a time."""
+        if self.count == 0:
+            raise ValueError("No frames to stack")
+        if self.counts is None:
+            return (self.total / self.count).reshape(self.shape).astype(np.float32)
+
+        stacked = np.empty(self.shape, dtype=np.float32)
+        row_size = int(np.prod(self.shape[1:]))
+        for row in range(0, self.shape[0], self._rows_per_strip):
+            rows = stacked[row:row + self._rows_per_strip]
+            pixels = slice(row * row_size, row * row_size + rows.size)
+            accumulator = HistogramAccumulator(rows.shape)
+            accumulator.add_counts(self.counts[pixels], self.count, self.total[pixels], self.total_sq[pixels])
+            rows[...] = accumulator.reduce(self.method, self.kappa)
+        return stacked
+
+
+def rolling_stacks(
+    frames: Sequence[np.ndarray],
+    frame_indices: Sequence[int],
+    frame_count: int,
+    method: str,
+    window: int,
+    step: int,
+    kappa: float = 3.0,
+) -> Iterator[Tuple[int, int, np.ndarray]]:
+    """Stack every window of the capture, yielding its first frame, frame count and stacked image.
+
+    frames are the aligned frames kept from the capture and frame_indices their ascending
+    capture positions, so windows span capture time even when rejected frames leave gaps.
+    Windows without kept frames are skipped.
+    """
+    if window < 1 or step < 1:
+        raise ValueError("Window and step must be at least one frame")
+    if not len(frames):
+        raise ValueError("No frames to stack")
+    stack = RollingStack(frames[0].shape, method, window, kappa)
+    first = last = 0
+    for start in window_starts(frame_count, window, step):
+        while first < len(frames) and frame_indices[first] < start:
+            if first < last:
+                stack.remove(frames[first])
+            first += 1
+        last = max(last, first)
+        while last < len(frames) and frame_indices[last] < start + window:
+            stack.add(frames[last])
+            last += 1
+        if stack.count:
+            yield start, stack.count, stack.reduce()
@@ -0,0 +1,73 @@
+from typing import Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from image_stacking.utils import (mean_image_stacking,
+                                  mean_image_stacking_with_clipping,
+                                  mean_image_stacking_with_median_clipping,
+                                  median_image_stacking)
+
+STACKING_FUNCTIONS = {
+    "mean": mean_image_stacking,
+    "median": median_image_stacking,
+    "mean_with_clipping": mean_image_stacking_with_clipping,
+    "mean_with_median_clipping": mean_image_stacking_with_median_clipping,
+}
+
+# Peak temporary bytes per input value of each stacking function on uint8 frames, measured
+# with tracemalloc: float32 copies, float64 mean/std/clip intermediates and median partitions.
+STACKING_BYTES_PER_VALUE = {
+    "mean": 4,
+    "median": 9,
+    "mean_with_clipping": 13,
+    "mean_with_median_clipping": 13,
+}
+
+
+def stacking_tiles(
+    shape: Tuple[int, ...],
+    bytes_per_value: int,
+    max_memory: int,
+) -> Iterator[Tuple[slice, slice]]:
+    """Split the image plane of an N x H x W (x C) stack into tiles whose stacking fits in max_memory.
+
+    Tiles are full-width row strips when at least one row fits, and pieces of a single row
+    otherwise; a single pixel column is the smallest tile.
+    """
+    count, height, width = shape[:3]
+    bytes_per_pixel = max(1, count * int(np.prod(shape[3:], dtype=np.int64)) * bytes_per_value)
+    pixels = max(1, max_memory // bytes_per_pixel)
+    if pixels >= width:
+        rows = pixels // width
+        for row in range(0, height, rows):
+            yield slice(row, row + rows), slice(0, width)
+    else:
+        for row in range(height):
+            for column in range(0, width, pixels):
+                yield slice(row, row + 1), slice(column, column + pixels)
+
+def _tile(images: Sequence[np.ndarray], rows: slice, columns: slice) -> np.ndarray:
+    if isinstance(images, np.ndarray):
+        return images[:, rows, columns]
+    return np.stack([image[rows, columns] for image in images])
+
+def tiled_image_stacking(
+    images: Sequence[np.ndarray],
+    methods: List[str],
+    max_memory: int,
+) -> List[np.ndarray]:
+    """Stack images with several methods at once, one tile at a time, into preallocated outputs.
+
+    Every method is a per-pixel reduction over the frames, so stacking a tile gives the same
+    bits as stacking the whole stack and cropping. All methods run on a tile while it is in
+    memory, and a list of frames is never copied into one array.
+    """
+    first = images[0]
+    shape = (len(images),) + first.shape
+    bytes_per_value = max(STACKING_BYTES_PER_VALUE[method] for method in methods) + first.itemsize
+    stacked = [np.empty(first.shape, dtype=np.float32) for _ in methods]
+    for rows, columns in stacking_tiles(shape, bytes_per_value, max_memory):
+        tile = _tile(images, rows, columns)
+        for output, method in zip(stacked, methods):
+            output[rows, columns] = STACKING_FUNCTIONS[method](tile)
+    return stacked
@@ -1,30 +1,48 @@
+import asyncio
 import os
+import time
 from datetime import datetime
-from typing import List, Tuple
+from typing import Callable, Dict, List, Optional, TypeVar
 
-import cv2
 import numpy as np
 import typer
 from rich.console import Console
 from rich.panel import Panel
-from rich.progress import Progress, SpinnerColumn, TextColumn
+from rich.progress import (BarColumn, MofNCompleteColumn, Progress,
+                           ProgressColumn, SpinnerColumn, Task, TextColumn,
+                           TimeRemainingColumn)
 from rich.prompt import Prompt
 from rich.table import Table
-
-from detect_and_crop.handler import detect_and_crop
-from evaluate_and_align.handler import evaluate_and_align
-from image_stacking.handler import image_stacking
-from postprocessing.handler import postprocessing
+from rich.text import Text
+
+from evaluate_and_align.aligners import ALIGNERS
+from image_stacking.handler import DRIZZLE, STACKING_METHODS, image_stacking
+from image_stacking.rolling import ROLLING_METHODS
+from pipeline.handler import (Pipeline, crop_and_align, run_batch, run_rolling,
+                              run_sweep)
+from pipeline.planning import MemoryPlan, plan_memory, plan_shard_memory
+from pipeline.utils import (CROP_SIZES, BatchJob, PipelineOptions,
+                            format_size, load_job_file, parse_size,
+                            postprocessing_scale, resolve_crop_size,
+                            save_image, validate_job, write_manifest)
+from postprocessing.handler import postprocessing, prepare_wavelets
+from postprocessing.wavelets import WaveletSharpener, scale_gains
+from preview.handler import run_preview
+from profiling.handler import start_profiling, stop_profiling
+from profiling.utils import write_trace
+from server.handler import JobServer
+from sharding.handler import (init_sharded_job, pending_shards, reduce_shards,
+                              run_shards, shard_frame_counts)
+from sharding.utils import load_job
+from video_reader.raw import RAW_EXTENSIONS
+from video_reader.utils import VideoInfo, probe_video
 
 app = typer.Typer(help="Galilean - Planetary Image Processing CLI Tool")
+shard_app = typer.Typer(help="Sharded map-reduce stacking across processes or machines sharing a filesystem")
+app.add_typer(shard_app, name="shard")
 console = Console()
 
-def get_video_resolution(video_path: str) -> Tuple[int, int]:
-    cap = cv2.VideoCapture(video_path)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    cap.release()
-    return width, height
+T = TypeVar("T")
 
 def list_video_files(directory: str = "source") -> List[str]:
     if not os.path.exists(directory):
@@ -33,11 +51,14 @@ def list_video_files(directory: str = "source") -> List[str]:
 
     video_files = []
     for file in os.listdir(directory):
-        if file.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
+        if file.lower().endswith(('.mp4', '.avi', '.mov', '.mkv') + RAW_EXTENSIONS):
             video_files.append(os.path.join(directory, file))
     return video_files
 
-def select_videos(video_files: List[str]) -> List[str]:
+def probe_videos(video_files: List[str]) -> Dict[str, VideoInfo]:
+    return {file: probe_video(file) for file in video_files}
+
+def select_videos(video_files: List[str], infos: Dict[str, VideoInfo]) -> List[str]:
     if not video_files:
         console.print("[red]No video files found in the 'source' directory![/red]")
         raise typer.Exit(1)
@@ -48,8 +69,8 @@ def select_videos(video_files: List[str]) -> List[str]:
     table.add_column("Resolution", style="yellow")
 
     for idx, file in enumerate(video_files, 1):
-        width, height = get_video_resolution(file)
-        table.add_row(str(idx), os.path.basename(file), f"{width}x{height}")
+        info = infos[file]
+        table.add_row(str(idx), os.path.basename(file), f"{info.width}x{info.height}")
 
     console.print(table)
 
@@ -66,8 +87,7 @@ def select_videos(video_files: List[str]) -> List[str]:
             console.print("[red]Please enter valid numbers![/red]")
 
 def get_crop_size(max_dimension: int) -> int:
-    available_sizes = [360, 480, 720, 1080]
-    valid_sizes = [size for size in available_sizes if size <= max_dimension]
+    valid_sizes = [size for size in CROP_SIZES if size <= max_dimension]
 
     if not valid_sizes:
         console.print("[red]Error: Video resolution too small for available crop sizes[/red]")
@@ -101,12 +121,7 @@ def get_quality_threshold() -> float:
     return qualities[choice]
 
 def get_stacking_method() -> str:
-    methods = {
-        "1": "mean",
-        "2": "median",
-        "3": "mean_with_clipping",
-        "4": "mean_with_median_clipping"
-    }
+    methods = {str(i): method for i, method in enumerate(STACKING_METHODS, 1)}
 
     console.print(Panel("Stacking methods:", style="cyan"))
     for key, value in methods.items():
@@ -130,17 +145,16 @@ def get_sharpening_factor() -> float:
     choice = Prompt.ask("Select sharpening level", choices=list(factors.keys()))
     return factors[choice]
 
-def get_scaling_factor() -> int:
-    console.print(Panel("[yellow]⚠️ Warning: Super resolution is done using AI and may take longer to process[/yellow]", 
-                        style="yellow"))
+def get_scaling_factor(stacking_method: str) -> int:
+    if stacking_method == DRIZZLE:
+        console.print(Panel("Drizzle stacking upscales from the sub-pixel shifts between frames", style="cyan"))
+    else:
+        console.print(Panel("[yellow]⚠️ Warning: Super resolution is done using AI and may take longer to process[/yellow]",
+                            style="yellow"))
     choice = Prompt.ask("Select scaling factor", choices=["None", "2", "3"], default="None")
     return 1 if choice == "None" else int(choice)
 
-@app.command()
-def main():
-    """
-    Galilean - Video Stacking and Processing Tool
-    """
+def print_banner() -> None:
     console.print(
         """
         [cyan]
@@ -154,55 +168,217 @@ def main():
         """
     )
 
+class FpsColumn(ProgressColumn):
+    """Live processing rate of a task, in frames per second."""
+
+    def render(self, task: Task) -> Text:
+        if task.speed is None:
+            return Text("", style="progress.data.speed")
+        return Text(f"{task.speed:.1f} fps", style="progress.data.speed")
+
+def create_progress() -> Progress:
+    return Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        FpsColumn(),
+        TimeRemainingColumn(),
+        transient=True,
+    )
+
+def finish_profiling(path: str) -> None:
+    profiler = stop_profiling()
+    if profiler is None:
+        return
+    write_trace(path, profiler)
+
+    timings = Table(title="Stage Timings")
+    for column in ["Stage", "Calls", "Wall (s)", "CPU (s)", "Frames", "Frames/s", "Max RSS (MiB)"]:
+        timings.add_column(column, style="cyan" if column == "Stage" else "green")
+    for stage in profiler.summary():
+        timings.add_row(
+            stage["name"],
+            str(stage["calls"]),
+            f"{stage['wall']:.3f}",
+            f"{stage['cpu']:.3f}",
+            str(stage["frames"]),
+            f"{stage['fps']:.1f}" if stage["fps"] else "-",
+            f"{stage['max_rss_mb']:.0f}",
+        )
+    console.print(timings)
+    console.print(f"Profile: {path}")
+
+def tune_wavelets(sharpener: WaveletSharpener, output_dir: str, prefix: str) -> None:
+    """Let the user try wavelet gains on the cached decomposition, saving each result."""
+    console.print(Panel(f"Wavelet re-tuning: enter up to {sharpener.levels} layer gains, finest first", style="cyan"))
+    while True:
+        try:
+            value = Prompt.ask("Wavelet gains (empty to finish)", default="", show_default=False)
+        except EOFError:
+            return
+        if not value.strip():
+            return
+        try:
+            gains = [float(item) for item in value.split(",") if item.strip()]
+        except ValueError:
+            console.print(f"[red]Error:[/red] Invalid gains: '{value}'")
+            continue
+        started = time.perf_counter()
+        image = sharpener.sharpen(gains)
+        elapsed = time.perf_counter() - started
+        label = "_".join(f"{gain:g}" for gain in gains)
+        path = os.path.join(output_dir, f"{prefix}_wavelets_{label}_postprocessed_image.tiff")
+        save_image(path, image)
+        console.print(f"Recombined in {elapsed * 1000:.0f} ms: {path}")
+
+def run_preview_loop(selected_files: List[str], crop_size: int, output_dir: str, options: PipelineOptions) -> None:
+    """Refine the preview image until the sample is complete, reporting each refinement."""
+    update = None
+    for update in run_preview(selected_files, crop_size, output_dir, wavelet_gains=options.wavelet_gains):
+        console.print(
+            f"[cyan]{update.elapsed:6.1f}s[/cyan] preview of {update.stacked} sharpest frames "
+            f"of {update.sampled} sampled / {update.frame_count} → {update.path}"
+        )
+    if update is None:
+        console.print("[red]Error:[/red] No object detected in the sampled frames")
+        raise typer.Exit(1)
+    console.print("\n[green]✓ Preview complete![/green]")
+
+def plan_run(options: PipelineOptions, infos: Dict[str, VideoInfo], selected_files: List[str], crop_size: int,
+             threshold: float, methods: List[str], scaling_factor: int,
+             window: Optional[int] = None) -> PipelineOptions:
+    """Fit the options to the --max-memory budget and print the plan, or exit if the run cannot fit."""
+    if options.max_memory is None:
+        return options
+    first = infos[selected_files[0]]
+    try:
+        plan = plan_memory(
+            options, sum(infos[f].frame_count for f in selected_files), (first.width, first.height),
+            crop_size, threshold, methods, scaling_factor, window,
+        )
+    except ValueError as error:
+        console.print(f"[red]Error:[/red] {error}")
+        raise typer.Exit(1)
+    return print_plan(plan)
+
+def print_plan(plan: MemoryPlan) -> PipelineOptions:
+    """Print the stages and changes of a memory plan and return its options."""
+    table = Table(title=f"Memory Plan ({format_size(plan.budget)} budget)")
+    table.add_column("Stage", style="cyan")
+    table.add_column("Estimated Peak", style="green")
+    table.add_column("Detail", style="yellow")
+    for stage in plan.stages:
+        table.add_row(stage.name, format_size(stage.peak), stage.detail)
+    console.print(table)
+    for change in plan.changes:
+        console.print(f"[yellow]Adjusted:[/yellow] {change}")
+    return plan.options
+
+def parse_list(value: str, cast: Callable[[str], T], name: str) -> List[T]:
+    try:
+        items = [cast(item.strip()) for item in value.split(",") if item.strip()]
+    except ValueError:
+        items = []
+    if not items:
+        console.print(f"[red]Error:[/red] Invalid value for {name}: '{value}'")
+        raise typer.Exit(1)
+    return items
+
+@app.callback(invoke_without_command=True)
+def main(
+    ctx: typer.Context,
+    workers: int = typer.Option(1, "--workers", "-w", min=1, help="Number of worker processes for cropping, scoring and alignment"),
+    two_pass: bool = typer.Option(False, "--two-pass", help="Score frames while streaming and re-decode only the selected ones"),
+    align: str = typer.Option("ecc", "--align", help="Alignment method: fft, pyramid-ecc, local or ecc"),
+    prefilter: float = typer.Option(1.0, "--prefilter", min=0.0, max=1.0, help="Fraction of frames kept by a cheap proxy score before full scoring"),
+    frame_store: Optional[str] = typer.Option(None, "--frame-store", help="Directory for memory-mapped cropped and aligned frames reused across runs"),
+    sr_tile_size: int = typer.Option(256, "--sr-tile-size", min=0, help="Tile size for super resolution inference (0 disables tiling)"),
+    sr_threads: Optional[int] = typer.Option(None, "--sr-threads", min=1, help="Number of OpenCV threads used for super resolution"),
+    prefetch: int = typer.Option(8, "--prefetch", min=0, help="Number of frames decoded ahead on background threads (0 decodes inline)"),
+    track: bool = typer.Option(False, "--track/--no-track", help="Track the object between frames instead of detecting it on every full frame; faster on large frames, but crops may shift by a few pixels when isolated details appear away from the object"),
+    wavelets: Optional[str] = typer.Option(None, "--wavelets", help="Comma-separated wavelet layer gains, finest first, e.g. 1.8,1.4,1.1; replaces Laplacian sharpening"),
+    max_memory: Optional[str] = typer.Option(None, "--max-memory", help="Memory budget for the run, such as 4G; workers, prefetching, two-pass scoring, keeping aligned frames in a frame store, and stacking and super resolution tiles are planned to stay within it"),
+    preview: bool = typer.Option(False, "--preview", help="Write a quick reduced-resolution preview to out/preview.png, refined as more frames are sampled"),
+    profile: Optional[str] = typer.Option(None, "--profile", help="Write per-stage timings to this file as a Chrome trace (chrome://tracing, Perfetto)"),
+):
+    """
+    Galilean - Video Stacking and Processing Tool
+    """
+    print_banner()
+
+    if align not in ALIGNERS:
+        console.print(f"[red]Error:[/red] Unknown alignment method '{align}'. Choose from: {', '.join(ALIGNERS)}")
+        raise typer.Exit(1)
+    try:
+        max_memory_bytes = parse_size(max_memory) if max_memory else None
+    except ValueError as error:
+        console.print(f"[red]Error:[/red] {error}")
+        raise typer.Exit(1)
+
+    ctx.obj = PipelineOptions(
+        workers=workers,
+        two_pass=two_pass,
+        align=align,
+        prefilter=prefilter,
+        frame_store=frame_store,
+        sr_tile_size=sr_tile_size or None,
+        sr_threads=sr_threads,
+        prefetch=prefetch,
+        tracking=track,
+        max_memory=max_memory_bytes,
+        wavelet_gains=parse_list(wavelets, float, "--wavelets") if wavelets else None,
+    )
+    if profile:
+        start_profiling()
+        ctx.call_on_close(lambda: finish_profiling(profile))
+    if ctx.invoked_subcommand is not None:
+        return
+    options = ctx.obj
+
     video_files = list_video_files()
-    selected_files = select_videos(video_files)
+    infos = probe_videos(video_files)
+    selected_files = select_videos(video_files, infos)
 
-    min_height = min(get_video_resolution(f)[1] for f in selected_files)
+    min_height = min(infos[f].height for f in selected_files)
     crop_size = get_crop_size(min_height)
 
-    threshold = get_quality_threshold()
-    stacking_method = get_stacking_method()
-    sharpening_factor = get_sharpening_factor()
-    scaling_factor = get_scaling_factor()
-
-    images = []
-    framerate = None
     output_dir = "out"
     os.makedirs(output_dir, exist_ok=True)
+    if preview:
+        run_preview_loop(selected_files, crop_size, output_dir, options)
+        return
 
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        transient=True,
-    ) as progress:
-        task = progress.add_task("Loading videos...", total=len(selected_files))
-        for file in selected_files:
-            cap = cv2.VideoCapture(file)
-            if not framerate:
-                framerate = int(cap.get(cv2.CAP_PROP_FPS))
-
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                images.append(frame)
-            cap.release()
-            progress.advance(task)
-
-        task = progress.add_task("Processing images...", total=len(images))
-        cropped_images = np.array([detect_and_crop(image, crop_size) for image in images])
-        progress.advance(task)
+    threshold = get_quality_threshold()
+    stacking_method = get_stacking_method()
+    sharpening_factor = get_sharpening_factor()
+    scaling_factor = get_scaling_factor(stacking_method)
+    frame_count = sum(infos[f].frame_count for f in selected_files)
+    options = plan_run(options, infos, selected_files, crop_size, threshold, [stacking_method], scaling_factor)
 
-        task = progress.add_task("Aligning images...")
-        aligned_images, best_index, best_score, avg_quality = evaluate_and_align(cropped_images, threshold)
-        progress.advance(task)
+    with create_progress() as progress:
+        result = crop_and_align(
+            selected_files, crop_size, threshold, options, progress, frame_count, stacking_method == DRIZZLE
+        )
 
         task = progress.add_task("Stacking images...")
-        stacked_image = image_stacking(aligned_images, stacking_method)
+        stacked_image = image_stacking(
+            result.aligned_images, stacking_method, options.stacking_memory, result.warp_matrices, scaling_factor
+        )
         progress.advance(task)
 
         task = progress.add_task("Post-processing...")
-        postprocessed_image = postprocessing(stacked_image, sharpening_factor, scaling_factor)
+        postprocessing_factor = postprocessing_scale(stacking_method, scaling_factor)
+        sharpener = None
+        if options.wavelet_gains is not None:
+            sharpener = prepare_wavelets(
+                stacked_image, len(options.wavelet_gains), postprocessing_factor, options.sr_tile_size, options.sr_threads
+            )
+            postprocessed_image = sharpener.sharpen(scale_gains(options.wavelet_gains, sharpening_factor))
+        else:
+            postprocessed_image = postprocessing(
+                stacked_image, sharpening_factor, postprocessing_factor, options.sr_tile_size, options.sr_threads
+            )
         progress.advance(task)
 
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -211,21 +387,359 @@ def main():
 
     with Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}")) as progress:
         task = progress.add_task("Saving outputs...")        
-        cv2.imwrite(stacked_image_output, stacked_image.astype('uint8'))
-        cv2.imwrite(postprocessed_image_output, postprocessed_image.astype('uint8'))
+        save_image(stacked_image_output, stacked_image)
+        save_image(postprocessed_image_output, postprocessed_image)
 
     console.print("\n[green]✓ Processing complete![/green]")
     results = Table(title="Processing Results")
     results.add_column("Metric", style="cyan")
     results.add_column("Value", style="green")
 
-    results.add_row("Best Frame Index", str(best_index))
-    results.add_row("Best Frame Score", f"{best_score:.3f}")
-    results.add_row("Average Quality", f"{avg_quality:.3f}")
+    results.add_row("Best Frame Index", str(result.best_index))
+    results.add_row("Best Frame Score", f"{result.best_score:.3f}")
+    results.add_row("Average Quality", f"{result.avg_quality:.3f}")
+    if len(result.residuals):
+        residuals = result.residuals
+        results.add_row("Alignment Residual (mean / max)", f"{np.mean(residuals):.4f} / {np.max(residuals):.4f}")
     results.add_row("Output Directory", output_dir)
 
     console.print(results)
 
+    if sharpener is not None:
+        tune_wavelets(sharpener, output_dir, timestamp)
+
+@app.command()
+def sweep(
+    ctx: typer.Context,
+    thresholds: str = typer.Option("0.8,0.9,0.95", "--thresholds", help="Comma-separated quality thresholds, e.g. 0.8,0.9,0.99"),
+    methods: str = typer.Option("mean,median", "--methods", help=f"Comma-separated stacking methods from: {', '.join(STACKING_METHODS)}"),
+    sharpening: str = typer.Option("1.2", "--sharpening", help="Comma-separated sharpening factors, e.g. 1.0,1.2,1.5"),
+    scale: int = typer.Option(1, "--scale", min=1, max=3, help="Super resolution scaling factor (1 disables it)"),
+):
+    """
+    Stack one capture with every combination of thresholds, stacking methods and sharpening factors
+    """
+    options: PipelineOptions = ctx.obj
+    threshold_values = parse_list(thresholds, float, "--thresholds")
+    method_names = parse_list(methods, str, "--methods")
+    sharpening_factors = parse_list(sharpening, float, "--sharpening")
+
+    if not all(0.0 < threshold <= 1.0 for threshold in threshold_values):
+        console.print("[red]Error:[/red] Quality thresholds must be in (0, 1]")
+        raise typer.Exit(1)
+    unknown = [method for method in method_names if method not in STACKING_METHODS]
+    if unknown:
+        console.print(f"[red]Error:[/red] Unknown stacking method '{unknown[0]}'. Choose from: {', '.join(STACKING_METHODS)}")
+        raise typer.Exit(1)
+
+    video_files = list_video_files()
+    infos = probe_videos(video_files)
+    selected_files = select_videos(video_files, infos)
+
+    min_height = min(infos[f].height for f in selected_files)
+    crop_size = get_crop_size(min_height)
+
+    options = plan_run(options, infos, selected_files, crop_size, max(threshold_values), method_names, scale)
+
+    output_dir = "out"
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    with create_progress() as progress:
+        outputs = run_sweep(
+            selected_files, crop_size, threshold_values, method_names, sharpening_factors, scale,
+            options, output_dir, timestamp, progress,
+        )
+
+    console.print("\n[green]✓ Sweep complete![/green]")
+    results = Table(title="Sweep Outputs")
+    results.add_column("File", style="green")
+    for output in outputs:
+        results.add_row(output)
+    console.print(results)
+
+@app.command()
+def rolling(
+    ctx: typer.Context,
+    window: int = typer.Option(..., "--window", "-n", min=1, help="Frames per stack"),
+    step: int = typer.Option(..., "--step", "-s", min=1, help="Frames each window advances by"),
+    threshold: float = typer.Option(0.9, "--threshold", min=0.0, max=1.0, help="Fraction of the best frames of the capture to stack"),
+    method: str = typer.Option("mean_with_median_clipping", "--method", help=f"Stacking method: {', '.join(ROLLING_METHODS)}"),
+    sharpening: float = typer.Option(1.2, "--sharpening", help="Sharpening factor"),
+    scale: int = typer.Option(1, "--scale", min=1, max=3, help="Super resolution scaling factor (1 disables it)"),
+    video_fps: Optional[float] = typer.Option(None, "--video-fps", min=0.1, help="Also write the stacks as a video at this frame rate"),
+):
+    """
+    Stack a sliding window of frames along one capture, one image per step, for rotation animations
+    """
+    options: PipelineOptions = ctx.obj
+    if method not in ROLLING_METHODS:
+        console.print(f"[red]Error:[/red] Unknown rolling stacking method '{method}'. Choose from: {', '.join(ROLLING_METHODS)}")
+        raise typer.Exit(1)
+
+    video_files = list_video_files()
+    infos = probe_videos(video_files)
+    selected_files = select_videos(video_files, infos)
+
+    min_height = min(infos[f].height for f in selected_files)
+    crop_size = get_crop_size(min_height)
+    options = plan_run(options, infos, selected_files, crop_size, threshold, [method], scale, window)
+
+    output_dir = "out"
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    with create_progress() as progress:
+        outputs = run_rolling(
+            selected_files, crop_size, threshold, method, window, step, sharpening, scale,
+            options, output_dir, timestamp, progress, video_fps,
+        )
+
+    console.print("\n[green]✓ Rolling stacks complete![/green]")
+    results = Table(title="Rolling Outputs")
+    results.add_column("File", style="green")
+    for output in outputs:
+        results.add_row(output)
+    console.print(results)
+
+@app.command()
+def batch(
+    ctx: typer.Context,
+    videos: Optional[List[str]] = typer.Argument(None, help="Videos to process, one job per video"),
+    job_file: Optional[str] = typer.Option(None, "--job-file", "-j", help="JSON or YAML file listing the jobs to run"),
+    crop_size: Optional[int] = typer.Option(None, "--crop-size", help="Crop size in pixels (default: largest that fits)"),
+    threshold: float = typer.Option(0.9, "--threshold", min=0.0, max=1.0, help="Fraction of the best frames to stack"),
+    method: str = typer.Option("mean_with_median_clipping", "--method", help=f"Stacking method: {', '.join(STACKING_METHODS)}"),
+    sharpening: float = typer.Option(1.2, "--sharpening", help="Sharpening factor"),
+    scale: int = typer.Option(1, "--scale", min=1, max=3, help="Super resolution scaling factor (1 disables it)"),
+    jobs: int = typer.Option(1, "--jobs", min=1, help="Number of videos processed concurrently, sharing the --workers processes between them"),
+    output_dir: str = typer.Option("out", "--output-dir", "-o", help="Directory for the images and the results manifest"),
+):
+    """
+    Process videos without prompts and write a JSON results manifest next to the images
+    """
+    options: PipelineOptions = ctx.obj
+    defaults = dict(crop_size=crop_size, threshold=threshold, method=method, sharpening=sharpening, scale=scale)
+    try:
+        job_list = load_job_file(job_file, defaults) if job_file else []
+        job_list += [validate_job(BatchJob(videos=[video], **defaults)) for video in videos or []]
+    except (OSError, ValueError) as error:
+        console.print(f"[red]Error:[/red] {error}")
+        raise typer.Exit(1)
+    if not job_list:
+        console.print("[red]Error:[/red] No jobs given. Pass videos or --job-file.")
+        raise typer.Exit(1)
+
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    with create_progress() as progress:
+        task = progress.add_task("Processing videos...", total=len(job_list))
+        entries = run_batch(
+            job_list, options, output_dir, timestamp, jobs,
+            on_result=lambda index, entry: progress.advance(task),
+        )
+
+    manifest_output = os.path.join(output_dir, f"{timestamp}_manifest.json")
+    write_manifest(manifest_output, entries, options)
+
+    results = Table(title="Batch Results")
+    results.add_column("Video", style="cyan")
+    results.add_column("Status", style="green")
+    results.add_column("Best Frame", style="yellow")
+    results.add_column("Time (s)", style="yellow")
+    for entry in entries:
+        status = "ok" if entry["status"] == "ok" else f"[red]{entry['error']}[/red]"
+        best = f"{entry['best_index']} ({entry['best_score']:.3f})" if entry["status"] == "ok" else "-"
+        results.add_row(", ".join(map(os.path.basename, entry["videos"])), status, best, f"{entry['timings']['total']:.1f}")
+    console.print(results)
+    console.print(f"Manifest: {manifest_output}")
+
+    if any(entry["status"] != "ok" for entry in entries):
+        raise typer.Exit(1)
+
+@app.command()
+def serve(
+    ctx: typer.Context,
+    host: str = typer.Option("127.0.0.1", "--host", help="Address to listen on"),
+    port: int = typer.Option(8765, "--port", min=1, max=65535, help="TCP port to listen on"),
+    socket_path: Optional[str] = typer.Option(None, "--socket", help="Listen on this Unix socket instead of TCP"),
+    concurrency: int = typer.Option(1, "--concurrency", "-c", min=1, help="Number of jobs processed at once"),
+    warm_scales: str = typer.Option("2,3", "--warm-scales", help="Comma-separated super resolution scales loaded at startup (empty for none)"),
+    output_dir: str = typer.Option("out", "--output-dir", "-o", help="Default directory for job outputs"),
+):
+    """
+    Run a local job server that keeps models and workers warm between captures
+    """
+    options: PipelineOptions = ctx.obj
+    scales = parse_list(warm_scales, int, "--warm-scales") if warm_scales.strip() else []
+    with Pipeline(options, concurrency) as pipeline:
+        for scale, error in pipeline.warm(scales).items():
+            console.print(f"[yellow]Warning:[/yellow] Super resolution x{scale} not loaded: {error}")
+        server = JobServer(pipeline, output_dir, concurrency)
+        address = socket_path or f"http://{host}:{port}"
+        try:
+            asyncio.run(server.serve(
+                host, port, socket_path,
+                on_ready=lambda _: console.print(f"[green]Serving jobs on {address}[/green] (Ctrl+C to stop)"),
+            ))
+        except KeyboardInterrupt:
+            console.print("\n[yellow]Server stopped[/yellow]")
+        except OSError as error:
+            console.print(f"[red]Error:[/red] {error}")
+            raise typer.Exit(1)
+
+def plan_shards(
+    options: PipelineOptions,
+    work_dir: str,
+    steps: List[str],
+    scaling_factor: int = 1,
+) -> PipelineOptions:
+    """Fit the options of the given sharded steps to the --max-memory budget and print the plan, or exit."""
+    if options.max_memory is None:
+        return options
+    try:
+        job = load_job(work_dir)
+        first = probe_video(job.shards[0].video)
+        plan = plan_shard_memory(
+            options, shard_frame_counts(job), (first.width, first.height), job.crop_size, job.method,
+            scaling_factor, steps,
+        )
+    except (OSError, ValueError) as error:
+        console.print(f"[red]Error:[/red] {error}")
+        raise typer.Exit(1)
+    return print_plan(plan)
+
+def run_map_step(work_dir: str, stage: str, shards: Optional[List[int]], options: PipelineOptions, description: str) -> None:
+    try:
+        indices = shards or pending_shards(work_dir, stage)
+        kwargs = {"prefetch": options.prefetch} if stage == "stack" else {}
+        with create_progress() as progress:
+            task = progress.add_task(description, total=len(indices))
+            run_shards(work_dir, stage, indices, options.workers,
+                       on_done=lambda index, done: progress.advance(task), **kwargs)
+    except (OSError, ValueError) as error:
+        console.print(f"[red]Error:[/red] {error}")
+        raise typer.Exit(1)
+
+def reduce_and_save(work_dir: str, method: Optional[str], sharpening: float, scale: int,
+                    options: PipelineOptions, output_dir: str) -> None:
+    try:
+        stacked_image, summary = reduce_shards(work_dir, method)
+    except (OSError, ValueError) as error:
+        console.print(f"[red]Error:[/red] {error}")
+        raise typer.Exit(1)
+    postprocessed_image = postprocessing(
+        stacked_image, sharpening, scale, options.sr_tile_size, options.sr_threads, options.wavelet_gains
+    )
+
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    stacked_image_output = os.path.join(output_dir, f"{timestamp}_stacked_image.tiff")
+    postprocessed_image_output = os.path.join(output_dir, f"{timestamp}_postprocessed_image.tiff")
+    save_image(stacked_image_output, stacked_image)
+    save_image(postprocessed_image_output, postprocessed_image)
+
+    console.print("\n[green]✓ Reduce complete![/green]")
+    results = Table(title="Sharded Results")
+    results.add_column("Metric", style="cyan")
+    results.add_column("Value", style="green")
+    results.add_row("Shards", str(summary["shard_count"]))
+    results.add_row("Frames Stacked", f"{summary['stacked_count']} / {summary['frame_count']}")
+    results.add_row("Best Frame Index", str(summary["best_index"]))
+    results.add_row("Best Frame Score", f"{summary['best_score']:.3f}")
+    results.add_row("Average Quality", f"{summary['avg_quality']:.3f}")
+    residuals = summary["residuals"]
+    if len(residuals):
+        results.add_row("Alignment Residual (mean / max)", f"{np.mean(residuals):.4f} / {np.max(residuals):.4f}")
+    results.add_row("Output Directory", output_dir)
+    console.print(results)
+
+def init_shards(ctx: typer.Context, videos: List[str], work_dir: str, chunk_frames: Optional[int],
+                crop_size: Optional[int], threshold: float, method: str) -> None:
+    options: PipelineOptions = ctx.obj
+    if method not in STACKING_METHODS or method == DRIZZLE:
+        console.print(f"[red]Error:[/red] Sharded stacking does not support the stacking method '{method}'")
+        raise typer.Exit(1)
+    try:
+        crop_size = resolve_crop_size(crop_size, min(probe_video(video).height for video in videos))
+        job = init_sharded_job(work_dir, videos, crop_size, threshold, method, options.align, options.tracking,
+                               chunk_frames)
+    except (OSError, ValueError) as error:
+        console.print(f"[red]Error:[/red] {error}")
+        raise typer.Exit(1)
+    console.print(f"{len(job.shards)} shards of {len(videos)} videos in {work_dir}, crop size {crop_size}")
+
+work_dir_option = typer.Option("shards", "--work-dir", "-d", help="Directory shared by every worker for the manifest and partial results")
+shards_option = typer.Option(None, "--shard", help="Shard index to process; repeat for several (default: every pending shard)")
+
+@shard_app.command("init")
+def shard_init(
+    ctx: typer.Context,
+    videos: List[str] = typer.Argument(..., help="Videos of one capture"),
+    work_dir: str = work_dir_option,
+    chunk_frames: Optional[int] = typer.Option(None, "--chunk-frames", min=1, help="Split videos into shards of at most this many frames (default: one shard per video); later chunks are seeked to, falling back to decoding from the start where the container cannot seek exactly"),
+    crop_size: Optional[int] = typer.Option(None, "--crop-size", help="Crop size in pixels (default: largest that fits)"),
+    threshold: float = typer.Option(0.9, "--threshold", min=0.0, max=1.0, help="Fraction of the best frames to stack"),
+    method: str = typer.Option("mean_with_median_clipping", "--method", help="Stacking method; anything but mean also stores per-pixel histograms"),
+):
+    """
+    Split videos into shards and write the manifest shared by every worker
+    """
+    init_shards(ctx, videos, work_dir, chunk_frames, crop_size, threshold, method)
+
+@shard_app.command("score")
+def shard_score(ctx: typer.Context, work_dir: str = work_dir_option, shards: Optional[List[int]] = shards_option):
+    """
+    Map step one: crop and score the frames of shards
+    """
+    options = plan_shards(ctx.obj, work_dir, ["score"])
+    run_map_step(work_dir, "score", shards, options, "Scoring shards...")
+
+@shard_app.command("stack")
+def shard_stack(ctx: typer.Context, work_dir: str = work_dir_option, shards: Optional[List[int]] = shards_option):
+    """
+    Map step two: align the selected frames of shards to the global reference and save partial statistics
+    """
+    options = plan_shards(ctx.obj, work_dir, ["stack"])
+    run_map_step(work_dir, "stack", shards, options, "Stacking shards...")
+
+@shard_app.command("reduce")
+def shard_reduce(
+    ctx: typer.Context,
+    work_dir: str = work_dir_option,
+    method: Optional[str] = typer.Option(None, "--method", help="Stacking method (default: the one given to init)"),
+    sharpening: float = typer.Option(1.2, "--sharpening", help="Sharpening factor"),
+    scale: int = typer.Option(1, "--scale", min=1, max=3, help="Super resolution scaling factor (1 disables it)"),
+    output_dir: str = typer.Option("out", "--output-dir", "-o", help="Directory for the images"),
+):
+    """
+    Merge the partial statistics of every shard into the final stack
+    """
+    options = plan_shards(ctx.obj, work_dir, ["reduce"], scale)
+    reduce_and_save(work_dir, method, sharpening, scale, options, output_dir)
+
+@shard_app.command("run")
+def shard_run(
+    ctx: typer.Context,
+    videos: List[str] = typer.Argument(..., help="Videos of one capture"),
+    work_dir: str = work_dir_option,
+    chunk_frames: Optional[int] = typer.Option(None, "--chunk-frames", min=1, help="Split videos into shards of at most this many frames (default: one shard per video); later chunks are seeked to, falling back to decoding from the start where the container cannot seek exactly"),
+    crop_size: Optional[int] = typer.Option(None, "--crop-size", help="Crop size in pixels (default: largest that fits)"),
+    threshold: float = typer.Option(0.9, "--threshold", min=0.0, max=1.0, help="Fraction of the best frames to stack"),
+    method: str = typer.Option("mean_with_median_clipping", "--method", help="Stacking method"),
+    sharpening: float = typer.Option(1.2, "--sharpening", help="Sharpening factor"),
+    scale: int = typer.Option(1, "--scale", min=1, max=3, help="Super resolution scaling factor (1 disables it)"),
+    output_dir: str = typer.Option("out", "--output-dir", "-o", help="Directory for the images"),
+):
+    """
+    Run every sharded step locally, spreading shards over --workers processes
+    """
+    init_shards(ctx, videos, work_dir, chunk_frames, crop_size, threshold, method)
+    options = plan_shards(ctx.obj, work_dir, ["score", "stack", "reduce"], scale)
+    run_map_step(work_dir, "score", None, options, "Scoring shards...")
+    run_map_step(work_dir, "stack", None, options, "Stacking shards...")
+    reduce_and_save(work_dir, None, sharpening, scale, options, output_dir)
+
 if __name__ == "__main__":
     app()
-    
\ No newline at end of file
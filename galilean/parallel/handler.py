@@ -0,0 +1,294 @@
+from collections import deque
+from concurrent.futures import Executor
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from detect_and_crop.tracking import CentroidTracker
+from evaluate_and_align.handler import (AlignmentResult, rank_streamed_frames,
+                                        read_selected_crops)
+from evaluate_and_align.utils import rank_images, score_candidates, top_k_mask
+from parallel.utils import (SharedArray, align_task, crop_task, metrics_task,
+                            score_task, split_chunks)
+from profiling.handler import profiled, span
+from video_reader.handler import read_frames
+
+MAX_BATCHES_IN_FLIGHT = 2
+
+
+def _grow(shared: SharedArray, capacity: int) -> SharedArray:
+    """Move a shared frame buffer into a larger block, keeping its contents."""
+    grown = SharedArray((capacity,) + shared.shape[1:], shared.dtype)
+    grown.array[:shared.shape[0]] = shared.array
+    shared.release()
+    return grown
+
+def share_frames(images: np.ndarray) -> SharedArray:
+    """Copy a stack of frames into a shared buffer that workers can attach to."""
+    shared = SharedArray(images.shape, images.dtype)
+    shared.array[:] = images
+    return shared
+
+def parallel_detect_and_crop(
+    frames: Iterable[np.ndarray],
+    crop_size: int,
+    pool: Executor,
+    workers: int,
+    capacity: int = 0,
+    on_progress: Optional[Callable[[int], None]] = None,
+    tracking: bool = False,
+) -> Tuple[SharedArray, int]:
+    """Crop frames on a process pool, returning a shared buffer of cropped frames and the frame count.
+
+    Decoded frames are copied into shared slot buffers in batches, and the next batch is decoded
+    while workers crop the previous ones. With tracking, the object is tracked here in frame order,
+    so every frame after the first is found around the previous one, and workers crop around the
+    given centroids.
+    """
+    batch_size = workers * 2
+    tracker = CentroidTracker() if tracking else None
+    cropped: Optional[SharedArray] = None
+    buffer: Optional[SharedArray] = None
+    batch: List[Tuple[int, int, Optional[Tuple[int, int]]]] = []
+    spare: List[SharedArray] = []
+    in_flight = deque()
+    count = 0
+
+    def submit() -> None:
+        nonlocal buffer, batch
+        futures = [pool.submit(crop_task, buffer.spec, cropped.spec, items, crop_size)
+                   for items in split_chunks(batch, workers)]
+        in_flight.append((buffer, futures, len(batch)))
+        buffer, batch = None, []
+
+    def join_oldest() -> None:
+        done_buffer, futures, done = in_flight.popleft()
+        spare.append(done_buffer)
+        for future in futures:
+            future.result()
+        if on_progress is not None:
+            on_progress(done)
+
+    try:
+        for frame in frames:
+            if cropped is None:
+                size = min(crop_size, *frame.shape[:2])
+                cropped = SharedArray((max(capacity, batch_size), size, size) + frame.shape[2:])
+            if buffer is not None and buffer.shape[1:] != frame.shape:
+                submit()
+            if count >= cropped.shape[0]:
+                if batch:
+                    submit()
+                while in_flight:
+                    join_oldest()
+                cropped = _grow(cropped, cropped.shape[0] * 2)
+            if buffer is None:
+                while len(in_flight) >= MAX_BATCHES_IN_FLIGHT:
+                    join_oldest()
+                while spare and spare[-1].shape[1:] != frame.shape:
+                    spare.pop().release()
+                buffer = spare.pop() if spare else SharedArray((batch_size,) + frame.shape, frame.dtype)
+
+            buffer.array[len(batch)] = frame
+            batch.append((len(batch), count, None if tracker is None else tracker.update(frame)))
+            count += 1
+            if len(batch) == batch_size:
+                submit()
+
+        if batch:
+            submit()
+        while in_flight:
+            join_oldest()
+    finally:
+        for _, futures, _ in in_flight:
+            for future in futures:
+                future.cancel()
+        leftovers = spare + [entry[0] for entry in in_flight] + ([buffer] if buffer is not None else [])
+        for leftover in leftovers:
+            leftover.release()
+
+    if cropped is None:
+        raise ValueError("No frames were decoded from the selected videos")
+    return cropped, count
+
+@profiled("evaluate_and_align", frames=lambda images, count, *args, **kwargs: count)
+def parallel_evaluate_and_align(
+    images: SharedArray,
+    count: int,
+    pool: Executor,
+    workers: int,
+    threshold: float = 0.95,
+    method: str = "ecc",
+    prefilter: float = 1.0,
+    whole_pixels: bool = False,
+) -> AlignmentResult:
+    """Score and align the first count shared images on a process pool, matching evaluate_and_align."""
+    candidates = list(range(count))
+    prefilter = max(prefilter, threshold)
+    if prefilter < 1.0:
+        chunks = split_chunks(candidates, workers * 4)
+        proxy = np.concatenate(list(pool.map(metrics_task, [images.spec] * len(chunks), chunks, [True] * len(chunks))))
+        candidates = list(np.flatnonzero(top_k_mask(proxy, int(np.ceil(prefilter * count)))))
+
+    chunks = split_chunks(candidates, workers * 4)
+    metrics_array = np.concatenate(list(pool.map(metrics_task, [images.spec] * len(chunks), chunks)))
+    scores, avg_quality = score_candidates(metrics_array, np.array(candidates, dtype=int), count)
+    best_index, top_images_mask = rank_images(scores, threshold)
+
+    selected = np.flatnonzero(top_images_mask)
+    aligned_images, residuals, warp_matrices = align_on_pool(
+        images, best_index, selected, pool, workers, method, whole_pixels
+    )
+    return AlignmentResult(
+        aligned_images, best_index, scores[best_index], avg_quality, residuals, warp_matrices, scores, selected
+    )
+
+def align_on_pool(
+    images: SharedArray,
+    best_index: int,
+    selected: np.ndarray,
+    pool: Executor,
+    workers: int,
+    method: str = "ecc",
+    whole_pixels: bool = False,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Align the selected shared images to the one at best_index on a process pool.
+
+    Returns the aligned images, their residuals and their warp matrices.
+    """
+    template_gray = SharedArray(images.shape[1:3])
+    template_gray.array[:] = cv2.cvtColor(images.array[best_index], cv2.COLOR_BGR2GRAY)
+    aligned = SharedArray((len(selected),) + images.shape[1:], images.dtype)
+    try:
+        pairs = [(int(index), out_index) for out_index, index in enumerate(selected)]
+        chunks = split_chunks(pairs, workers * 4)
+        futures = [pool.submit(align_task, images.spec, template_gray.spec, aligned.spec, chunk, method,
+                               whole_pixels)
+                   for chunk in chunks]
+        results = [result for future in futures for result in future.result()]
+        aligned_images = aligned.array.copy()
+    finally:
+        template_gray.release()
+        aligned.release()
+    return (
+        aligned_images, np.array([residual for residual, _ in results]),
+        np.array([warp_matrix for _, warp_matrix in results]).reshape(-1, 2, 3),
+    )
+
+def parallel_score_frames(
+    frames: Iterable[np.ndarray],
+    crop_size: int,
+    pool: Executor,
+    workers: int,
+    proxy: bool = False,
+    on_progress: Optional[Callable[[int], None]] = None,
+    tracking: bool = False,
+) -> Tuple[List[Tuple[int, int]], np.ndarray, Optional[np.ndarray]]:
+    """Crop and score streamed frames on a process pool, keeping only their centroids and metrics.
+
+    Decoded frames are copied into shared slot buffers in batches as in parallel_detect_and_crop.
+    With tracking, the object is tracked here in frame order and workers crop around the given
+    centroids. Returns the same as score_streamed_frames.
+    """
+    batch_size = workers * 2
+    tracker = CentroidTracker() if tracking else None
+    buffer: Optional[SharedArray] = None
+    batch: List[Optional[Tuple[int, int]]] = []
+    spare: List[SharedArray] = []
+    in_flight = deque()
+    centroids: List[Tuple[int, int]] = []
+    metrics: List[np.ndarray] = []
+    proxies: List[np.ndarray] = []
+
+    def submit() -> None:
+        nonlocal buffer, batch
+        slots = split_chunks(list(range(len(batch))), workers)
+        futures = [pool.submit(score_task, buffer.spec, chunk, [batch[slot] for slot in chunk], crop_size, proxy)
+                   for chunk in slots]
+        in_flight.append((buffer, futures, len(batch)))
+        buffer, batch = None, []
+
+    def join_oldest() -> None:
+        done_buffer, futures, done = in_flight.popleft()
+        spare.append(done_buffer)
+        for future in futures:
+            chunk_centroids, chunk_metrics, chunk_proxy = future.result()
+            centroids.extend(chunk_centroids)
+            metrics.append(chunk_metrics)
+            if proxy:
+                proxies.append(chunk_proxy)
+        if on_progress is not None:
+            on_progress(done)
+
+    try:
+        for frame in frames:
+            if buffer is not None and buffer.shape[1:] != frame.shape:
+                submit()
+            if buffer is None:
+                while len(in_flight) >= MAX_BATCHES_IN_FLIGHT:
+                    join_oldest()
+                while spare and spare[-1].shape[1:] != frame.shape:
+                    spare.pop().release()
+                buffer = spare.pop() if spare else SharedArray((batch_size,) + frame.shape, frame.dtype)
+
+            buffer.array[len(batch)] = frame
+            batch.append(None if tracker is None else tracker.update(frame))
+            if len(batch) == batch_size:
+                submit()
+
+        if batch:
+            submit()
+        while in_flight:
+            join_oldest()
+    finally:
+        for _, futures, _ in in_flight:
+            for future in futures:
+                future.cancel()
+        leftovers = spare + [entry[0] for entry in in_flight] + ([buffer] if buffer is not None else [])
+        for leftover in leftovers:
+            leftover.release()
+
+    if not centroids:
+        return [], np.empty((0, 3)), np.empty(0) if proxy else None
+    return centroids, np.concatenate(metrics), np.concatenate(proxies) if proxy else None
+
+def parallel_evaluate_and_align_two_pass(
+    video_paths: List[str],
+    crop_size: int,
+    pool: Executor,
+    workers: int,
+    threshold: float = 0.95,
+    method: str = "ecc",
+    prefilter: float = 1.0,
+    on_progress: Optional[Callable[[int], None]] = None,
+    prefetch: int = 0,
+    tracking: bool = False,
+    whole_pixels: bool = False,
+) -> AlignmentResult:
+    """Run evaluate_and_align_two_pass with the scoring and the alignment spread over a process pool."""
+    frame_counts: List[int] = []
+    centroids, metrics_array, proxy = parallel_score_frames(
+        read_frames(video_paths, prefetch, frame_counts), crop_size, pool, workers, prefilter < 1.0,
+        on_progress, tracking,
+    )
+    scores, avg_quality, best_index, selected = rank_streamed_frames(metrics_array, proxy, threshold, prefilter)
+    cropped_images, selected, best_index = read_selected_crops(
+        video_paths, centroids, scores, selected, best_index, crop_size, prefetch, frame_counts
+    )
+
+    # Crops are packed as the selected frames in order, followed by the template when it is not selected.
+    order = [*selected] + ([] if best_index in selected else [best_index])
+    shared = SharedArray((len(order),) + cropped_images[best_index].shape)
+    try:
+        for position, index in enumerate(order):
+            shared.array[position] = cropped_images.pop(index)
+        with span("align", len(selected)):
+            aligned_images, residuals, warp_matrices = align_on_pool(
+                shared, order.index(best_index), np.arange(len(selected)), pool, workers, method, whole_pixels
+            )
+    finally:
+        shared.release()
+    return AlignmentResult(
+        aligned_images, best_index, scores[best_index], avg_quality, residuals, warp_matrices, scores, selected
+    )
@@ -0,0 +1,132 @@
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from detect_and_crop.handler import crop_around, detect_and_crop, find_centroid
+from evaluate_and_align.aligners import create_aligner
+from evaluate_and_align.utils import (compute_batch_metrics,
+                                      compute_proxy_sharpness)
+from profiling.handler import stop_profiling
+
+SharedSpec = Tuple[str, Tuple[int, ...], str]
+
+
+class SharedArray:
+    """A NumPy array backed by a named shared memory block that worker processes can attach to."""
+
+    def __init__(self, shape: Tuple[int, ...], dtype: np.dtype = np.uint8, name: Optional[str] = None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+        size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    @property
+    def spec(self) -> SharedSpec:
+        """Picklable description used by workers to attach to the same block."""
+        return self.shm.name, self.shape, self.dtype.str
+
+    @classmethod
+    def attach(cls, spec: SharedSpec) -> "SharedArray":
+        """Attach to a block created by another process."""
+        name, shape, dtype = spec
+        return cls(shape, dtype, name=name)
+
+    def release(self) -> None:
+        """Drop this process' mapping and, for the creating process, free the block."""
+        self.array = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # views are still alive; the mapping is closed when they are collected
+        if self.owner:
+            self.shm.unlink()
+
+def init_worker() -> None:
+    """Keep each worker on a single OpenCV thread so processes do not oversubscribe the cores.
+
+    A profiler inherited through fork is dropped, since its spans would never reach the parent.
+    """
+    cv2.setNumThreads(1)
+    stop_profiling()
+
+def split_chunks(items: List, num_chunks: int) -> List[List]:
+    """Split a list into at most num_chunks contiguous, similarly sized chunks."""
+    num_chunks = max(1, min(num_chunks, len(items)))
+    bounds = np.linspace(0, len(items), num_chunks + 1).astype(int)
+    return [items[start:stop] for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+def crop_task(
+    src_spec: SharedSpec,
+    dst_spec: SharedSpec,
+    items: List[Tuple[int, int, Optional[Tuple[int, int]]]],
+    crop_size: int,
+) -> None:
+    """Crop raw frames from shared source slots into shared destination indices.
+
+    Each item is a source slot, a destination index and the object centroid, or None to detect it here.
+    """
+    src, dst = SharedArray.attach(src_spec), SharedArray.attach(dst_spec)
+    try:
+        for slot, index, centroid in items:
+            if centroid is None:
+                dst.array[index] = detect_and_crop(src.array[slot], crop_size)
+            else:
+                dst.array[index] = crop_around(src.array[slot], centroid, crop_size)
+    finally:
+        src.release()
+        dst.release()
+
+def score_task(
+    src_spec: SharedSpec,
+    slots: List[int],
+    centroids: List[Optional[Tuple[int, int]]],
+    crop_size: int,
+    proxy: bool = False,
+) -> Tuple[List[Tuple[int, int]], np.ndarray, Optional[np.ndarray]]:
+    """Crop raw frames from shared source slots and score them without keeping the crops.
+
+    Frames without a given centroid are detected here. Returns the centroid, the raw quality
+    metrics and, with proxy, the proxy sharpness of each frame.
+    """
+    src = SharedArray.attach(src_spec)
+    try:
+        centroids = [find_centroid(src.array[slot]) if centroid is None else centroid
+                     for slot, centroid in zip(slots, centroids)]
+        crops = np.stack([crop_around(src.array[slot], centroid, crop_size)
+                          for slot, centroid in zip(slots, centroids)])
+        return centroids, compute_batch_metrics(crops), compute_proxy_sharpness(crops) if proxy else None
+    finally:
+        src.release()
+
+def metrics_task(images_spec: SharedSpec, indices: List[int], proxy: bool = False) -> np.ndarray:
+    """Compute raw quality metrics, or the cheap proxy sharpness, for a batch of shared images."""
+    images = SharedArray.attach(images_spec)
+    try:
+        batch = images.array[indices]
+        return compute_proxy_sharpness(batch) if proxy else compute_batch_metrics(batch)
+    finally:
+        images.release()
+
+def align_task(images_spec: SharedSpec, template_spec: SharedSpec, dst_spec: SharedSpec,
+               pairs: List[Tuple[int, int]], method: str = "ecc",
+               whole_pixels: bool = False) -> List[Tuple[float, np.ndarray]]:
+    """Align shared images to the shared grayscale template, writing them to destination indices.
+
+    Returns the alignment residual and warp matrix of each pair.
+    """
+    images, template, dst = (SharedArray.attach(spec) for spec in (images_spec, template_spec, dst_spec))
+    try:
+        aligner = create_aligner(method, template.array.copy())
+        results = []
+        for index, out_index in pairs:
+            dst.array[out_index], warp_matrix, residual = aligner.align(images.array[index], whole_pixels)
+            results.append((residual, warp_matrix))
+        return results
+    finally:
+        images.release()
+        template.release()
+        dst.release()
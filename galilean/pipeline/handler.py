@@ -0,0 +1,403 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from dataclasses import replace
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+from rich.progress import Progress
+
+from detect_and_crop.handler import detect_and_crop_frames
+from evaluate_and_align.handler import (AlignmentResult, evaluate_and_align,
+                                        evaluate_and_align_two_pass)
+from evaluate_and_align.utils import resample_whole_pixel_aligned
+from frame_store.handler import (aligned_path, alignment_dir, cropped_dir,
+                                 load_alignment, load_cropped, save_alignment,
+                                 save_cropped)
+from image_stacking.handler import DRIZZLE, image_stacking
+from image_stacking.rolling import rolling_stacks, window_starts
+from image_stacking.tiling import tiled_image_stacking
+from parallel.handler import (parallel_detect_and_crop,
+                              parallel_evaluate_and_align,
+                              parallel_evaluate_and_align_two_pass,
+                              share_frames)
+from parallel.utils import init_worker
+from pipeline.planning import plan_memory
+from pipeline.utils import (BatchJob, EventProgress, PipelineOptions,
+                            open_video_writer, postprocessing_scale,
+                            resolve_crop_size, save_image, select_positions,
+                            validate_job, variant_label)
+from postprocessing.handler import postprocessing, postprocessing_variants
+from postprocessing.utils import get_sr_model
+from profiling.handler import span
+from video_reader.handler import count_frames, read_frames
+from video_reader.utils import probe_video
+
+
+def crop_and_align(
+    selected_files: List[str],
+    crop_size: int,
+    threshold: float,
+    options: PipelineOptions,
+    progress: Progress,
+    frame_count: Optional[int] = None,
+    whole_pixels: bool = False,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> AlignmentResult:
+    """Decode, crop, score and align the selected videos, serially or on a given or new process pool."""
+    store_cropped = store_aligned = None
+    if options.frame_store:
+        # A stored alignment is mapped instead of recomputed, and stored crops skip decoding.
+        store_cropped = cropped_dir(options.frame_store, selected_files, crop_size, options.tracking)
+        store_aligned = alignment_dir(
+            options.frame_store, selected_files, crop_size, threshold, options.align, options.prefilter,
+            options.tracking, whole_pixels,
+        )
+        result = load_alignment(store_aligned)
+        if result is not None:
+            return result
+
+    if frame_count is None:  # only sizes the progress bar
+        frame_count = count_frames(selected_files)
+    task = progress.add_task("Loading and cropping frames...", total=frame_count or None)
+    cached_images = load_cropped(store_cropped) if store_cropped else None
+
+    if options.two_pass and cached_images is None:
+        progress.update(task, description="Scoring frames...")
+        if options.workers > 1:
+            with (nullcontext(pool) if pool
+                  else ProcessPoolExecutor(options.workers, initializer=init_worker)) as pool:
+                result = parallel_evaluate_and_align_two_pass(
+                    selected_files, crop_size, pool, options.workers, threshold, options.align,
+                    options.prefilter, on_progress=lambda done: progress.advance(task, done),
+                    prefetch=options.prefetch, tracking=options.tracking, whole_pixels=whole_pixels,
+                )
+        else:
+            # Serial two-pass alignment writes its aligned frames straight to the frame store.
+            if store_aligned:
+                os.makedirs(store_aligned, exist_ok=True)
+            result = evaluate_and_align_two_pass(
+                selected_files, crop_size, threshold, options.align,
+                on_progress=lambda done: progress.advance(task, done), prefetch=options.prefetch,
+                tracking=options.tracking, whole_pixels=whole_pixels, prefilter=options.prefilter,
+                aligned_path=aligned_path(store_aligned) if store_aligned else None,
+            )
+    elif options.workers > 1:
+        with (nullcontext(pool) if pool
+              else ProcessPoolExecutor(options.workers, initializer=init_worker)) as pool:
+            if cached_images is None:
+                with span("parallel_detect_and_crop", frame_count):
+                    cropped_images, count = parallel_detect_and_crop(
+                        read_frames(selected_files, options.prefetch), crop_size, pool, options.workers,
+                        capacity=frame_count,
+                        on_progress=lambda done: progress.advance(task, done),
+                        tracking=options.tracking,
+                    )
+            else:
+                cropped_images, count = share_frames(cached_images), len(cached_images)
+            try:
+                if store_cropped and cached_images is None:
+                    save_cropped(store_cropped, cropped_images.array[:count])
+                task = progress.add_task("Aligning images...")
+                result = parallel_evaluate_and_align(
+                    cropped_images, count, pool, options.workers, threshold, options.align, options.prefilter,
+                    whole_pixels,
+                )
+            finally:
+                cropped_images.release()
+        progress.advance(task)
+    else:
+        cropped_images = cached_images
+        if cropped_images is None:
+            cropped_images = []
+            frames = read_frames(selected_files, options.prefetch)
+            for cropped in detect_and_crop_frames(frames, crop_size, options.tracking):
+                cropped_images.append(cropped)
+                progress.advance(task)
+            if store_cropped:
+                save_cropped(store_cropped, cropped_images)
+
+        task = progress.add_task("Aligning images...")
+        result = evaluate_and_align(cropped_images, threshold, options.align, options.prefilter, whole_pixels)
+        progress.advance(task)
+
+    if store_aligned:
+        save_alignment(store_aligned, result)
+        result = load_alignment(store_aligned)
+    return result
+
+def run_sweep(
+    selected_files: List[str],
+    crop_size: int,
+    thresholds: List[float],
+    methods: List[str],
+    sharpening_factors: List[float],
+    scaling_factor: int,
+    options: PipelineOptions,
+    output_dir: str,
+    prefix: str,
+    progress: Progress,
+) -> List[str]:
+    """Stack one capture with every combination of threshold, method and sharpening, returning the images."""
+    # Frames are aligned once for the highest threshold, and lower thresholds stack nested subsets.
+    # With drizzle, they are aligned to whole pixels and resampled by their remainder for the rest.
+    whole_pixels = DRIZZLE in methods
+    result = crop_and_align(
+        selected_files, crop_size, max(thresholds), options, progress, whole_pixels=whole_pixels
+    )
+    resampled_methods = [method for method in methods if method != DRIZZLE]
+
+    thresholds = sorted(set(thresholds), reverse=True)
+    outputs = []
+    task = progress.add_task("Stacking variants...", total=len(thresholds) * len(methods))
+    for threshold in thresholds:
+        positions = select_positions(result, threshold)
+        frames = [result.aligned_images[position] for position in positions]
+        warp_matrices = result.warp_matrices[positions]
+        stacked_images = {}
+        if whole_pixels:
+            stacked_images[DRIZZLE] = image_stacking(
+                frames, DRIZZLE, warp_matrices=warp_matrices, scale=scaling_factor
+            )
+            if resampled_methods:
+                frames = resample_whole_pixel_aligned(frames, warp_matrices)
+        if options.stacking_memory is not None and resampled_methods:
+            tiled = tiled_image_stacking(frames, resampled_methods, options.stacking_memory)
+            stacked_images.update(zip(resampled_methods, tiled))
+        else:
+            stacked_images.update((method, image_stacking(frames, method)) for method in resampled_methods)
+        for method in methods:
+            stacked_image = stacked_images[method]
+            label = variant_label(threshold, method)
+            stacked_output = os.path.join(output_dir, f"{prefix}_{label}_stacked_image.tiff")
+            save_image(stacked_output, stacked_image)
+            outputs.append(stacked_output)
+
+            variants = postprocessing_variants(
+                stacked_image, sharpening_factors, postprocessing_scale(method, scaling_factor),
+                options.sr_tile_size, options.sr_threads, options.wavelet_gains,
+            )
+            for sharpening_factor, postprocessed_image in zip(sharpening_factors, variants):
+                label = variant_label(threshold, method, sharpening_factor)
+                postprocessed_output = os.path.join(output_dir, f"{prefix}_{label}_postprocessed_image.tiff")
+                save_image(postprocessed_output, postprocessed_image)
+                outputs.append(postprocessed_output)
+            progress.advance(task)
+    return outputs
+
+def run_rolling(
+    selected_files: List[str],
+    crop_size: int,
+    threshold: float,
+    method: str,
+    window: int,
+    step: int,
+    sharpening_factor: float,
+    scaling_factor: int,
+    options: PipelineOptions,
+    output_dir: str,
+    prefix: str,
+    progress: Progress,
+    video_fps: Optional[float] = None,
+) -> List[str]:
+    """Stack every window of window frames advancing by step, returning the images and the video_fps video."""
+    # Frames are aligned once against the best frame of the whole capture, so the stacks line up.
+    result = crop_and_align(selected_files, crop_size, threshold, options, progress)
+    windows = window_starts(len(result.scores), window, step)
+    task = progress.add_task("Stacking windows...", total=len(windows))
+    outputs = []
+    video_output = os.path.join(output_dir, f"{prefix}_rolling_{method}.mp4")
+    writer = None
+    try:
+        for start, _, stacked_image in rolling_stacks(
+            result.aligned_images, result.selected, len(result.scores), method, window, step
+        ):
+            postprocessed_image = postprocessing(
+                stacked_image, sharpening_factor, scaling_factor,
+                options.sr_tile_size, options.sr_threads, options.wavelet_gains,
+            )
+            name = f"{prefix}_rolling_{method}_{start:06d}_postprocessed_image.tiff"
+            output = os.path.join(output_dir, name)
+            save_image(output, postprocessed_image)
+            outputs.append(output)
+            if video_fps is not None:
+                if writer is None:
+                    writer = open_video_writer(video_output, video_fps, postprocessed_image.shape[1::-1])
+                writer.write(np.clip(postprocessed_image, 0, 255).astype(np.uint8))
+            progress.update(task, completed=start // step + 1)
+    finally:
+        if writer is not None:
+            writer.release()
+    if writer is not None:
+        outputs.append(video_output)
+    return outputs
+
+def run_job(
+    job: BatchJob,
+    options: PipelineOptions,
+    output_dir: str,
+    prefix: str,
+    progress: Optional[Progress] = None,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> Dict[str, Any]:
+    """Process one batch job end to end and return its manifest entry, reusing a given pool."""
+    entry: Dict[str, Any] = {"videos": job.videos, "parameters": {
+        "crop_size": job.crop_size, "threshold": job.threshold, "method": job.method,
+        "sharpening": job.sharpening, "scale": job.scale,
+    }}
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    try:
+        infos = [probe_video(video) for video in job.videos]
+        crop_size = resolve_crop_size(job.crop_size, min(info.height for info in infos))
+        frame_count = sum(info.frame_count for info in infos)
+        entry["parameters"]["crop_size"] = crop_size
+        if options.max_memory is not None:
+            frame_size = (infos[0].width, infos[0].height)
+            plan = plan_memory(
+                options, frame_count, frame_size, crop_size, job.threshold, [job.method], job.scale
+            )
+            if plan.options.workers != options.workers:
+                pool = None
+            options = plan.options
+            entry["memory_plan"] = {
+                "budget": plan.budget, "peak": plan.peak, "changes": plan.changes,
+                "stages": {stage.name: stage.peak for stage in plan.stages},
+            }
+        timings["probe"] = time.perf_counter() - started
+
+        with nullcontext(progress) if progress else Progress(disable=True) as progress:
+            step = time.perf_counter()
+            result = crop_and_align(
+                job.videos, crop_size, job.threshold, options, progress, frame_count, job.method == DRIZZLE,
+                pool,
+            )
+            timings["align"] = time.perf_counter() - step
+
+            step = time.perf_counter()
+            task = progress.add_task("Stacking images...", total=1)
+            stacked_image = image_stacking(
+                result.aligned_images, job.method, options.stacking_memory, result.warp_matrices, job.scale
+            )
+            progress.advance(task)
+            timings["stack"] = time.perf_counter() - step
+
+            step = time.perf_counter()
+            task = progress.add_task("Post-processing...", total=1)
+            postprocessed_image = postprocessing(
+                stacked_image, job.sharpening, postprocessing_scale(job.method, job.scale),
+                options.sr_tile_size, options.sr_threads, options.wavelet_gains,
+            )
+            progress.advance(task)
+            timings["postprocess"] = time.perf_counter() - step
+
+        stacked_image_output = os.path.join(output_dir, f"{prefix}_stacked_image.tiff")
+        postprocessed_image_output = os.path.join(output_dir, f"{prefix}_postprocessed_image.tiff")
+        save_image(stacked_image_output, stacked_image)
+        save_image(postprocessed_image_output, postprocessed_image)
+
+        residuals = result.residuals
+        entry.update({
+            "status": "ok",
+            "outputs": {"stacked": stacked_image_output, "postprocessed": postprocessed_image_output},
+            "frame_count": len(result.scores),
+            "stacked_count": len(result.aligned_images),
+            "best_index": result.best_index,
+            "best_score": float(result.best_score),
+            "avg_quality": float(result.avg_quality),
+            "residual_mean": float(np.mean(residuals)) if len(residuals) else None,
+            "residual_max": float(np.max(residuals)) if len(residuals) else None,
+            "scores": [float(score) if np.isfinite(score) else None for score in result.scores],
+        })
+    except Exception as error:
+        # Failures are recorded instead of raised, so one unreadable video does not abort a batch.
+        entry.update({"status": "failed", "error": f"{type(error).__name__}: {error}"})
+    timings["total"] = time.perf_counter() - started
+    entry["timings"] = timings
+    return entry
+
+class Pipeline:
+    """Super resolution models and worker processes kept warm across jobs, for long-lived processes."""
+
+    def __init__(self, options: PipelineOptions, concurrency: int = 1):
+        self.options = options
+        self.job_options = options
+        # Up to concurrency jobs run at once from several threads, each within an equal share of the budget.
+        if options.max_memory is not None:
+            self.job_options = replace(options, max_memory=options.max_memory // concurrency)
+        self.pool = None
+        if options.workers > 1:
+            self.pool = ProcessPoolExecutor(options.workers, initializer=init_worker)
+
+    def warm(self, scales: Sequence[int] = (2, 3)) -> Dict[int, str]:
+        """Load the super resolution models of the given scales, returning the error of each that failed."""
+        errors = {}
+        for scale in scales:
+            try:
+                get_sr_model(scale)
+            except cv2.error as error:
+                errors[scale] = getattr(error, "err", None) or str(error)
+        return errors
+
+    def run(
+        self,
+        job: BatchJob,
+        output_dir: str,
+        prefix: str,
+        on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """Process one job and return its manifest entry, reporting progress events to on_event."""
+        os.makedirs(output_dir, exist_ok=True)
+        progress = EventProgress(on_event) if on_event is not None else None
+        return run_job(validate_job(job), self.job_options, output_dir, prefix, progress, self.pool)
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self) -> "Pipeline":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+def run_batch(
+    jobs: List[BatchJob],
+    options: PipelineOptions,
+    output_dir: str,
+    prefix: str,
+    max_jobs: int = 1,
+    on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+) -> List[Dict[str, Any]]:
+    """Run batch jobs, up to max_jobs at once, and return their manifest entries in job order."""
+    prefixes = [
+        f"{prefix}_{index + 1:03d}_{os.path.splitext(os.path.basename(job.videos[0]))[0]}"
+        for index, job in enumerate(jobs)
+    ]
+    entries: List[Optional[Dict[str, Any]]] = [None] * len(jobs)
+
+    def collect(index: int, entry: Dict[str, Any]) -> None:
+        entries[index] = entry
+        if on_result is not None:
+            on_result(index, entry)
+
+    if max_jobs <= 1 or len(jobs) <= 1:
+        for index, job in enumerate(jobs):
+            collect(index, run_job(job, options, output_dir, prefixes[index]))
+    else:
+        # Each job runs in a single-threaded OpenCV process with an equal share of the workers and budget.
+        concurrent = min(max_jobs, len(jobs))
+        options = replace(options, workers=max(1, options.workers // concurrent))
+        if options.max_memory is not None:
+            options = replace(options, max_memory=options.max_memory // concurrent)
+        with ProcessPoolExecutor(max_workers=concurrent, initializer=init_worker) as pool:
+            futures = {
+                pool.submit(run_job, job, options, output_dir, job_prefix): index
+                for index, (job, job_prefix) in enumerate(zip(jobs, prefixes))
+            }
+            for future in as_completed(futures):
+                collect(futures[future], future.result())
+    return entries
@@ -0,0 +1,353 @@
+from dataclasses import dataclass, replace
+from typing import List, Optional, Sequence, Tuple
+
+from frame_store.handler import DEFAULT_STORE_DIR
+from image_stacking.accumulators import counts_dtype
+from image_stacking.handler import DRIZZLE
+from image_stacking.tiling import STACKING_BYTES_PER_VALUE
+from pipeline.utils import PipelineOptions, format_size, postprocessing_scale
+from sharding.utils import STRIP_BINS, batch_frames
+
+MIB = 1 << 20
+# Resident size of a process with the interpreter, NumPy, OpenCV and a video decoder loaded.
+PROCESS_BYTES = 100 * MIB
+# Float32 grayscale copies, gradients and spectra an aligner holds per crop pixel.
+ALIGN_BYTES_PER_PIXEL = 48
+# Videos prefetch_frames decodes at once.
+PREFETCH_VIDEOS = 2
+# Float32 copies of the stacked image made by color calibration and sharpening.
+POSTPROCESSING_COPIES = 4
+# EDSR inference per input pixel of a tile: three live 256-channel float32 feature maps, and
+# an upsampling layer with 256 * scale ** 2 channels; conservative for every shipped model.
+SR_BYTES_PER_PIXEL = 3 * 256 * 4
+SR_UPSAMPLE_BYTES_PER_PIXEL = 256 * 4
+SR_MODEL_BYTES = 200 * MIB
+MIN_SR_TILE = 32
+# Histogram reduction per bin of a row strip: merged uint32 counts, one loaded shard strip of
+# at most uint32 counts, uint32 cumulative and weighted counts, and uint64 cumulative sums.
+REDUCE_BYTES_PER_BIN = 4 * 4 + 8
+
+
+@dataclass
+class StageEstimate:
+    """Estimated peak resident memory of one pipeline stage."""
+    name: str
+    peak: int
+    detail: str
+
+
+@dataclass
+class MemoryPlan:
+    """Execution options sized to fit a memory budget, with the estimates they were chosen from."""
+    budget: int
+    options: PipelineOptions
+    stages: List[StageEstimate]
+    changes: List[str]
+
+    @property
+    def peak(self) -> int:
+        return max(stage.peak for stage in self.stages)
+
+
+def estimate_stages(
+    options: PipelineOptions,
+    frame_count: int,
+    frame_size: Tuple[int, int],
+    crop_size: int,
+    threshold: float,
+    methods: Sequence[str],
+    scaling_factor: int,
+    window: Optional[int] = None,
+) -> List[StageEstimate]:
+    """Estimate the peak memory of each stage for 8-bit BGR frames of frame_size (width, height)."""
+    width, height = frame_size
+    frame_bytes = width * height * 3
+    crop_bytes = crop_size * crop_size * 3
+    selected = max(1, int(frame_count * threshold))
+    workers = options.workers
+
+    decode = PROCESS_BYTES + (PREFETCH_VIDEOS * options.prefetch + 1) * frame_bytes
+    pool = 0
+    if workers > 1:
+        # Two batches of frame slots in flight, each of two frames per worker.
+        decode += 2 * 2 * workers * frame_bytes
+        pool = workers * PROCESS_BYTES
+    align_temps = workers * crop_size * crop_size * ALIGN_BYTES_PER_PIXEL
+    aligned = selected * crop_bytes
+    # Every estimate includes the main process, and the aligned frames stay resident until the end
+    # of the run unless a frame store maps them from disk.
+    resident = PROCESS_BYTES + (0 if options.frame_store else aligned)
+
+    if options.two_pass and options.frame_store and workers <= 1:
+        # Frames are re-decoded, cropped and aligned one at a time into the frame store.
+        stages = [
+            StageEstimate("score", decode, "streamed frames, 1 worker(s)"),
+            StageEstimate("align", decode + 2 * crop_bytes + align_temps,
+                          f"{selected} aligned frames, to the frame store"),
+        ]
+    elif options.two_pass:
+        # Workers align from a shared copy of the re-decoded crops into a shared block that is then
+        # copied out.
+        copies = 3 if workers > 1 else 1
+        stages = [
+            StageEstimate("score", decode + pool, f"streamed frames, {workers} worker(s)"),
+            StageEstimate("align", decode + copies * aligned + align_temps + pool,
+                          f"{selected} aligned frames, re-decoded"),
+        ]
+    else:
+        cropped = frame_count * crop_bytes
+        stages = [
+            StageEstimate("crop", decode + cropped + pool,
+                          f"{frame_count} cropped frames, {workers} worker(s)"),
+            StageEstimate("align", PROCESS_BYTES + cropped + aligned + align_temps + pool,
+                          f"{selected} aligned frames"),
+        ]
+
+    stack_methods = [method for method in methods if method != DRIZZLE]
+    if window is not None:
+        # Rolling windows of that many frames keep per-pixel uint64 sums and, but for the mean,
+        # histograms with counters sized for the window.
+        counts = crop_bytes * 256 * counts_dtype(window).itemsize if methods != ["mean"] else 0
+        stages.append(StageEstimate("stack", resident + 16 * crop_bytes + counts,
+                                    f"rolling windows of {window} frames"))
+    elif stack_methods:
+        values = selected * crop_bytes
+        temps = values * (max(STACKING_BYTES_PER_VALUE[method] for method in stack_methods) + 1)
+        if options.stacking_memory is not None:
+            temps = min(temps, options.stacking_memory)
+        detail = "in tiles" if options.stacking_memory is not None else "whole stack at once"
+        stages.append(StageEstimate("stack", resident + temps, detail))
+    if DRIZZLE in methods:
+        # Accumulated values, weights and the hole-filling upscaled mean on the fine grid.
+        fine_bytes = (crop_size * scaling_factor) ** 2 * 3 * 4
+        stages.append(StageEstimate("drizzle", resident + 3 * fine_bytes, f"{scaling_factor}x output grid"))
+
+    return stages + estimate_postprocessing(options, crop_size, methods, scaling_factor, resident)
+
+def estimate_postprocessing(
+    options: PipelineOptions,
+    crop_size: int,
+    methods: Sequence[str],
+    scaling_factor: int,
+    resident: int,
+) -> List[StageEstimate]:
+    """Estimate the peak memory of post-processing the stack of each method on top of resident bytes."""
+    stages = []
+    for method in methods:
+        scale = postprocessing_scale(method, scaling_factor)
+        size = crop_size * (scaling_factor if method == DRIZZLE else 1)
+        peak = resident + POSTPROCESSING_COPIES * (size * scale) ** 2 * 3 * 4
+        detail = "calibration and sharpening"
+        if scale > 1:
+            tile = min(options.sr_tile_size or size, size)
+            per_pixel = SR_BYTES_PER_PIXEL + SR_UPSAMPLE_BYTES_PER_PIXEL * scale ** 2
+            peak += SR_MODEL_BYTES + tile * tile * per_pixel
+            detail = f"super resolution x{scale}, {tile}px tiles"
+        name = f"postprocess ({method})" if len(methods) > 1 else "postprocess"
+        stages.append(StageEstimate(name, peak, detail))
+    return stages
+
+def plan_memory(
+    options: PipelineOptions,
+    frame_count: int,
+    frame_size: Tuple[int, int],
+    crop_size: int,
+    threshold: float,
+    methods: Sequence[str],
+    scaling_factor: int,
+    window: Optional[int] = None,
+) -> MemoryPlan:
+    """Degrade options stage by stage until they fit options.max_memory, or raise ValueError."""
+    budget = options.max_memory
+    planned = replace(options, stacking_memory=None)
+    changes: List[str] = []
+    store_change = f"aligned frames kept on disk in the frame store {DEFAULT_STORE_DIR}"
+    selected_bytes = max(1, int(frame_count * threshold)) * crop_size * crop_size * 3
+
+    def estimate(candidate: PipelineOptions) -> List[StageEstimate]:
+        return estimate_stages(
+            candidate, frame_count, frame_size, crop_size, threshold, methods, scaling_factor, window
+        )
+
+    def over_budget(names: Sequence[str]) -> List[StageEstimate]:
+        stages = estimate(planned)
+        return [stage for stage in stages if stage.peak > budget and stage.name.startswith(tuple(names))]
+
+    def refuse(stage: StageEstimate, hint: str) -> None:
+        raise ValueError(
+            f"The {stage.name} stage needs about {format_size(stage.peak)}, over the {format_size(budget)} "
+            f"memory budget even after {', '.join(changes) or 'no changes'}; {hint}"
+        )
+
+    def fits_serially(names: Sequence[str]) -> bool:
+        stages = estimate(replace(planned, workers=1, prefetch=0))
+        return not any(stage.peak > budget for stage in stages if stage.name in names)
+
+    # Fewest sacrifices first. Fewer workers and a shorter prefetch ring cannot help when the
+    # cropped or aligned frames alone do not fit, so those score in two passes or align into a
+    # frame store straight away.
+    if over_budget(("crop", "align")) and not fits_serially(("crop", "align")):
+        changes.append("two-pass scoring")
+        planned = replace(planned, two_pass=True)
+    if over_budget(("align",)) and not planned.frame_store and not fits_serially(("align",)):
+        changes.append(store_change)
+        planned = replace(planned, frame_store=DEFAULT_STORE_DIR)
+    while over_budget(("score", "crop", "align")):
+        if planned.workers > 1:
+            workers = planned.workers // 2
+            changes.append(f"workers {planned.workers} -> {workers}")
+            planned = replace(planned, workers=workers)
+        elif planned.prefetch > 0:
+            prefetch = planned.prefetch // 2
+            changes.append(f"prefetch {planned.prefetch} -> {prefetch}")
+            planned = replace(planned, prefetch=prefetch)
+        elif not planned.two_pass:
+            changes.append("two-pass scoring")
+            planned = replace(planned, two_pass=True)
+        elif not planned.frame_store:
+            changes.append(store_change)
+            planned = replace(planned, frame_store=DEFAULT_STORE_DIR)
+        else:
+            refuse(over_budget(("score", "align"))[0], "lower the quality threshold or the crop size")
+
+    # Stacking moves the aligned frames to the frame store when they leave no room for a tile, then
+    # stacks in tiles of what is left free.
+    smallest_tile = max(1, int(frame_count * threshold)) * 3 * (max(STACKING_BYTES_PER_VALUE.values()) + 1)
+    if window is not None:
+        smallest_tile = budget  # the window histograms cannot be split into tiles
+    no_room = budget - PROCESS_BYTES - selected_bytes < smallest_tile
+    if over_budget(("stack",)) and not planned.frame_store and no_room:
+        changes.append(store_change)
+        planned = replace(planned, frame_store=DEFAULT_STORE_DIR)
+    over = over_budget(("stack",))
+    if over and window is not None:
+        refuse(over[0], "lower the crop size or the window length")
+    if over:
+        stacking_memory = budget - PROCESS_BYTES - (0 if planned.frame_store else selected_bytes)
+        if stacking_memory < smallest_tile:
+            refuse(over[0], "lower the quality threshold or the crop size")
+        changes.append(f"stacking in tiles of {format_size(stacking_memory)}")
+        planned = replace(planned, stacking_memory=stacking_memory)
+    over = over_budget(("drizzle",))
+    if over:
+        refuse(over[0], "lower the drizzle scale or the crop size")
+
+    while True:
+        over = over_budget(("postprocess",))
+        if not over:
+            break
+        tile = min(planned.sr_tile_size or crop_size * scaling_factor, crop_size * scaling_factor)
+        if "super resolution" not in over[0].detail or tile <= MIN_SR_TILE:
+            refuse(over[0], "lower the super resolution scale or the crop size")
+        changes.append(f"super resolution tiles {tile} -> {tile // 2}")
+        planned = replace(planned, sr_tile_size=tile // 2)
+
+    return MemoryPlan(budget, planned, estimate(planned), changes)
+
+def estimate_shard_stages(
+    options: PipelineOptions,
+    shard_frames: Sequence[int],
+    frame_size: Tuple[int, int],
+    crop_size: int,
+    method: str,
+    scaling_factor: int,
+    steps: Sequence[str] = ("score", "stack", "reduce"),
+) -> List[StageEstimate]:
+    """Estimate the peak memory of the given steps of a sharded run over shards of shard_frames frames."""
+    width, height = frame_size
+    frame_bytes = width * height * 3
+    crop_bytes = crop_size * crop_size * 3
+    histograms = method != "mean"
+    processes = min(options.workers, len(shard_frames))
+    detail = f"{len(shard_frames)} shards, {processes} worker(s)"
+
+    # Map steps run one shard per worker process next to the main one, holding its histograms but
+    # never its frames.
+    def in_processes(peak: int) -> int:
+        return PROCESS_BYTES + processes * peak if processes > 1 else peak
+
+    stages = []
+    if "score" in steps:
+        peak = PROCESS_BYTES + 2 * frame_bytes + 2 * crop_bytes
+        stages.append(StageEstimate("score", in_processes(peak), detail))
+    if "stack" in steps:
+        frames = min(batch_frames((crop_size, crop_size, 3)), max(shard_frames))
+        batch = frames * crop_bytes
+        peak = PROCESS_BYTES + (options.prefetch + 1) * frame_bytes + 2 * crop_bytes
+        peak += crop_size * crop_size * ALIGN_BYTES_PER_PIXEL + batch + 16 * crop_bytes
+        # Summing a batch squares it in uint32; counting a strip of it takes int64 bins and
+        # uint8 and intp copies of its values.
+        temps = 4 * batch + 8 * crop_bytes
+        if histograms:
+            peak += crop_bytes * 256 * counts_dtype(max(shard_frames)).itemsize
+            strip_values = min(batch, frames * STRIP_BINS // 256)
+            temps = max(temps, 8 * STRIP_BINS + (1 + 8) * strip_values)
+        stages.append(StageEstimate("stack", in_processes(peak + temps), detail))
+    if "reduce" in steps:
+        # The sums of every shard are loaded and histograms are merged strip by strip.
+        peak = PROCESS_BYTES + (2 * len(shard_frames) + 1) * 8 * crop_bytes + 4 * crop_bytes
+        if histograms:
+            peak += min(STRIP_BINS, crop_bytes * 256) * REDUCE_BYTES_PER_BIN
+        stages.append(StageEstimate("reduce", peak, f"{len(shard_frames)} partial statistics"))
+        stages += estimate_postprocessing(options, crop_size, [method], scaling_factor, PROCESS_BYTES)
+    return stages
+
+def plan_shard_memory(
+    options: PipelineOptions,
+    shard_frames: Sequence[int],
+    frame_size: Tuple[int, int],
+    crop_size: int,
+    method: str,
+    scaling_factor: int,
+    steps: Sequence[str] = ("score", "stack", "reduce"),
+) -> MemoryPlan:
+    """Degrade the options of the sharded steps until they fit options.max_memory, or raise ValueError."""
+    budget = options.max_memory
+    planned = options
+    changes: List[str] = []
+
+    def estimate(candidate: PipelineOptions) -> List[StageEstimate]:
+        return estimate_shard_stages(
+            candidate, shard_frames, frame_size, crop_size, method, scaling_factor, steps
+        )
+
+    def over_budget(names: Sequence[str]) -> List[StageEstimate]:
+        stages = estimate(planned)
+        return [stage for stage in stages if stage.peak > budget and stage.name.startswith(tuple(names))]
+
+    def refuse(stage: StageEstimate, hint: str) -> None:
+        raise ValueError(
+            f"The {stage.name} stage needs about {format_size(stage.peak)}, over the {format_size(budget)} "
+            f"memory budget even after {', '.join(changes) or 'no changes'}; {hint}"
+        )
+
+    # Shards are fixed by the manifest, so only the workers and the prefetch ring can shrink.
+    while over_budget(("score", "stack")):
+        if planned.workers > 1 and min(planned.workers, len(shard_frames)) > 1:
+            workers = planned.workers // 2
+            changes.append(f"workers {planned.workers} -> {workers}")
+            planned = replace(planned, workers=workers)
+        elif planned.prefetch > 0 and over_budget(("stack",)):
+            prefetch = planned.prefetch // 2
+            changes.append(f"prefetch {planned.prefetch} -> {prefetch}")
+            planned = replace(planned, prefetch=prefetch)
+        else:
+            hint = "initialize the shards with a lower crop size"
+            if method != "mean" and max(shard_frames) > 255:
+                hint += " or with --chunk-frames 255 or fewer, which counts histograms in 8 bits"
+            refuse(over_budget(("score", "stack"))[0], hint)
+    over = over_budget(("reduce",))
+    if over:
+        refuse(over[0], "initialize the shards with a lower crop size or fewer, longer shards")
+
+    while True:
+        over = over_budget(("postprocess",))
+        if not over:
+            break
+        tile = min(planned.sr_tile_size or crop_size, crop_size)
+        if "super resolution" not in over[0].detail or tile <= MIN_SR_TILE:
+            refuse(over[0], "lower the super resolution scale or the crop size")
+        changes.append(f"super resolution tiles {tile} -> {tile // 2}")
+        planned = replace(planned, sr_tile_size=tile // 2)
+
+    return MemoryPlan(budget, planned, estimate(planned), changes)
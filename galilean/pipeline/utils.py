@@ -0,0 +1,215 @@
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from rich.progress import Progress, TaskID
+
+from evaluate_and_align.handler import AlignmentResult
+from image_stacking.handler import DRIZZLE, STACKING_METHODS
+from profiling.handler import profiled
+
+CROP_SIZES = [360, 480, 720, 1080]
+SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+@dataclass
+class PipelineOptions:
+    """Execution options shared by every command, independent of the images being processed."""
+    workers: int = 1
+    two_pass: bool = False
+    align: str = "ecc"
+    prefilter: float = 1.0
+    frame_store: Optional[str] = None
+    sr_tile_size: Optional[int] = 256
+    sr_threads: Optional[int] = None
+    prefetch: int = 8
+    tracking: bool = False
+    max_memory: Optional[int] = None
+    stacking_memory: Optional[int] = None
+    wavelet_gains: Optional[List[float]] = None
+
+
+@dataclass
+class BatchJob:
+    """One capture, made of one or more videos, and the parameters to process it without prompts."""
+    videos: List[str]
+    crop_size: Optional[int] = None
+    threshold: float = 0.9
+    method: str = "mean_with_median_clipping"
+    sharpening: float = 1.2
+    scale: int = 1
+
+
+def select_positions(result: AlignmentResult, threshold: float) -> np.ndarray:
+    """Positions among the aligned frames of the top threshold fraction of all scored frames, in frame order.
+
+    The subset is taken from the frames already aligned for a higher threshold, so selections for
+    decreasing thresholds are always nested.
+    """
+    num_top_images = min(int(len(result.scores) * threshold), len(result.selected))
+    by_score = np.argsort(-result.scores[result.selected], kind="stable")
+    return np.sort(by_score[:num_top_images])
+
+def select_by_threshold(result: AlignmentResult, threshold: float) -> List[np.ndarray]:
+    """Pick the aligned frames of the top threshold fraction of all scored frames, in frame order."""
+    return [result.aligned_images[position] for position in select_positions(result, threshold)]
+
+def postprocessing_scale(method: str, scaling_factor: int) -> int:
+    """Upscaling left to super resolution, none when drizzle stacking already produced it."""
+    return 1 if method == DRIZZLE else scaling_factor
+
+def parse_size(value: str) -> int:
+    """Parse a byte count such as '512M' or '2G', with binary units."""
+    text = value.strip().upper().removesuffix("B").removesuffix("I")
+    number, unit = (text[:-1], text[-1]) if text[-1:].isalpha() else (text, "")
+    try:
+        size = int(float(number) * SIZE_UNITS[unit])
+    except (KeyError, ValueError):
+        raise ValueError(f"Invalid size '{value}'") from None
+    if size <= 0:
+        raise ValueError(f"Invalid size '{value}'")
+    return size
+
+def format_size(size: int) -> str:
+    """Format a byte count with the largest binary unit that keeps it at least one, as parse_size reads it."""
+    for unit in ("T", "G", "M", "K"):
+        if size >= SIZE_UNITS[unit]:
+            return f"{size / SIZE_UNITS[unit]:.1f}{unit}"
+    return str(size)
+
+def variant_label(threshold: float, method: str, sharpening_factor: Optional[float] = None) -> str:
+    """File name label of one sweep variant."""
+    label = f"q{int(round(threshold * 100))}_{method}"
+    if sharpening_factor is not None:
+        label += f"_sharpen{sharpening_factor:g}"
+    return label
+
+@profiled("imwrite", frames=lambda *args, **kwargs: 1)
+def save_image(path: str, image: np.ndarray) -> None:
+    """Write an image as 8-bit, raising if OpenCV cannot encode or save it."""
+    if not cv2.imwrite(path, image.astype(np.uint8)):
+        raise OSError(f"Failed to save image to: {path}")
+
+def video_fourcc(path: str) -> int:
+    """Codec for an output video: Motion JPEG for AVI files, MPEG-4 otherwise."""
+    return cv2.VideoWriter_fourcc(*("MJPG" if path.lower().endswith(".avi") else "mp4v"))
+
+def open_video_writer(path: str, fps: float, size: Tuple[int, int]) -> cv2.VideoWriter:
+    """Open a color video of (width, height) frames for writing, raising if OpenCV cannot."""
+    writer = cv2.VideoWriter(path, video_fourcc(path), fps, size)
+    if not writer.isOpened():
+        raise OSError(f"Failed to open video for writing: {path}")
+    return writer
+
+def resolve_crop_size(crop_size: Optional[int], max_dimension: int) -> int:
+    """Validate a requested crop size, or pick the largest available one that fits the videos."""
+    if crop_size is None:
+        valid_sizes = [size for size in CROP_SIZES if size <= max_dimension]
+        if not valid_sizes:
+            raise ValueError("Video resolution too small for available crop sizes")
+        return valid_sizes[-1]
+    if crop_size > max_dimension:
+        raise ValueError(f"Crop size {crop_size} exceeds the video height {max_dimension}")
+    return crop_size
+
+def validate_job(job: BatchJob) -> BatchJob:
+    """Check the parameters of a batch job, raising ValueError on the first invalid one."""
+    if not job.videos:
+        raise ValueError("A job needs at least one video")
+    if not 0.0 < job.threshold <= 1.0:
+        raise ValueError(f"Quality threshold must be in (0, 1], got {job.threshold}")
+    if job.method not in STACKING_METHODS:
+        raise ValueError(f"Unknown stacking method '{job.method}'. Choose from: {', '.join(STACKING_METHODS)}")
+    if job.scale not in (1, 2, 3):
+        raise ValueError(f"Scaling factor must be 1, 2 or 3, got {job.scale}")
+    return job
+
+def parse_job(entry: Dict[str, Any], defaults: Dict[str, Any], base_dir: str) -> BatchJob:
+    """Build a validated batch job from a mapping naming a "video" or "videos", relative to base_dir."""
+    if not isinstance(entry, dict):
+        raise ValueError("A job must be a mapping of parameters")
+    entry = dict(entry)
+    if "video" in entry:
+        entry["videos"] = [entry.pop("video")]
+    known = {field.name for field in fields(BatchJob)}
+    unknown = set(entry) - known
+    if unknown:
+        raise ValueError(f"Unknown job keys: {', '.join(sorted(unknown))}")
+    parameters = {**defaults, **entry}
+    parameters["videos"] = [os.path.join(base_dir, video) for video in parameters.get("videos", [])]
+    return validate_job(BatchJob(**parameters))
+
+def load_job_file(path: str, defaults: Optional[Dict[str, Any]] = None) -> List[BatchJob]:
+    """Read batch jobs from a JSON or YAML file.
+
+    The file holds either a list of jobs or a mapping with optional "defaults" and a "jobs"
+    list. Each job names a "video" or a list of "videos", relative to the job file, and may
+    override any parameter; unspecified parameters fall back to the file defaults, then to the
+    given defaults.
+    """
+    with open(path) as file:
+        if path.lower().endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("Reading YAML job files requires PyYAML (pip install pyyaml)")
+            content = yaml.safe_load(file)
+        else:
+            content = json.load(file)
+
+    if isinstance(content, list):
+        content = {"jobs": content}
+    if not isinstance(content, dict) or not isinstance(content.get("jobs"), list):
+        raise ValueError(f"Job file {path} must contain a list of jobs")
+    defaults = {**(defaults or {}), **content.get("defaults", {})}
+    base_dir = os.path.dirname(os.path.abspath(path))
+    return [parse_job(entry, defaults, base_dir) for entry in content["jobs"]]
+
+class EventProgress(Progress):
+    """Progress that draws nothing and reports task changes to a callback instead.
+
+    Each task is reported when it is added, when it completes or its description changes, and
+    otherwise at most every interval seconds, so per-frame advances do not flood the callback.
+    """
+
+    def __init__(self, on_event: Callable[[Dict[str, Any]], None], interval: float = 0.2):
+        super().__init__(disable=True)
+        self.on_event = on_event
+        self.interval = interval
+        self._reported: Dict[TaskID, Tuple[float, str]] = {}
+
+    def _report(self, task_id: TaskID) -> None:
+        task = self._tasks[task_id]
+        now = time.monotonic()
+        reported_at, description = self._reported.get(task_id, (None, None))
+        finished = task.total is not None and task.completed >= task.total
+        if reported_at is None or finished or description != task.description or now - reported_at >= self.interval:
+            self._reported[task_id] = (now, task.description)
+            self.on_event({
+                "event": "progress", "task": task.description,
+                "completed": task.completed, "total": task.total,
+            })
+
+    def add_task(self, *args, **kwargs) -> TaskID:
+        task_id = super().add_task(*args, **kwargs)
+        self._report(task_id)
+        return task_id
+
+    def update(self, task_id: TaskID, *args, **kwargs) -> None:
+        super().update(task_id, *args, **kwargs)
+        self._report(task_id)
+
+    def advance(self, task_id: TaskID, advance: float = 1) -> None:
+        super().advance(task_id, advance)
+        self._report(task_id)
+
+def write_manifest(path: str, entries: List[Dict[str, Any]], options: PipelineOptions) -> None:
+    """Write the results of a batch run as JSON, replacing any previous manifest atomically."""
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump({"options": asdict(options), "jobs": entries}, file, indent=2)
+    os.replace(temporary_path, path)
@@ -1,13 +1,64 @@
+from typing import List, Optional, Sequence
+
 import numpy as np
 
 from postprocessing.utils import calibrate_color, images_sr, laplacian_sharpen
+from postprocessing.wavelets import WaveletSharpener, scale_gains
+from profiling.handler import profiled
+
 
+@profiled("postprocessing")
+def postprocessing(
+    image: np.ndarray,
+    sharpening_factor: float = 1.5,
+    scaling_factor: int = 2,
+    sr_tile_size: Optional[int] = 256,
+    sr_threads: Optional[int] = None,
+    wavelet_gains: Optional[Sequence[float]] = None,
+) -> np.ndarray:
+    """Processes color planetary image with calibration, sharpening, and super resolution
 
-def postprocessing(image: np.ndarray, sharpening_factor: float = 1.5, scaling_factor: int = 2) -> np.ndarray:
-    """Processes color planetary image with calibration, sharpening, and super resolution"""
+    With per-layer wavelet gains, the Laplacian is replaced by wavelet sharpening whose gains
+    are scaled by the sharpening factor.
+    """
+    if wavelet_gains is not None:
+        sharpener = prepare_wavelets(image, len(wavelet_gains), scaling_factor, sr_tile_size, sr_threads)
+        return sharpener.sharpen(scale_gains(wavelet_gains, sharpening_factor))
     if scaling_factor > 1:
-        image = images_sr(image, scaling_factor)
+        image = images_sr(image, scaling_factor, tile_size=sr_tile_size, num_threads=sr_threads)
         
     processed = calibrate_color(image)
     processed = laplacian_sharpen(processed, sharpening_factor)
     return processed
+
+@profiled("postprocessing")
+def postprocessing_variants(
+    image: np.ndarray,
+    sharpening_factors: List[float],
+    scaling_factor: int = 2,
+    sr_tile_size: Optional[int] = 256,
+    sr_threads: Optional[int] = None,
+    wavelet_gains: Optional[Sequence[float]] = None,
+) -> List[np.ndarray]:
+    """Post-process one image with several sharpening factors, upscaling and calibrating it only once."""
+    if wavelet_gains is not None:
+        sharpener = prepare_wavelets(image, len(wavelet_gains), scaling_factor, sr_tile_size, sr_threads)
+        return [sharpener.sharpen(scale_gains(wavelet_gains, factor)) for factor in sharpening_factors]
+    if scaling_factor > 1:
+        image = images_sr(image, scaling_factor, tile_size=sr_tile_size, num_threads=sr_threads)
+
+    calibrated = calibrate_color(image)
+    return [laplacian_sharpen(calibrated, sharpening_factor) for sharpening_factor in sharpening_factors]
+
+@profiled("prepare_wavelets")
+def prepare_wavelets(
+    image: np.ndarray,
+    levels: int = 6,
+    scaling_factor: int = 2,
+    sr_tile_size: Optional[int] = 256,
+    sr_threads: Optional[int] = None,
+) -> WaveletSharpener:
+    """Upscale an image and cache its color calibration and wavelet layers for repeated sharpening."""
+    if scaling_factor > 1:
+        image = images_sr(image, scaling_factor, tile_size=sr_tile_size, num_threads=sr_threads)
+    return WaveletSharpener(image, levels)
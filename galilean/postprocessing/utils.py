@@ -1,6 +1,23 @@
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
 import cv2
 import numpy as np
 
+from profiling.handler import profiled
+
+LAPLACIAN_KERNEL = np.array([[0, 1, 0],
+                             [1, -4, 1],
+                             [0, 1, 0]])
+
+_sr_models: Dict[Tuple[str, int], "cv2.dnn_superres.DnnSuperResImpl"] = {}
+# A model runs one image at a time, so threads sharing a cached model take turns.
+_sr_locks: Dict[Tuple[str, int], threading.Lock] = {}
+_sr_models_lock = threading.Lock()
+# The OpenCV thread count is process-wide, so only one caller changes it at a time.
+_num_threads_lock = threading.Lock()
+
 
 def calibrate_color(image: np.ndarray) -> np.ndarray:
     """Performs auto color correction using Gray World Assumption"""
@@ -14,17 +31,110 @@ def calibrate_color(image: np.ndarray) -> np.ndarray:
 
 def laplacian_sharpen(image: np.ndarray, sharpening_factor: float = 1.5) -> np.ndarray:
     """Enhances image details using Laplacian sharpening with configurable intensity."""
-    kernel = np.array([[0, 1, 0],
-                       [1, -4, 1],
-                       [0, 1, 0]])
-    
-    laplacian_image = cv2.filter2D(src=image, ddepth=-1, kernel=kernel)
+    laplacian_image = cv2.filter2D(src=image, ddepth=-1, kernel=LAPLACIAN_KERNEL)
     return image + sharpening_factor * laplacian_image
 
-def images_sr(image: np.ndarray, scaling_factor: int = 2) -> np.ndarray:
-    sr_model = cv2.dnn_superres.DnnSuperResImpl_create()
-    model_path = f"models/EDSR_x{scaling_factor}.pb"
-    sr_model.readModel(model_path)
-    sr_model.setModel("edsr", scaling_factor)
-    scaled_image = sr_model.upsample(image)
-    return scaled_image
+def get_sr_model(scaling_factor: int = 2, model_name: str = "edsr") -> "cv2.dnn_superres.DnnSuperResImpl":
+    """Load a super resolution model once per process and reuse it for every later call."""
+    key = (model_name, scaling_factor)
+    with _sr_models_lock:
+        if key not in _sr_models:
+            sr_model = cv2.dnn_superres.DnnSuperResImpl_create()
+            model_path = f"models/{model_name.upper()}_x{scaling_factor}.pb"
+            sr_model.readModel(model_path)
+            sr_model.setModel(model_name, scaling_factor)
+            _sr_models[key] = sr_model
+            _sr_locks[key] = threading.Lock()
+    return _sr_models[key]
+
+def locked_upsample(scaling_factor: int, model_name: str = "edsr") -> Callable[[np.ndarray], np.ndarray]:
+    """Upsample function of the cached model that is safe to call from several threads."""
+    sr_model = get_sr_model(scaling_factor, model_name)
+    lock = _sr_locks[(model_name, scaling_factor)]
+
+    def upsample(image: np.ndarray) -> np.ndarray:
+        with lock:
+            return sr_model.upsample(image)
+    return upsample
+
+@contextmanager
+def opencv_threads(num_threads: Optional[int] = None) -> Iterator[None]:
+    """Run a block with num_threads OpenCV threads, restoring the previous count afterwards.
+
+    Other threads running OpenCV meanwhile share the temporary count.
+    """
+    if num_threads is None:
+        yield
+        return
+    with _num_threads_lock:
+        previous = cv2.getNumThreads()
+        cv2.setNumThreads(num_threads)
+        try:
+            yield
+        finally:
+            cv2.setNumThreads(previous)
+
+def upsample_tiled(
+    image: np.ndarray,
+    upsample: Callable[[np.ndarray], np.ndarray],
+    scaling_factor: int,
+    tile_size: int = 256,
+    overlap: int = 16,
+) -> np.ndarray:
+    """Upsample an image tile by tile, feathering overlapping tiles so no seams are visible.
+
+    Only one tile is passed through the model at a time, which bounds its peak memory.
+    """
+    h, w = image.shape[:2]
+    if max(h, w) <= tile_size:
+        return upsample(image)
+
+    overlap = min(overlap, tile_size // 2)
+    stride = tile_size - overlap
+    accumulated = np.zeros((h * scaling_factor, w * scaling_factor) + image.shape[2:], dtype=np.float32)
+    weights = np.zeros((h * scaling_factor, w * scaling_factor), dtype=np.float32)
+
+    def ramp(length: int, start_open: bool, end_open: bool) -> np.ndarray:
+        profile = np.ones(length, dtype=np.float32)
+        fade = max(overlap * scaling_factor, 1)
+        edge = (np.arange(min(fade, length), dtype=np.float32) + 1) / (fade + 1)
+        if start_open:
+            profile[:len(edge)] = np.minimum(profile[:len(edge)], edge)
+        if end_open:
+            profile[length - len(edge):] = np.minimum(profile[length - len(edge):], edge[::-1])
+        return profile
+
+    for y in range(0, max(h - overlap, 1), stride):
+        for x in range(0, max(w - overlap, 1), stride):
+            y0, x0 = min(y, max(h - tile_size, 0)), min(x, max(w - tile_size, 0))
+            tile = image[y0:y0 + tile_size, x0:x0 + tile_size]
+            upsampled = upsample(tile).astype(np.float32)
+            th, tw = upsampled.shape[:2]
+            weight = np.outer(ramp(th, y0 > 0, y0 + tile.shape[0] < h), ramp(tw, x0 > 0, x0 + tile.shape[1] < w))
+            oy, ox = y0 * scaling_factor, x0 * scaling_factor
+            accumulated[oy:oy + th, ox:ox + tw] += upsampled * (weight[..., None] if upsampled.ndim == 3 else weight)
+            weights[oy:oy + th, ox:ox + tw] += weight
+
+    if accumulated.ndim == 3:
+        weights = weights[..., None]
+    return np.clip(accumulated / weights + 0.5, 0, 255).astype(image.dtype)
+
+@profiled("super_resolution")
+def images_sr(
+    image: np.ndarray,
+    scaling_factor: int = 2,
+    tile_size: Optional[int] = 256,
+    overlap: int = 16,
+    num_threads: Optional[int] = None,
+) -> np.ndarray:
+    """Upscale an image with the cached EDSR model, in overlapping tiles unless tile_size is None.
+
+    The image is converted to 8 bits either way, and with num_threads the model runs on that
+    many OpenCV threads.
+    """
+    upsample = locked_upsample(scaling_factor)
+    image = image.astype(np.uint8)
+    with opencv_threads(num_threads):
+        if tile_size is None:
+            return upsample(image)
+        return upsample_tiled(image, upsample, scaling_factor, tile_size, overlap)
@@ -0,0 +1,77 @@
+import os
+import time
+from typing import Iterator, List, NamedTuple, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from detect_and_crop.handler import crop_around, find_centroid
+from evaluate_and_align.aligners import create_aligner
+from evaluate_and_align.utils import compute_proxy_sharpness, top_k_mask
+from image_stacking.handler import image_stacking
+from postprocessing.handler import postprocessing
+from preview.utils import PREVIEW_FILE, sample_passes, save_image_atomically
+from video_reader.handler import seek_frames
+from video_reader.utils import probe_video
+
+
+class PreviewUpdate(NamedTuple):
+    """One refinement of the preview image."""
+    path: str
+    sampled: int
+    stacked: int
+    frame_count: int
+    elapsed: float
+
+
+def preview_crop(frame: np.ndarray, crop_size: int, scale: float) -> Optional[np.ndarray]:
+    """Downscale a frame and crop around its object, or None when no object is detected."""
+    small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    try:
+        centroid = find_centroid(small)
+    except Exception:
+        return None
+    return crop_around(small, centroid, max(1, round(crop_size * scale)))
+
+def run_preview(
+    selected_files: List[str],
+    crop_size: int,
+    output_dir: str,
+    threshold: float = 0.5,
+    sharpening_factor: float = 1.2,
+    scale: float = 0.5,
+    first_frames: int = 16,
+    max_frames: int = 256,
+    wavelet_gains: Optional[Sequence[float]] = None,
+) -> Iterator[PreviewUpdate]:
+    """Stack a growing strided sample of the capture at reduced resolution, yielding after each refinement.
+
+    Frames are reached by seeking, scored by a proxy sharpness and aligned by phase correlation to
+    the sharpest frame of the first pass, which is kept as reference so that earlier frames never
+    need realigning. After every pass the threshold fraction of the sharpest sampled frames is
+    mean stacked, post-processed without super resolution and written atomically to one file.
+    """
+    frame_counts = [probe_video(video).frame_count for video in selected_files]
+    frame_count = sum(frame_counts)
+    path = os.path.join(output_dir, PREVIEW_FILE)
+    started = time.perf_counter()
+    crops: List[np.ndarray] = []
+    aligned: List[np.ndarray] = []
+    sharpness: List[float] = []
+    aligner = None
+    for indices in sample_passes(frame_count, first_frames, max_frames):
+        for _, frame in seek_frames(selected_files, indices, frame_counts):
+            cropped = preview_crop(frame, crop_size, scale)
+            if cropped is not None:
+                crops.append(cropped)
+                sharpness.append(compute_proxy_sharpness(cropped[None], factor=1)[0])
+        if not crops:
+            continue
+        if aligner is None:
+            aligner = create_aligner("fft", crops[int(np.argmax(sharpness))])
+        aligned += [aligner.align(cropped)[0] for cropped in crops[len(aligned):]]
+
+        keep = np.flatnonzero(top_k_mask(np.array(sharpness), max(1, int(len(sharpness) * threshold))))
+        stacked_image = image_stacking([aligned[index] for index in keep], "mean")
+        save_image_atomically(path, postprocessing(stacked_image, sharpening_factor, 1, wavelet_gains=wavelet_gains))
+        yield PreviewUpdate(path, len(crops), len(keep), frame_count, time.perf_counter() - started)
@@ -0,0 +1,40 @@
+import os
+from typing import List
+
+import cv2
+import numpy as np
+
+PREVIEW_FILE = "preview.png"
+
+
+def sample_passes(frame_count: int, first_frames: int = 16, max_frames: int = 256) -> List[List[int]]:
+    """Frame indices of successive preview passes, each halving the stride of the passes before it.
+
+    The first pass takes about first_frames evenly strided frames and every later pass falls
+    halfway between the frames already taken, so the sample stays spread over the whole capture
+    however many passes have run. At most max_frames frames are taken in total.
+    """
+    stride = 1
+    while stride * first_frames < frame_count:
+        stride *= 2
+    passes = [list(range(0, frame_count, stride))]
+    total = len(passes[0])
+    while stride > 1 and total < max_frames:
+        indices = list(range(stride // 2, frame_count, stride))
+        remaining = max_frames - total
+        if len(indices) > remaining:
+            indices = indices[::-(-len(indices) // remaining)]
+        passes.append(indices)
+        total += len(indices)
+        stride //= 2
+    return passes
+
+def save_image_atomically(path: str, image: np.ndarray) -> None:
+    """Write an image as 8-bit through a temporary file, so a viewer watching the path never reads a partial image."""
+    ok, encoded = cv2.imencode(os.path.splitext(path)[1], image.astype(np.uint8))
+    if not ok:
+        raise OSError(f"Failed to encode image for: {path}")
+    temporary_path = f"{path}.partial"
+    with open(temporary_path, "wb") as file:
+        file.write(encoded.tobytes())
+    os.replace(temporary_path, path)
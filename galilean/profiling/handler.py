@@ -0,0 +1,48 @@
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Iterator, Optional
+
+from profiling.utils import Profiler
+
+_profiler: Optional[Profiler] = None
+
+
+def start_profiling() -> Profiler:
+    """Start recording spans in this process and return the profiler collecting them."""
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+def stop_profiling() -> Optional[Profiler]:
+    """Stop recording spans and return the profiler that collected them, if any."""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+@contextmanager
+def span(name: str, frames: int = 0) -> Iterator[None]:
+    """Record the wall and CPU time of a block, which costs a single check when profiling is off."""
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+        profiler.record(name, started, wall, cpu, frames)
+
+def profiled(name: str, frames: Optional[Callable[..., int]] = None) -> Callable:
+    """Decorate a function so each call is recorded as a span, counting frames from its arguments."""
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return function(*args, **kwargs)
+            with span(name, frames(*args, **kwargs) if frames else 0):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
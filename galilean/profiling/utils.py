@@ -0,0 +1,81 @@
+import json
+import os
+import resource
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple
+
+
+class Span(NamedTuple):
+    """One timed block: start relative to the profiler origin, wall and CPU time in seconds."""
+    name: str
+    start: float
+    wall: float
+    cpu: float
+    frames: int
+    max_rss_mb: float
+    thread: int
+
+
+def max_rss_mb() -> float:
+    """High-water mark of the resident memory of this process, in MiB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+class Profiler:
+    """Collects spans from any thread and exports them as a summary or a Chrome trace."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans: List[Span] = []
+        self._threads: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, started: float, wall: float, cpu: float, frames: int) -> None:
+        with self._lock:
+            thread = self._threads.setdefault(threading.get_ident(), len(self._threads))
+            self.spans.append(Span(name, started - self.origin, wall, cpu, frames, max_rss_mb(), thread))
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Totals per span name, in order of first appearance."""
+        stages: Dict[str, Dict[str, Any]] = {}
+        for span in self.spans:
+            stage = stages.setdefault(span.name, {
+                "name": span.name, "calls": 0, "wall": 0.0, "cpu": 0.0, "frames": 0, "max_rss_mb": 0.0,
+            })
+            stage["calls"] += 1
+            stage["wall"] += span.wall
+            stage["cpu"] += span.cpu
+            stage["frames"] += span.frames
+            stage["max_rss_mb"] = max(stage["max_rss_mb"], span.max_rss_mb)
+        for stage in stages.values():
+            stage["fps"] = stage["frames"] / stage["wall"] if stage["frames"] and stage["wall"] > 0 else None
+        return list(stages.values())
+
+    def trace_events(self) -> List[Dict[str, Any]]:
+        """Spans as Chrome trace-event complete events, plus a resident memory counter track."""
+        pid = os.getpid()
+        events = []
+        for span in self.spans:
+            events.append({
+                "name": span.name, "cat": "galilean", "ph": "X", "pid": pid, "tid": span.thread,
+                "ts": span.start * 1e6, "dur": span.wall * 1e6,
+                "args": {"cpu_ms": span.cpu * 1e3, "frames": span.frames},
+            })
+            events.append({
+                "name": "max_rss_mb", "ph": "C", "pid": pid, "ts": (span.start + span.wall) * 1e6,
+                "args": {"max_rss_mb": span.max_rss_mb},
+            })
+        return events
+
+
+def write_trace(path: str, profiler: Profiler) -> None:
+    """Write a Chrome trace-event file for chrome://tracing or Perfetto, with the per-stage summary."""
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump({
+            "traceEvents": profiler.trace_events(),
+            "displayTimeUnit": "ms",
+            "summary": profiler.summary(),
+        }, file)
+    os.replace(temporary_path, path)
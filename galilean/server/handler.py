@@ -0,0 +1,190 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from pipeline.handler import Pipeline
+from pipeline.utils import BatchJob, parse_job
+from server.utils import (HttpError, Request, encode_event, encode_head,
+                          encode_json_response, parse_json_body,
+                          read_request, remove_stale_socket, split_path)
+
+FINISHED = ("ok", "failed")
+
+
+@dataclass
+class ServerJob:
+    """A job submitted to the server, with every event it has published so far."""
+    id: int
+    job: BatchJob
+    output_dir: str
+    status: str = "queued"
+    submitted: str = field(default_factory=lambda: datetime.now().isoformat(timespec="seconds"))
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    entry: Optional[Dict[str, Any]] = None
+    updated: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def summary(self, full: bool = False) -> Dict[str, Any]:
+        summary = {
+            "id": self.id, "status": self.status, "submitted": self.submitted,
+            "videos": self.job.videos, "output_dir": self.output_dir,
+        }
+        if self.entry is not None:
+            summary["outputs"] = self.entry.get("outputs")
+            summary["error"] = self.entry.get("error")
+            if full:
+                summary["result"] = self.entry
+        if full:
+            summary["parameters"] = asdict(self.job)
+        return summary
+
+
+class JobServer:
+    """Local HTTP job server running captures through one warm Pipeline.
+
+    Jobs are queued and run at most concurrency at a time on threads of this process, so imports,
+    super resolution models and worker processes are shared by every job. Endpoints:
+
+    POST /jobs                  submit a job (the batch job keys, plus an optional output_dir)
+    GET  /jobs                  list the jobs
+    GET  /jobs/<id>             status, parameters, outputs and manifest entry of one job
+    GET  /jobs/<id>/events      stream the job's events as JSON lines until it finishes
+    GET  /health                queue and running counts
+    """
+
+    def __init__(self, pipeline: Pipeline, output_dir: str = "out", concurrency: int = 1):
+        self.pipeline = pipeline
+        self.output_dir = output_dir
+        self.concurrency = concurrency
+        self.jobs: Dict[int, ServerJob] = {}
+        self.queue: "asyncio.Queue[ServerJob]" = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="galilean-job")
+        self._workers: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def publish(self, job: ServerJob, event: Dict[str, Any]) -> None:
+        """Record an event of a job and wake its listeners; only call from the event loop."""
+        job.events.append({"job": job.id, **event})
+        job.updated.set()
+        job.updated = asyncio.Event()
+
+    def submit(self, job: BatchJob, output_dir: Optional[str] = None) -> ServerJob:
+        server_job = ServerJob(len(self.jobs) + 1, job, output_dir or self.output_dir)
+        self.jobs[server_job.id] = server_job
+        self.publish(server_job, {"event": "queued", "position": self.queue.qsize()})
+        self.queue.put_nowait(server_job)
+        return server_job
+
+    async def _run_jobs(self) -> None:
+        while True:
+            job = await self.queue.get()
+            job.status = "running"
+            self.publish(job, {"event": "started"})
+            name = os.path.splitext(os.path.basename(job.job.videos[0]))[0]
+            prefix = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{job.id:04d}_{name}"
+
+            def on_event(event: Dict[str, Any], job: ServerJob = job) -> None:
+                self._loop.call_soon_threadsafe(self.publish, job, event)
+
+            try:
+                entry = await self._loop.run_in_executor(
+                    self.executor, self.pipeline.run, job.job, job.output_dir, prefix, on_event
+                )
+            except Exception as error:
+                entry = {"status": "failed", "error": f"{type(error).__name__}: {error}"}
+            job.entry = entry
+            job.status = entry["status"]
+            self.publish(job, {
+                "event": "finished", "status": job.status,
+                "outputs": entry.get("outputs"), "error": entry.get("error"),
+            })
+            self.queue.task_done()
+
+    async def _stream_events(self, job: ServerJob, writer: asyncio.StreamWriter) -> None:
+        writer.write(encode_head(200, "application/x-ndjson"))
+        sent = 0
+        while True:
+            updated = job.updated
+            for event in job.events[sent:]:
+                writer.write(encode_event(event))
+            sent = len(job.events)
+            await writer.drain()
+            if job.status in FINISHED:
+                return
+            await updated.wait()
+
+    async def _route(self, request: Request, writer: asyncio.StreamWriter) -> None:
+        parts = split_path(request.path)
+        if parts == ("health",) and request.method == "GET":
+            running = sum(job.status == "running" for job in self.jobs.values())
+            writer.write(encode_json_response(200, {"status": "ok", "queued": self.queue.qsize(), "running": running}))
+        elif parts == ("jobs",) and request.method == "GET":
+            writer.write(encode_json_response(200, [job.summary() for job in self.jobs.values()]))
+        elif parts == ("jobs",) and request.method == "POST":
+            data = parse_json_body(request)
+            if not isinstance(data, dict):
+                raise HttpError(400, "A job must be a JSON object")
+            output_dir = data.pop("output_dir", None)
+            try:
+                job = parse_job(data, {}, os.getcwd())
+            except (TypeError, ValueError) as error:
+                raise HttpError(400, str(error)) from None
+            missing = [video for video in job.videos if not os.path.exists(video)]
+            if missing:
+                raise HttpError(400, f"Videos not found: {', '.join(missing)}")
+            writer.write(encode_json_response(202, self.submit(job, output_dir).summary()))
+        elif len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.jobs.get(int(parts[1])) if parts[1].isdigit() else None
+            if job is None:
+                raise HttpError(404, f"No job {parts[1]}")
+            if request.method != "GET":
+                raise HttpError(405, f"{request.method} is not allowed here")
+            if len(parts) == 2:
+                writer.write(encode_json_response(200, job.summary(full=True)))
+            elif parts[2] == "events":
+                await self._stream_events(job, writer)
+            else:
+                raise HttpError(404, f"No resource {request.path}")
+        else:
+            raise HttpError(404, f"No resource {request.method} {request.path}")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await read_request(reader)
+            if request is not None:
+                await self._route(request, writer)
+        except HttpError as error:
+            writer.write(encode_json_response(error.status, {"error": str(error)}))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            try:
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765, socket_path: Optional[str] = None,
+                    on_ready: Optional[Callable[[asyncio.AbstractServer], None]] = None) -> None:
+        """Accept jobs on a Unix socket when socket_path is given, else on host:port, until cancelled."""
+        self._loop = asyncio.get_running_loop()
+        self._workers = [asyncio.create_task(self._run_jobs()) for _ in range(self.concurrency)]
+        if socket_path:
+            remove_stale_socket(socket_path)
+            server = await asyncio.start_unix_server(self.handle_connection, path=socket_path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        try:
+            async with server:
+                if on_ready is not None:
+                    on_ready(server)
+                await server.serve_forever()
+        finally:
+            for worker in self._workers:
+                worker.cancel()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            if socket_path and os.path.exists(socket_path):
+                os.remove(socket_path)
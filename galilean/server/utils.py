@@ -0,0 +1,100 @@
+import asyncio
+import json
+import os
+import socket
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+MAX_BODY_BYTES = 1 << 20
+MAX_HEADER_LINES = 100
+
+STATUS_TEXT = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+}
+
+
+class Request(NamedTuple):
+    """A parsed HTTP request."""
+    method: str
+    path: str
+    body: bytes
+
+
+class HttpError(Exception):
+    """An error answered with an HTTP status and a JSON message."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    """Read one HTTP/1.x request, or None when the client closed the connection without one."""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line") from None
+
+    headers: Dict[str, str] = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise HttpError(400, "Too many headers")
+
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HttpError(400, "Invalid Content-Length") from None
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, f"Request body over {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length > 0 else b""
+    return Request(method.upper(), target.split("?", 1)[0].rstrip("/") or "/", body)
+
+def parse_json_body(request: Request) -> Any:
+    try:
+        return json.loads(request.body or b"{}")
+    except ValueError as error:
+        raise HttpError(400, f"Invalid JSON body: {error}") from None
+
+def encode_head(status: int, content_type: str, length: Optional[int] = None) -> bytes:
+    """Status line and headers of a response; without a length the body ends when the connection closes."""
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}", f"Content-Type: {content_type}", "Connection: close"]
+    if length is not None:
+        lines.append(f"Content-Length: {length}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+def encode_json_response(status: int, payload: Any) -> bytes:
+    body = json.dumps(payload).encode()
+    return encode_head(status, "application/json", len(body)) + body
+
+def encode_event(event: Dict[str, Any]) -> bytes:
+    """One line of a newline-delimited JSON event stream."""
+    return (json.dumps(event) + "\n").encode()
+
+def split_path(path: str) -> Tuple[str, ...]:
+    return tuple(part for part in path.split("/") if part)
+
+def remove_stale_socket(path: str) -> None:
+    """Remove a Unix socket file left behind by a server that was killed, refusing if one still listens on it."""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+    raise OSError(f"A server is already listening on {path}")
@@ -0,0 +1,239 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from detect_and_crop.handler import crop_around, find_centroid
+from detect_and_crop.tracking import CentroidTracker
+from evaluate_and_align.aligners import create_aligner
+from evaluate_and_align.utils import compute_image_metrics, rank_images, score_metrics
+from image_stacking.accumulators import HistogramAccumulator
+from parallel.utils import init_worker
+from profiling.handler import profiled, span
+from sharding.utils import (PartialStatistics, ShardedJob, batch_frames,
+                            job_key, load_job, partial_path, plan_path,
+                            read_json, reference_path, remove_stale_artifacts,
+                            rows_per_strip, save_arrays, save_job, score_path,
+                            split_shards, write_json)
+from video_reader.handler import read_frame_range, read_selected_frames
+from video_reader.utils import probe_video
+
+
+def init_sharded_job(
+    work_dir: str,
+    videos: List[str],
+    crop_size: int,
+    threshold: float,
+    method: str,
+    align: str = "ecc",
+    tracking: bool = False,
+    chunk_frames: Optional[int] = None,
+) -> ShardedJob:
+    """Split the videos into shards and write the manifest that every worker reads.
+
+    Outputs left in the work directory by a different manifest are deleted, while those of the
+    same manifest are kept, so re-running init on an interrupted run resumes it.
+    """
+    frame_counts = [probe_video(video).frame_count for video in videos]
+    shards = split_shards([os.path.abspath(video) for video in videos], frame_counts, chunk_frames)
+    job = ShardedJob(shards, crop_size, threshold, method, align, tracking)
+    job.key = job_key(job)
+    remove_stale_artifacts(work_dir, job.key)
+    save_job(work_dir, job)
+    return job
+
+def shard_frame_counts(job: ShardedJob) -> List[int]:
+    """Number of frames of every shard, probing each video whose last shard reads to the end."""
+    frame_counts = {video: probe_video(video).frame_count for video in {shard.video for shard in job.shards}}
+    counts = []
+    for shard in job.shards:
+        stop = frame_counts[shard.video] if shard.stop is None else min(shard.stop, frame_counts[shard.video])
+        counts.append(max(0, stop - shard.start))
+    return counts
+
+@profiled("score_shard")
+def score_shard(work_dir: str, index: int) -> int:
+    """Map step one: keep the raw quality metrics and centroid of every frame of a shard."""
+    job = load_job(work_dir)
+    shard = job.shards[index]
+    tracker = CentroidTracker() if job.tracking else None
+    metrics = []
+    centroids = []
+    for frame in read_frame_range(shard.video, shard.start, shard.stop, seek=True):
+        with span("detect_and_crop", 1):
+            centroid = find_centroid(frame) if tracker is None else tracker.update(frame)
+            cropped = crop_around(frame, centroid, job.crop_size)
+        with span("evaluate_image_quality", 1):
+            metrics.append(compute_image_metrics(cropped))
+        centroids.append(centroid)
+    save_arrays(
+        score_path(work_dir, job, index),
+        metrics=np.array(metrics, dtype=np.float64),
+        centroids=np.array(centroids, dtype=np.int64).reshape(-1, 2),
+    )
+    return len(metrics)
+
+def load_plan(work_dir: str, job: Optional[ShardedJob] = None) -> Dict[str, Any]:
+    """Load the global selection and reference frame, building them once every shard is scored.
+
+    Scores are normalized over all shards and the best frame of the whole capture becomes the
+    shared alignment reference. Building is deterministic, so workers that race to build the
+    plan all write the same files.
+    """
+    job = job or load_job(work_dir)
+    plan_file = plan_path(work_dir, job)
+    if os.path.exists(plan_file):
+        return read_json(plan_file)
+
+    missing = [index for index in range(len(job.shards)) if not os.path.exists(score_path(work_dir, job, index))]
+    if missing:
+        raise FileNotFoundError(f"Shards not scored yet: {', '.join(map(str, missing))}")
+    scored = [np.load(score_path(work_dir, job, index)) for index in range(len(job.shards))]
+    counts = [len(score["centroids"]) for score in scored]
+    if not sum(counts):
+        raise ValueError("No frames were decoded from the sharded videos")
+
+    metrics = np.concatenate([score["metrics"] for score, count in zip(scored, counts) if count])
+    scores, avg_quality = score_metrics(metrics)
+    best_index, top_images_mask = rank_images(scores, job.threshold)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    selected = [np.flatnonzero(top_images_mask[offsets[index]:offsets[index + 1]]).tolist()
+                for index in range(len(job.shards))]
+
+    best_shard = int(np.searchsorted(offsets, best_index, side="right")) - 1
+    position = int(best_index - offsets[best_shard])
+    shard = job.shards[best_shard]
+    _, frame = next(read_selected_frames([shard.video], [shard.start + position], seek=True))
+    reference = crop_around(frame, tuple(scored[best_shard]["centroids"][position]), job.crop_size)
+    save_arrays(reference_path(work_dir, job), reference=reference)
+
+    plan = {
+        "best_index": int(best_index),
+        "best_score": float(scores[best_index]),
+        "avg_quality": float(avg_quality),
+        "frame_count": int(sum(counts)),
+        "strip_rows": rows_per_strip(reference.shape),
+        "selected": selected,
+    }
+    write_json(plan_file, plan)
+    return plan
+
+@profiled("stack_shard")
+def stack_shard(work_dir: str, index: int, prefetch: int = 0) -> int:
+    """Map step two: align the selected frames of a shard to the reference and reduce them to partial statistics.
+
+    Aligned frames are pushed to the statistics in batches, so a shard never holds its whole stack.
+    """
+    job = load_job(work_dir)
+    plan = load_plan(work_dir, job)
+    shard = job.shards[index]
+    positions = plan["selected"][index]
+    centroids = np.load(score_path(work_dir, job, index))["centroids"]
+    reference = np.load(reference_path(work_dir, job))["reference"]
+
+    aligner = create_aligner(job.align, reference)
+    statistics = PartialStatistics(reference.shape, job.method != "mean", plan["strip_rows"], len(positions))
+    batch = np.empty((batch_frames(reference.shape),) + reference.shape, dtype=reference.dtype)
+    residuals = np.zeros(len(positions))
+    warp_matrices = np.zeros((len(positions), 2, 3), dtype=np.float32)
+    frames = read_selected_frames([shard.video], [shard.start + position for position in positions], prefetch, seek=True)
+    count = 0
+    for frame_index, frame in frames:
+        with span("align", 1):
+            cropped = crop_around(frame, tuple(centroids[frame_index - shard.start]), job.crop_size)
+            batch[count % len(batch)], warp_matrices[count], residuals[count] = aligner.align(cropped)
+        count += 1
+        if count % len(batch) == 0:
+            with span("partial_statistics", len(batch)):
+                statistics.push_batch(batch)
+    if count % len(batch):
+        with span("partial_statistics", count % len(batch)):
+            statistics.push_batch(batch[:count % len(batch)])
+
+    save_arrays(
+        partial_path(work_dir, job, index), residuals=residuals[:count], warp_matrices=warp_matrices[:count],
+        **statistics.arrays()
+    )
+    return count
+
+@profiled("reduce_shards")
+def reduce_shards(work_dir: str, method: Optional[str] = None, kappa: float = 3.0) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Reduce step: merge the partial statistics of every shard into the stacked image.
+
+    Histograms are merged one row strip at a time, so memory does not grow with the number of
+    shards. Returns the stacked image and a summary of the run.
+    """
+    job = load_job(work_dir)
+    plan = load_plan(work_dir, job)
+    method = method or job.method
+    missing = [index for index in range(len(job.shards)) if not os.path.exists(partial_path(work_dir, job, index))]
+    if missing:
+        raise FileNotFoundError(f"Shards not stacked yet: {', '.join(map(str, missing))}")
+
+    partials = [np.load(partial_path(work_dir, job, index)) for index in range(len(job.shards))]
+    partials = [partial for partial in partials if int(partial["count"])]
+    if method != "mean" and not all("counts_0" in partial for partial in partials):
+        raise ValueError(f"Stacking method {method} needs histograms, but the shards were stacked for the mean")
+    counts = [int(partial["count"]) for partial in partials]
+    totals = [partial["total"] for partial in partials]
+    totals_sq = [partial["total_sq"] for partial in partials]
+    total = np.sum(totals, axis=0, dtype=np.uint64)
+
+    if method == "mean":
+        stacked = (total / sum(counts)).astype(np.float32)
+    else:
+        stacked = np.empty(total.shape, dtype=np.float32)
+        strip_rows = plan["strip_rows"]
+        for strip, row in enumerate(range(0, total.shape[0], strip_rows)):
+            rows = slice(row, row + strip_rows)
+            accumulator = HistogramAccumulator(total[rows].shape)
+            for partial, count, partial_total, partial_total_sq in zip(partials, counts, totals, totals_sq):
+                accumulator.add_counts(partial[f"counts_{strip}"], count, partial_total[rows], partial_total_sq[rows])
+            stacked[rows] = accumulator.reduce(method, kappa)
+
+    residuals = np.concatenate([partial["residuals"] for partial in partials])
+    summary = {
+        "best_index": plan["best_index"],
+        "best_score": plan["best_score"],
+        "avg_quality": plan["avg_quality"],
+        "frame_count": plan["frame_count"],
+        "stacked_count": sum(counts),
+        "shard_count": len(job.shards),
+        "residuals": residuals,
+    }
+    return stacked, summary
+
+MAP_STEPS: Dict[str, Tuple[Callable[..., int], Callable[[str, ShardedJob, int], str]]] = {
+    "score": (score_shard, score_path),
+    "stack": (stack_shard, partial_path),
+}
+
+def pending_shards(work_dir: str, stage: str) -> List[int]:
+    """Shards whose output of a map step does not exist yet."""
+    output_path = MAP_STEPS[stage][1]
+    job = load_job(work_dir)
+    return [index for index in range(len(job.shards)) if not os.path.exists(output_path(work_dir, job, index))]
+
+def run_shards(
+    work_dir: str,
+    stage: str,
+    indices: List[int],
+    workers: int = 1,
+    on_done: Optional[Callable[[int, int], None]] = None,
+    **kwargs,
+) -> None:
+    """Run the score or stack map step on the given shards, in this process or on a process pool."""
+    step = MAP_STEPS[stage][0]
+    if workers <= 1 or len(indices) <= 1:
+        for index in indices:
+            done = step(work_dir, index, **kwargs)
+            if on_done is not None:
+                on_done(index, done)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(indices)), initializer=init_worker) as pool:
+        futures = {pool.submit(step, work_dir, index, **kwargs): index for index in indices}
+        for future in as_completed(futures):
+            done = future.result()
+            if on_done is not None:
+                on_done(futures[future], done)
@@ -0,0 +1,170 @@
+import fnmatch
+import hashlib
+import json
+import os
+import socket
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from image_stacking.accumulators import HistogramAccumulator, counts_dtype
+
+MANIFEST_FILE = "shards.json"
+# Files a run writes next to the manifest, including their temporary files while being written.
+ARTIFACT_PATTERNS = ("score_*", "partial_*", "plan*.json*", "reference*.npz*")
+
+# Histogram bins per row strip of the partial statistics, and frames counted at once into them.
+STRIP_BINS = 1 << 23
+BATCH_SIZE = 256
+BATCH_BYTES = 64 << 20
+
+
+@dataclass
+class Shard:
+    """A range of frames of one video, processed by one worker; stop None reads to the end."""
+    video: str
+    start: int = 0
+    stop: Optional[int] = None
+
+
+@dataclass
+class ShardedJob:
+    """One capture split into shards, with the parameters every worker must agree on."""
+    shards: List[Shard]
+    crop_size: int
+    threshold: float = 0.9
+    method: str = "mean_with_median_clipping"
+    align: str = "ecc"
+    tracking: bool = False
+    key: str = ""
+
+
+def split_shards(videos: List[str], frame_counts: List[int], chunk_frames: Optional[int] = None) -> List[Shard]:
+    """One shard per video, or chunks of at most chunk_frames frames; each last chunk reads to the end."""
+    shards = []
+    for video, frame_count in zip(videos, frame_counts):
+        if not chunk_frames or frame_count <= chunk_frames:
+            shards.append(Shard(video))
+            continue
+        starts = list(range(0, frame_count, chunk_frames))
+        shards += [Shard(video, start, start + chunk_frames) for start in starts[:-1]]
+        shards.append(Shard(video, starts[-1]))
+    return shards
+
+def job_key(job: ShardedJob) -> str:
+    """Hash of the manifest and of the size and modification time of its videos.
+
+    Every file a run writes is named after it, so outputs of another capture or of a video
+    re-recorded under the same path are never mistaken for this run's.
+    """
+    data = asdict(job)
+    data.pop("key")
+    sources = sorted({shard.video for shard in job.shards})
+    data["sources"] = [(video, os.stat(video).st_size, os.stat(video).st_mtime_ns) for video in sources]
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()[:12]
+
+def remove_stale_artifacts(work_dir: str, key: str) -> List[str]:
+    """Delete the files written for any manifest other than the one with this key, returning their names."""
+    if not os.path.isdir(work_dir):
+        return []
+    current = (f"score_{key}_", f"partial_{key}_", f"plan_{key}.", f"reference_{key}.")
+    stale = [
+        name for name in sorted(os.listdir(work_dir))
+        if any(fnmatch.fnmatch(name, pattern) for pattern in ARTIFACT_PATTERNS) and not name.startswith(current)
+    ]
+    for name in stale:
+        os.remove(os.path.join(work_dir, name))
+    return stale
+
+def save_job(work_dir: str, job: ShardedJob) -> None:
+    """Write the shard manifest that every step of a sharded run reads."""
+    os.makedirs(work_dir, exist_ok=True)
+    write_json(os.path.join(work_dir, MANIFEST_FILE), asdict(job))
+
+def load_job(work_dir: str) -> ShardedJob:
+    """Read the shard manifest of a work directory."""
+    path = os.path.join(work_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No shard manifest in {work_dir}; run 'shard init' first")
+    data = read_json(path)
+    data["shards"] = [Shard(**shard) for shard in data["shards"]]
+    return ShardedJob(**data)
+
+def score_path(work_dir: str, job: ShardedJob, index: int) -> str:
+    return os.path.join(work_dir, f"score_{job.key}_{index:04d}.npz")
+
+def partial_path(work_dir: str, job: ShardedJob, index: int) -> str:
+    return os.path.join(work_dir, f"partial_{job.key}_{index:04d}.npz")
+
+def plan_path(work_dir: str, job: ShardedJob) -> str:
+    return os.path.join(work_dir, f"plan_{job.key}.json")
+
+def reference_path(work_dir: str, job: ShardedJob) -> str:
+    return os.path.join(work_dir, f"reference_{job.key}.npz")
+
+def _partial_path(path: str) -> str:
+    # Unique per writer, since workers on several machines may write the same file at once.
+    return f"{path}.{socket.gethostname()}.{os.getpid()}.partial"
+
+def read_json(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+def write_json(path: str, data: dict) -> None:
+    """Write JSON atomically, so readers on other machines never see a partial file."""
+    temporary_path = _partial_path(path)
+    with open(temporary_path, "w") as file:
+        json.dump(data, file, indent=2)
+    os.replace(temporary_path, path)
+
+def save_arrays(path: str, **arrays: np.ndarray) -> None:
+    """Write compressed arrays atomically; the file only appears once it is complete."""
+    temporary_path = _partial_path(path)
+    with open(temporary_path, "wb") as file:
+        np.savez_compressed(file, **arrays)
+    os.replace(temporary_path, path)
+
+def rows_per_strip(shape: tuple) -> int:
+    """Rows of a frame of this shape whose histograms fit in STRIP_BINS."""
+    return max(1, STRIP_BINS // (int(np.prod(shape[1:])) * 256))
+
+def batch_frames(shape: tuple) -> int:
+    """Frames of this shape pushed at once to the partial statistics, at most BATCH_SIZE or BATCH_BYTES."""
+    return int(np.clip(BATCH_BYTES // int(np.prod(shape)), 1, BATCH_SIZE))
+
+
+class PartialStatistics:
+    """Per-pixel sums, sums of squares and, if asked, per-strip histograms of pushed uint8 frames.
+
+    These merge by addition, so partial statistics of disjoint frame sets reduce to exactly the
+    statistics of all frames together. Frames are pushed in batches, so memory depends only on
+    the frame shape; counts use the smallest dtype holding max_count frames.
+    """
+
+    def __init__(self, shape: tuple, histograms: bool, strip_rows: int, max_count: int):
+        self.count = 0
+        self.strip_rows = strip_rows
+        self.total = np.zeros(shape, dtype=np.uint64)
+        self.total_sq = np.zeros(shape, dtype=np.uint64)
+        dtype = counts_dtype(max_count)
+        self.strips = [
+            HistogramAccumulator(self.total[row:row + strip_rows].shape, moments=False, dtype=dtype)
+            for row in range(0, shape[0], strip_rows)
+        ] if histograms else []
+
+    def push_batch(self, frames: np.ndarray) -> None:
+        """Add a batch of uint8 frames."""
+        self.total += frames.sum(axis=0, dtype=np.uint64)
+        self.total_sq += np.square(frames, dtype=np.uint32).sum(axis=0, dtype=np.uint64)
+        for strip, accumulator in enumerate(self.strips):
+            row = strip * self.strip_rows
+            accumulator.push_batch(frames[:, row:row + self.strip_rows])
+        self.count += len(frames)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """The statistics as the arrays saved for a shard."""
+        arrays = {"count": np.array(self.count), "total": self.total, "total_sq": self.total_sq}
+        for strip, accumulator in enumerate(self.strips):
+            arrays[f"counts_{strip}"] = accumulator.counts
+        return arrays
@@ -73,16 +73,17 @@ def test_evaluate_and_align(input_dir: str, output_dir: str, threshold: float=0.
     if not images:
         raise ValueError(f"No valid images found in directory: {input_dir}")
 
-    aligned_images, best_index, best_score, avg_quality = evaluate_and_align(images, threshold)
+    result = evaluate_and_align(images, threshold)
 
-    for aligned_image, original_path in zip(aligned_images, image_paths):
+    for aligned_image, index in zip(result.aligned_images, result.selected):
+        original_path = image_paths[index]
         filename = os.path.basename(original_path)
         base, ext = os.path.splitext(filename)
         out_path = os.path.join(output_dir, f"{base}_aligned{ext}")
         if not cv2.imwrite(out_path, aligned_image):
             raise Exception(f"Failed to save aligned image to: {out_path}")
 
-    print(f"Alignment completed for {input_dir}. Best index: {best_index}, Best score: {best_score:.2f}, Avg quality: {avg_quality:.2f}")
+    print(f"Alignment completed for {input_dir}. Best index: {result.best_index}, Best score: {result.best_score:.2f}, Avg quality: {result.avg_quality:.2f}, Mean residual: {result.residuals.mean():.4f}")
 
 def test_image_stacking(input_dir: str, output_dir: str, method: str = "mean_with_median_clipping") -> None:
     if not os.path.exists(input_dir):
@@ -0,0 +1,34 @@
+import cv2
+import numpy as np
+import pytest
+
+from benchmarking.utils import render_planet, synthetic_frames
+
+CROP_SIZE = 64
+FRAME_COUNT = 30
+
+
+@pytest.fixture(scope="session")
+def capture_frames() -> np.ndarray:
+    """Synthetic jittered, blurred and noisy frames of a planet, 1.5 times the crop size."""
+    scene = render_planet(CROP_SIZE)
+    return np.array(list(synthetic_frames(scene, CROP_SIZE * 3 // 2, FRAME_COUNT)))
+
+@pytest.fixture(scope="session")
+def capture_video(tmp_path_factory, capture_frames) -> str:
+    """The synthetic frames encoded as an MJPG video."""
+    path = str(tmp_path_factory.mktemp("capture") / "capture.avi")
+    height, width = capture_frames.shape[1:3]
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30.0, (width, height))
+    for frame in capture_frames:
+        writer.write(frame)
+    writer.release()
+    return path
+
+@pytest.fixture
+def uint8_stack() -> np.ndarray:
+    """Random frames with outliers, so clipping methods reject some values."""
+    rng = np.random.default_rng(0)
+    stack = rng.normal(120, 20, (25, 6, 7, 3))
+    stack[rng.random(stack.shape) < 0.05] = 255
+    return np.clip(stack, 0, 255).astype(np.uint8)
@@ -0,0 +1,77 @@
+import time
+
+import numpy as np
+import pytest
+
+from image_stacking.accumulators import (HistogramAccumulator, counts_dtype,
+                                         histogram_image_stacking,
+                                         histogram_median)
+from image_stacking.tiling import STACKING_FUNCTIONS
+
+
+@pytest.mark.parametrize("count", [1, 2, 24, 25])
+def test_histogram_median_matches_numpy(uint8_stack, count):
+    stack = uint8_stack[:count]
+    accumulator = HistogramAccumulator(stack.shape[1:], moments=False)
+    for frame in stack:
+        accumulator.push(frame)
+    np.testing.assert_array_equal(accumulator.reduce("median"), np.median(stack.astype(np.float32), axis=0))
+
+def test_push_batch_matches_push(uint8_stack):
+    pushed = HistogramAccumulator(uint8_stack.shape[1:])
+    for frame in uint8_stack:
+        pushed.push(frame)
+    batched = HistogramAccumulator(uint8_stack.shape[1:], dtype=counts_dtype(len(uint8_stack)))
+    for start in range(0, len(uint8_stack), 10):
+        batched.push_batch(uint8_stack[start:start + 10])
+    np.testing.assert_array_equal(batched.counts, pushed.counts)
+    np.testing.assert_array_equal(batched.total, pushed.total)
+    np.testing.assert_array_equal(batched.total_sq, pushed.total_sq)
+
+@pytest.mark.parametrize("method", ["mean", "median", "mean_with_median_clipping"])
+def test_histogram_stacking_is_exact(uint8_stack, method):
+    expected = STACKING_FUNCTIONS[method](uint8_stack)
+    np.testing.assert_array_equal(histogram_image_stacking(uint8_stack, method, strip_bins=1 << 12), expected)
+
+def test_histogram_clipped_mean_matches_reference(uint8_stack):
+    # Clipped values are summed in a different order, so only rounding may differ.
+    expected = STACKING_FUNCTIONS["mean_with_clipping"](uint8_stack)
+    actual = histogram_image_stacking(uint8_stack, "mean_with_clipping", strip_bins=1 << 12)
+    np.testing.assert_allclose(actual, expected, rtol=1e-6)
+
+def test_add_counts_merges_disjoint_frames(uint8_stack):
+    halves = uint8_stack[:12], uint8_stack[12:]
+    merged = HistogramAccumulator(uint8_stack.shape[1:])
+    for half in halves:
+        accumulator = HistogramAccumulator(half.shape[1:])
+        accumulator.push_batch(half)
+        merged.add_counts(accumulator.counts, accumulator.count, accumulator.total, accumulator.total_sq)
+    whole = HistogramAccumulator(uint8_stack.shape[1:])
+    whole.push_batch(uint8_stack)
+    for method in STACKING_FUNCTIONS:
+        np.testing.assert_array_equal(merged.reduce(method), whole.reduce(method))
+
+def test_counts_dtype():
+    assert counts_dtype(255) == np.uint8
+    assert counts_dtype(256) == np.uint16
+    assert counts_dtype(1 << 16) == np.uint32
+
+@pytest.mark.parametrize("count", [1, 2, 3, 255, 256])
+def test_histogram_median_of_extreme_values(count):
+    # Values at both ends of the range exercise the wrap-around search for the upper median.
+    stack = np.random.default_rng(count).choice(np.uint8([0, 1, 254, 255]), (count, 5, 4, 3))
+    np.testing.assert_array_equal(histogram_median(stack), np.median(stack.astype(np.float32), axis=0))
+
+def test_histogram_median_is_exact_and_faster_on_large_stacks():
+    stack = np.clip(np.random.default_rng(1).normal(120, 40, (200, 120, 120, 3)), 0, 255).astype(np.uint8)
+
+    def best_time(stacking) -> float:
+        times = []
+        for _ in range(3):
+            started = time.perf_counter()
+            stacking(stack)
+            times.append(time.perf_counter() - started)
+        return min(times)
+
+    np.testing.assert_array_equal(histogram_median(stack), STACKING_FUNCTIONS["median"](stack))
+    assert best_time(histogram_median) < 0.5 * best_time(STACKING_FUNCTIONS["median"])
@@ -0,0 +1,47 @@
+import cv2
+import numpy as np
+import pytest
+
+from benchmarking.utils import render_planet
+from evaluate_and_align.aligners import ALIGNERS, FftAligner, create_aligner
+
+CROP_SIZE = 128
+SHIFTS = [(0.0, 0.0), (3.0, -2.0), (-5.25, 1.5), (0.4, -0.7), (7.6, 6.3)]
+
+
+def shifted_crop(scene: np.ndarray, dx: float, dy: float) -> np.ndarray:
+    """The center crop of the scene, with its content moved by (dx, dy) pixels."""
+    center = (scene.shape[1] - CROP_SIZE) / 2, (scene.shape[0] - CROP_SIZE) / 2
+    warp = np.float32([[1, 0, center[0] - dx], [0, 1, center[1] - dy]])
+    frame = cv2.warpAffine(scene, warp, (CROP_SIZE, CROP_SIZE), flags=cv2.INTER_LINEAR + cv2.WARP_INVERSE_MAP)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+@pytest.fixture(scope="module")
+def scene() -> np.ndarray:
+    return render_planet(CROP_SIZE)
+
+@pytest.mark.parametrize("dx, dy", SHIFTS)
+def test_fft_aligner_recovers_shift(scene, dx, dy):
+    aligner = FftAligner(shifted_crop(scene, 0, 0))
+    found_dx, found_dy, response = aligner.find_shift(shifted_crop(scene, dx, dy))
+    assert found_dx == pytest.approx(dx, abs=0.25)
+    assert found_dy == pytest.approx(dy, abs=0.25)
+    assert response > 0
+
+@pytest.mark.parametrize("method", list(ALIGNERS))
+def test_aligners_register_shifted_frames(scene, method):
+    template = shifted_crop(scene, 0, 0)
+    aligner = create_aligner(method, template)
+    aligned, warp_matrix, _ = aligner.align(shifted_crop(scene, 3.0, -2.0))
+    np.testing.assert_allclose(warp_matrix[:, 2], [3.0, -2.0], atol=0.25)
+    inner = (slice(16, -16), slice(16, -16))
+    assert np.abs(aligned[inner].astype(int) - template[inner]).mean() < 2
+
+def test_whole_pixel_alignment_keeps_subpixel_remainder(scene):
+    aligner = FftAligner(shifted_crop(scene, 0, 0))
+    _, warp_matrix, _ = aligner.align(shifted_crop(scene, 2.4, -1.3), whole_pixels=True)
+    np.testing.assert_allclose(warp_matrix[:, 2], [2.4, -1.3], atol=0.25)
+
+def test_unknown_aligner():
+    with pytest.raises(ValueError):
+        create_aligner("unknown", np.zeros((8, 8, 3), dtype=np.uint8))
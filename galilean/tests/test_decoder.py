@@ -0,0 +1,81 @@
+import threading
+
+import numpy as np
+import pytest
+
+import video_reader.decoder as decoder
+from tests.conftest import FRAME_COUNT
+from video_reader.decoder import VideoPrefetcher, prefetch_frames
+from video_reader.handler import read_frames
+
+
+@pytest.fixture(scope="module")
+def decoded(capture_video) -> np.ndarray:
+    return np.array(list(read_frames([capture_video])))
+
+def running_prefetchers() -> list:
+    return [thread for thread in threading.enumerate() if isinstance(thread, VideoPrefetcher)]
+
+@pytest.mark.parametrize("wanted", [None, [0, 3, 4, 17, FRAME_COUNT - 1]])
+def test_prefetcher_yields_frames_in_order(capture_video, decoded, wanted):
+    prefetcher = VideoPrefetcher(capture_video, buffer_size=2, wanted=wanted)
+    prefetcher.start()
+    positions, frames = zip(*((position, frame.copy()) for position, frame in prefetcher.frames()))
+    expected = list(range(FRAME_COUNT)) if wanted is None else wanted
+    assert list(positions) == expected
+    np.testing.assert_array_equal(frames, decoded[expected])
+
+def test_prefetched_videos_are_numbered_globally(capture_video, decoded):
+    frames = prefetch_frames([capture_video] * 3, buffer_size=2)
+    assert [index for index, _ in frames] == list(range(3 * FRAME_COUNT))
+    selected = {index: frame.copy() for index, frame in prefetch_frames([capture_video] * 3, [5, 31, 89], 2)}
+    assert sorted(selected) == [5, 31, 89]
+    np.testing.assert_array_equal(selected[31], decoded[1])
+
+def test_stopping_early_shuts_the_threads_down(capture_video):
+    frames = prefetch_frames([capture_video] * 3, buffer_size=2)
+    next(frames)
+    next(frames)
+    frames.close()
+    assert running_prefetchers() == []
+
+    # A prefetcher whose buffers are all taken waits for a free one until it is stopped.
+    prefetcher = VideoPrefetcher(capture_video, buffer_size=1)
+    prefetcher.start()
+    next(prefetcher.frames())
+    prefetcher.stop()
+    prefetcher.join(5)
+    assert not prefetcher.is_alive()
+
+class FailingCapture:
+    def __init__(self, frames: int):
+        self.frames = frames
+
+    def read(self, buffer=None):
+        if self.frames == 0:
+            raise RuntimeError("corrupt frame")
+        self.frames -= 1
+        return True, np.zeros((4, 4, 3), dtype=np.uint8)
+
+    def release(self) -> None:
+        pass
+
+def test_decode_errors_reach_the_consumer(monkeypatch, capture_video):
+    monkeypatch.setattr(decoder, "open_video_at", lambda *args: (FailingCapture(2), 0))
+    finished = []
+    prefetcher = VideoPrefetcher(capture_video, on_finished=lambda *args: finished.append(args))
+    prefetcher.start()
+    received = []
+    with pytest.raises(RuntimeError, match="corrupt frame"):
+        for position, _ in prefetcher.frames():
+            received.append(position)
+    assert received == [0, 1]
+    assert finished == []
+
+    with pytest.raises(RuntimeError, match="corrupt frame"):
+        list(prefetch_frames([capture_video] * 2))
+    assert running_prefetchers() == []
+
+def test_open_errors_reach_the_consumer(tmp_path):
+    with pytest.raises(ValueError, match="Could not open video"):
+        list(prefetch_frames([str(tmp_path / "missing.avi")]))
@@ -0,0 +1,54 @@
+import cv2
+import numpy as np
+import pytest
+
+from evaluate_and_align.aligners import create_aligner
+from image_stacking.drizzle import drizzle_stacking, subpixel_offsets
+from image_stacking.handler import DRIZZLE, image_stacking
+
+SIZE = 40
+MARGIN = slice(6, -6)
+
+
+@pytest.fixture(scope="module")
+def fine_image() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    rows, columns = np.mgrid[0:2 * SIZE + 2, 0:2 * SIZE + 2].astype(np.float64)
+    image = np.full(rows.shape, 20.0)
+    for center_y, center_x in rng.uniform(10, 2 * SIZE - 8, (12, 2)):
+        image += rng.uniform(60, 140) * np.exp(-((rows - center_y) ** 2 + (columns - center_x) ** 2) / 18)
+    return np.repeat(np.clip(image, 0, 255)[..., None], 3, axis=2)
+
+# Frames average 2x2 blocks of the fine image shifted by 0 or 1 fine pixel, i.e. half a frame pixel.
+def half_pixel_frames(fine_image: np.ndarray) -> list:
+    frames = []
+    for shift_y in (0, 1):
+        for shift_x in (0, 1):
+            shifted = fine_image[shift_y:shift_y + 2 * SIZE, shift_x:shift_x + 2 * SIZE]
+            frames.append(shifted.reshape(SIZE, 2, SIZE, 2, 3).mean(axis=(1, 3)).round().astype(np.uint8))
+    return frames
+
+def test_drizzle_registers_half_pixel_shifts_at_twice_the_resolution(fine_image):
+    frames = half_pixel_frames(fine_image)
+    aligner = create_aligner("ecc", frames[0])
+    aligned, warp_matrices, _ = zip(*(aligner.align(frame, whole_pixels=True) for frame in frames))
+    warp_matrices = np.array(warp_matrices)
+    offsets = np.abs(subpixel_offsets(warp_matrices))
+    np.testing.assert_allclose(offsets, [[0, 0], [0.5, 0], [0, 0.5], [0.5, 0.5]], atol=0.02)
+
+    # The centers of output pixels fall on the centers of fine image pixels.
+    truth = fine_image[:2 * SIZE, :2 * SIZE][MARGIN, MARGIN]
+    stacked = image_stacking(list(aligned), DRIZZLE, warp_matrices=warp_matrices)
+    assert stacked.shape == (2 * SIZE, 2 * SIZE, 3)
+    error = np.abs(stacked[MARGIN, MARGIN] - truth)
+    flipped = np.abs(drizzle_stacking(aligned, -subpixel_offsets(warp_matrices))[MARGIN, MARGIN] - truth)
+    upscaled = cv2.resize(frames[0].astype(np.float32), (2 * SIZE, 2 * SIZE))[MARGIN, MARGIN]
+    assert error.mean() < 1
+    assert flipped.mean() > 4 * error.mean()
+    assert error.max() < np.abs(upscaled - truth).max()
+
+@pytest.mark.parametrize("pixfrac", [0.3, 0.7, 1.0])
+def test_drizzle_weights_are_normalized(pixfrac):
+    frames = [np.full((SIZE, SIZE, 3), 77, dtype=np.uint8)] * 4
+    offsets = np.array([[0, 0], [0.5, 0], [0, -0.5], [0.3, 0.2]])
+    np.testing.assert_allclose(drizzle_stacking(frames, offsets, pixfrac=pixfrac), 77, rtol=1e-6)
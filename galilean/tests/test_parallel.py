@@ -0,0 +1,46 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from detect_and_crop.handler import detect_and_crop_frames
+from evaluate_and_align.handler import evaluate_and_align
+from parallel.handler import parallel_detect_and_crop, parallel_evaluate_and_align
+from parallel.utils import init_worker
+from tests.conftest import CROP_SIZE
+
+WORKERS = 2
+THRESHOLD = 0.8
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with ProcessPoolExecutor(WORKERS, initializer=init_worker) as pool:
+        yield pool
+
+@pytest.mark.parametrize("tracking", [False, True])
+def test_pool_crops_match_serial_crops(pool, capture_frames, tracking):
+    expected = np.array(list(detect_and_crop_frames(capture_frames, CROP_SIZE, tracking)))
+    # A capacity below the frame count makes the shared buffer grow while batches are in flight.
+    cropped, count = parallel_detect_and_crop(iter(capture_frames), CROP_SIZE, pool, WORKERS, 4, tracking=tracking)
+    try:
+        assert count == len(capture_frames)
+        np.testing.assert_array_equal(cropped.array[:count], expected)
+    finally:
+        cropped.release()
+
+@pytest.mark.parametrize("method, prefilter", [("ecc", 1.0), ("fft", 0.9)])
+def test_pool_alignment_matches_serial_alignment(pool, capture_frames, method, prefilter):
+    crops = np.array(list(detect_and_crop_frames(capture_frames, CROP_SIZE)))
+    expected = evaluate_and_align(list(crops), THRESHOLD, method, prefilter)
+    shared, count = parallel_detect_and_crop(iter(capture_frames), CROP_SIZE, pool, WORKERS)
+    try:
+        result = parallel_evaluate_and_align(shared, count, pool, WORKERS, THRESHOLD, method, prefilter)
+    finally:
+        shared.release()
+    assert result.best_index == expected.best_index
+    np.testing.assert_array_equal(result.scores, expected.scores)
+    np.testing.assert_array_equal(result.selected, expected.selected)
+    np.testing.assert_array_equal(result.warp_matrices, expected.warp_matrices)
+    np.testing.assert_array_equal(result.residuals, expected.residuals)
+    np.testing.assert_array_equal(result.aligned_images, np.array(expected.aligned_images))
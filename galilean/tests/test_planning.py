@@ -0,0 +1,54 @@
+import pytest
+
+from pipeline.handler import Pipeline
+from pipeline.planning import plan_memory, plan_shard_memory
+from pipeline.utils import PipelineOptions
+
+GIB = 1 << 30
+METHODS = ["mean_with_median_clipping"]
+
+
+def test_aligned_frames_over_budget_go_to_the_frame_store():
+    # 2500 aligned 720 px crops take about 3.7G, which no worker or prefetch setting can shrink.
+    plan = plan_memory(PipelineOptions(workers=4, max_memory=2 * GIB), 5000, (1920, 1080), 720, 0.5, METHODS, 1)
+    assert plan.options.two_pass and plan.options.frame_store
+    assert plan.options.workers == 1
+    assert plan.peak <= plan.budget
+
+def test_given_frame_store_is_kept():
+    options = PipelineOptions(frame_store="store", max_memory=2 * GIB)
+    plan = plan_memory(options, 5000, (1920, 1080), 720, 0.5, METHODS, 1)
+    assert plan.options.frame_store == "store"
+    assert plan.peak <= plan.budget
+
+def test_fitting_run_is_unchanged():
+    options = PipelineOptions(workers=2, max_memory=8 * GIB)
+    plan = plan_memory(options, 500, (1280, 720), 360, 0.5, METHODS, 1)
+    assert plan.options == options and not plan.changes
+
+def test_budget_below_a_process_is_refused():
+    with pytest.raises(ValueError):
+        plan_memory(PipelineOptions(max_memory=1 << 20), 500, (1280, 720), 360, 0.5, METHODS, 1)
+
+def test_rolling_windows_go_to_the_frame_store_but_are_never_tiled():
+    options = PipelineOptions(max_memory=2 * GIB)
+    plan = plan_memory(options, 5000, (1920, 1080), 720, 0.5, METHODS, 1, window=500)
+    assert plan.options.frame_store and plan.options.stacking_memory is None
+    assert plan.peak <= plan.budget
+    with pytest.raises(ValueError, match="window length"):
+        plan_memory(options, 5000, (1920, 1080), 1080, 0.5, METHODS, 1, window=70000)
+
+def test_shard_workers_are_halved_to_fit():
+    plan = plan_shard_memory(PipelineOptions(workers=8, max_memory=2 * GIB), [1000] * 8, (1920, 1080), 720, "median", 1)
+    assert plan.options.workers == 1 and plan.options.prefetch == 8
+    assert plan.peak <= plan.budget
+
+def test_shards_over_budget_suggest_8_bit_histograms():
+    with pytest.raises(ValueError, match="--chunk-frames 255"):
+        plan_shard_memory(PipelineOptions(max_memory=400 << 20), [1000] * 8, (1920, 1080), 720, "median", 1)
+    plan = plan_shard_memory(PipelineOptions(max_memory=600 << 20), [1000] * 8, (1920, 1080), 720, "mean", 1)
+    assert plan.peak <= plan.budget
+
+def test_pipeline_splits_the_budget_between_concurrent_jobs():
+    with Pipeline(PipelineOptions(max_memory=4 * GIB), concurrency=4) as pipeline:
+        assert pipeline.job_options.max_memory == GIB
@@ -0,0 +1,76 @@
+import cv2
+import numpy as np
+import pytest
+
+import postprocessing.utils as utils
+from postprocessing.utils import images_sr, upsample_tiled
+
+SCALE, TILE, OVERLAP = 2, 48, 8
+
+
+def resize_model(interpolation: int):
+    return lambda image: cv2.resize(image, None, fx=SCALE, fy=SCALE, interpolation=interpolation)
+
+def seam_mask(length: int, band: int) -> np.ndarray:
+    starts = {min(start, length - TILE) for start in range(0, length - OVERLAP, TILE - OVERLAP)}
+    edges = {edge * SCALE for start in starts for edge in (start, start + TILE)} - {0, length * SCALE}
+    mask = np.zeros(length * SCALE, dtype=bool)
+    for edge in edges:
+        mask[max(edge - band, 0):edge + band] = True
+    return mask
+
+@pytest.fixture(scope="module")
+def image() -> np.ndarray:
+    return np.random.default_rng(1).integers(0, 256, (100, 130, 3), dtype=np.uint8)
+
+def test_tiles_of_a_pixel_model_match_the_whole_image(image):
+    upsample = resize_model(cv2.INTER_NEAREST)
+    np.testing.assert_array_equal(upsample_tiled(image, upsample, SCALE, TILE, OVERLAP), upsample(image))
+
+@pytest.mark.parametrize("interpolation, band", [(cv2.INTER_LINEAR, 2), (cv2.INTER_CUBIC, 4)])
+def test_tiled_output_matches_untiled_away_from_seams(image, interpolation, band):
+    upsample = resize_model(interpolation)
+    tiled = upsample_tiled(image, upsample, SCALE, TILE, OVERLAP)
+    whole = upsample(image)
+    away = ~seam_mask(image.shape[0], band)[:, None] & ~seam_mask(image.shape[1], band)[None, :]
+    assert away.mean() > 0.5
+    np.testing.assert_array_equal(tiled[away], whole[away])
+    assert np.abs(tiled.astype(int) - whole).max() < 16
+
+def test_small_images_are_upsampled_whole(image):
+    calls = []
+
+    def upsample(tile: np.ndarray) -> np.ndarray:
+        calls.append(tile.shape)
+        return resize_model(cv2.INTER_LINEAR)(tile)
+    upsample_tiled(image[:40, :40], upsample, SCALE, TILE, OVERLAP)
+    assert calls == [(40, 40, 3)]
+
+class ResizeModel:
+    created = 0
+
+    def __init__(self):
+        ResizeModel.created += 1
+        self.scale = None
+
+    def readModel(self, path: str) -> None:
+        pass
+
+    def setModel(self, name: str, scale: int) -> None:
+        self.scale = scale
+
+    def upsample(self, image: np.ndarray) -> np.ndarray:
+        return cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_NEAREST)
+
+def test_the_model_is_loaded_once_and_reused(monkeypatch, image):
+    monkeypatch.setattr(utils, "_sr_models", {})
+    monkeypatch.setattr(utils, "_sr_locks", {})
+    monkeypatch.setattr(cv2.dnn_superres, "DnnSuperResImpl_create", ResizeModel)
+    ResizeModel.created = 0
+    first = images_sr(image, SCALE, tile_size=TILE)
+    second = images_sr(image, SCALE, tile_size=None)
+    np.testing.assert_array_equal(first, second)
+    assert ResizeModel.created == 1
+    assert utils.get_sr_model(SCALE) is utils.get_sr_model(SCALE)
+    images_sr(image, 3, tile_size=None)
+    assert ResizeModel.created == 2
@@ -0,0 +1,117 @@
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+import pytest
+
+from video_reader.handler import read_frame_range, read_selected_frames
+from video_reader.raw import (FITS_BLOCK, FITS_CARD, SER_BGR, SER_HEADER,
+                              SER_MONO, SER_RGB, open_fits, open_raw_capture,
+                              open_ser)
+from video_reader.utils import probe_video
+
+HEIGHT, WIDTH, FRAMES = 6, 8, 4
+
+
+def write_ser(path: str, samples: np.ndarray, color_id: int, depth: int, little_endian: int = 0,
+              frame_count: Optional[int] = None) -> str:
+    header = np.zeros(1, dtype=SER_HEADER)
+    header["file_id"] = b"LUCAM-RECORDER"
+    header["color_id"] = color_id
+    header["little_endian"] = little_endian
+    header["width"], header["height"] = samples.shape[2], samples.shape[1]
+    header["pixel_depth"] = depth
+    header["frame_count"] = len(samples) if frame_count is None else frame_count
+    with open(path, "wb") as file:
+        file.write(header.tobytes())
+        file.write(samples.tobytes())
+    return path
+
+def write_fits(path: str, data: np.ndarray, bitpix: int, cards: Optional[Dict[str, object]] = None) -> str:
+    axes = data.shape[::-1]
+    header = {"SIMPLE": True, "BITPIX": bitpix, "NAXIS": len(axes)}
+    header.update({f"NAXIS{axis + 1}": size for axis, size in enumerate(axes)})
+    header.update(cards or {})
+    lines = []
+    for key, value in header.items():
+        if isinstance(value, bool):
+            value = "T" if value else "F"
+        elif isinstance(value, str):
+            value = f"'{value}'"
+        lines.append(f"{key:<8}= {value:>20}".ljust(FITS_CARD))
+    lines.append("END".ljust(FITS_CARD))
+    text = "".join(lines).encode("ascii")
+    payload = data.tobytes()
+    with open(path, "wb") as file:
+        file.write(text + b" " * (-len(text) % FITS_BLOCK))
+        file.write(payload + b"\0" * (-len(payload) % FITS_BLOCK))
+    return path
+
+@pytest.fixture
+def mono() -> np.ndarray:
+    return np.random.default_rng(0).integers(0, 256, (FRAMES, HEIGHT, WIDTH), dtype=np.uint8)
+
+def test_ser_mono_8bit(tmp_path, mono):
+    capture = open_ser(write_ser(str(tmp_path / "mono.ser"), mono, SER_MONO, 8))
+    assert (len(capture), capture.width, capture.height) == (FRAMES, WIDTH, HEIGHT)
+    assert isinstance(capture.frames, np.memmap)
+    np.testing.assert_array_equal(capture.raw(2), mono[2])
+    np.testing.assert_array_equal(capture.frame(3), cv2.cvtColor(mono[3], cv2.COLOR_GRAY2BGR))
+
+def test_ser_16bit_inverted_endian_flag(tmp_path):
+    samples = np.random.default_rng(1).integers(0, 4096, (FRAMES, HEIGHT, WIDTH)).astype("<u2")
+    capture = open_ser(write_ser(str(tmp_path / "deep.ser"), samples, SER_MONO, 12, little_endian=0))
+    np.testing.assert_array_equal(capture.raw(1), samples[1])
+    expected = cv2.cvtColor((samples[1] >> 4).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+    np.testing.assert_array_equal(capture.frame(1), expected)
+
+def test_ser_rgb_and_bgr(tmp_path):
+    samples = np.random.default_rng(2).integers(0, 256, (FRAMES, HEIGHT, WIDTH, 3), dtype=np.uint8)
+    rgb = open_ser(write_ser(str(tmp_path / "rgb.ser"), samples, SER_RGB, 8))
+    bgr = open_ser(write_ser(str(tmp_path / "bgr.ser"), samples, SER_BGR, 8))
+    np.testing.assert_array_equal(rgb.frame(0), samples[0][..., ::-1])
+    np.testing.assert_array_equal(bgr.frame(0), samples[0])
+
+def test_ser_bayer(tmp_path, mono):
+    capture = open_ser(write_ser(str(tmp_path / "bayer.ser"), mono, 8, 8))
+    assert capture.bayer == "RGGB"
+    np.testing.assert_array_equal(capture.frame(0), cv2.cvtColor(mono[0], cv2.COLOR_BayerRGGB2BGR))
+
+def test_ser_truncated_capture(tmp_path, mono):
+    path = write_ser(str(tmp_path / "truncated.ser"), mono[:2], SER_MONO, 8, frame_count=FRAMES)
+    assert len(open_ser(path)) == 2
+
+def test_ser_rejects_other_files(tmp_path):
+    path = tmp_path / "other.ser"
+    path.write_bytes(b"\0" * 256)
+    with pytest.raises(ValueError):
+        open_ser(str(path))
+
+def test_fits_8bit_cube(tmp_path, mono):
+    capture = open_fits(write_fits(str(tmp_path / "cube.fits"), mono, 8))
+    assert (len(capture), capture.width, capture.height) == (FRAMES, WIDTH, HEIGHT)
+    np.testing.assert_array_equal(capture.frame(2), cv2.cvtColor(mono[2], cv2.COLOR_GRAY2BGR))
+
+def test_fits_unsigned_16bit(tmp_path):
+    samples = np.random.default_rng(3).integers(0, 65536, (FRAMES, HEIGHT, WIDTH)).astype(np.uint16)
+    stored = (samples.astype(np.int32) - 32768).astype(">i2")
+    capture = open_fits(write_fits(str(tmp_path / "deep.fits"), stored, 16, {"BZERO": 32768, "BSCALE": 1}))
+    expected = cv2.cvtColor((samples[1] >> 8).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+    np.testing.assert_array_equal(capture.frame(1), expected)
+
+def test_fits_float_image_with_bayer_pattern(tmp_path):
+    samples = np.random.default_rng(4).random((HEIGHT, WIDTH)).astype(">f4")
+    capture = open_fits(write_fits(str(tmp_path / "float.fits"), samples, -32, {"BAYERPAT": "GRBG"}))
+    assert len(capture) == 1 and capture.bayer == "GRBG"
+    expected = np.clip(samples.astype(np.float32) * 255.0, 0, 255).astype(np.uint8)
+    np.testing.assert_array_equal(capture.frame(0), cv2.cvtColor(expected, cv2.COLOR_BayerGRBG2BGR))
+
+def test_raw_captures_through_video_reader(tmp_path, mono):
+    path = write_ser(str(tmp_path / "capture.ser"), mono, SER_MONO, 8)
+    assert open_raw_capture(path).path == path
+    assert probe_video(path)[:3] == (WIDTH, HEIGHT, FRAMES)
+    frames = list(read_frame_range(path, 1, 3))
+    np.testing.assert_array_equal(np.array(frames)[..., 0], mono[1:3])
+    selected = list(read_selected_frames([path, path], [0, 5, 7]))
+    assert [index for index, _ in selected] == [0, 5, 7]
+    np.testing.assert_array_equal(selected[1][1][..., 0], mono[1])
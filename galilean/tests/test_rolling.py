@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from image_stacking.handler import image_stacking
+from image_stacking.rolling import (ROLLING_METHODS, RollingStack,
+                                    rolling_stacks, window_starts)
+
+
+def assert_stacks_match(actual: np.ndarray, expected: np.ndarray, method: str) -> None:
+    if method == "mean_with_clipping":
+        np.testing.assert_allclose(actual, expected, rtol=1e-6)
+    else:
+        np.testing.assert_array_equal(actual, expected)
+
+@pytest.mark.parametrize("method", ROLLING_METHODS)
+def test_rolling_stack_matches_image_stacking(uint8_stack, method):
+    stack = RollingStack(uint8_stack.shape[1:], method, window=len(uint8_stack), strip_bins=1 << 12)
+    for frame in uint8_stack:
+        stack.add(frame)
+    assert_stacks_match(stack.reduce(), image_stacking(uint8_stack, method), method)
+
+@pytest.mark.parametrize("method", ROLLING_METHODS)
+def test_removing_frames_matches_restacking(uint8_stack, method):
+    stack = RollingStack(uint8_stack.shape[1:], method, window=len(uint8_stack))
+    for frame in uint8_stack:
+        stack.add(frame)
+    for frame in uint8_stack[:10]:
+        stack.remove(frame)
+    assert stack.count == len(uint8_stack) - 10
+    assert_stacks_match(stack.reduce(), image_stacking(uint8_stack[10:], method), method)
+
+@pytest.mark.parametrize("method", ROLLING_METHODS)
+def test_rolling_stacks_match_restacks(uint8_stack, method):
+    # Rejected frames leave gaps in capture time, which windows must keep.
+    frame_indices = [index for index in range(40) if index % 3 != 1][:len(uint8_stack)]
+    frame_count, window, step = frame_indices[-1] + 1, 9, 4
+    stacks = list(rolling_stacks(uint8_stack, frame_indices, frame_count, method, window, step))
+    assert [start for start, _, _ in stacks] == list(window_starts(frame_count, window, step))
+    for start, count, stacked in stacks:
+        kept = [position for position, index in enumerate(frame_indices) if start <= index < start + window]
+        assert count == len(kept)
+        assert_stacks_match(stacked, image_stacking(uint8_stack[kept], method), method)
+
+def test_window_starts_of_short_capture():
+    assert list(window_starts(5, 10, 3)) == [0]
+    assert list(window_starts(10, 4, 3)) == [0, 3, 6]
+
+def test_rolling_stack_rejects_drizzle():
+    with pytest.raises(ValueError):
+        RollingStack((4, 4, 3), "drizzle", window=8)
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pytest
+
+from pipeline.utils import BatchJob
+from server.handler import JobServer
+from server.utils import (MAX_BODY_BYTES, MAX_HEADER_LINES, HttpError,
+                          Request, parse_json_body, read_request)
+
+
+def parse(raw: bytes) -> Optional[Request]:
+    async def read() -> Optional[Request]:
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return await read_request(reader)
+    return asyncio.run(read())
+
+def test_read_request_parses_method_path_and_body():
+    request = parse(b"post /jobs/?verbose=1 HTTP/1.1\r\nContent-Length: 2\r\nHost: x\r\n\r\n{}")
+    assert request == Request("POST", "/jobs", b"{}")
+    assert parse(b"GET / HTTP/1.1\r\n\r\n") == Request("GET", "/", b"")
+    assert parse(b"") is None
+    assert parse(b"\r\n") is None
+
+@pytest.mark.parametrize("raw, status", [
+    (b"GARBAGE\r\n\r\n", 400),
+    (b"GET /jobs HTTP/1.1\r\nContent-Length: ten\r\n\r\n", 400),
+    (b"GET /jobs HTTP/1.1\r\n" + b"X-Header: 1\r\n" * MAX_HEADER_LINES + b"\r\n", 400),
+    (b"POST /jobs HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % (MAX_BODY_BYTES + 1), 413),
+])
+def test_malformed_requests_are_rejected(raw, status):
+    with pytest.raises(HttpError) as error:
+        parse(raw)
+    assert error.value.status == status
+
+def test_truncated_bodies_are_incomplete():
+    with pytest.raises(asyncio.IncompleteReadError):
+        parse(b"POST /jobs HTTP/1.1\r\nContent-Length: 10\r\n\r\n{\"a\"")
+
+def test_invalid_json_bodies_are_rejected():
+    with pytest.raises(HttpError) as error:
+        parse_json_body(Request("POST", "/jobs", b"{\"videos\": "))
+    assert error.value.status == 400
+    assert parse_json_body(Request("POST", "/jobs", b"")) == {}
+
+class GatedPipeline:
+    """Stands in for Pipeline: publishes one event, then waits for the test before finishing."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.prefixes = []
+
+    def run(self, job: BatchJob, output_dir: str, prefix: str,
+            on_event: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+        self.prefixes.append(prefix)
+        on_event({"event": "stage", "stage": "detect_and_crop"})
+        if not self.release.wait(10):
+            raise TimeoutError("The test never released the job")
+        if job.threshold < 0.5:
+            raise ValueError("threshold too low")
+        return {"status": "ok", "outputs": [f"{output_dir}/{prefix}.png"]}
+
+async def exchange(port: int, raw: bytes) -> Tuple[int, Any]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(raw)
+    writer.write_eof()
+    response = await reader.read()
+    writer.close()
+    if not response:
+        return 0, None
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split(b" ")[1]), json.loads(body)
+
+def run_with_server(pipeline: GatedPipeline, output_dir: str, scenario: Callable[[int], Any]) -> Any:
+    async def main() -> Any:
+        server = JobServer(pipeline, output_dir)
+        ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        serving = asyncio.create_task(server.serve(
+            "127.0.0.1", 0, on_ready=lambda listening: ready.set_result(listening.sockets[0].getsockname()[1])
+        ))
+        try:
+            return await asyncio.wait_for(scenario(await ready), 20)
+        finally:
+            pipeline.release.set()
+            serving.cancel()
+            await asyncio.gather(serving, return_exceptions=True)
+    return asyncio.run(main())
+
+def post_job(job: Dict[str, Any]) -> bytes:
+    body = json.dumps(job).encode()
+    return b"POST /jobs HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+
+def test_submitted_jobs_stream_their_events(tmp_path, capture_video):
+    pipeline = GatedPipeline()
+
+    async def scenario(port: int) -> None:
+        status, submitted = await exchange(port, post_job({"video": capture_video, "threshold": 0.8}))
+        assert (status, submitted["id"], submitted["status"]) == (202, 1, "queued")
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /jobs/1/events HTTP/1.1\r\n\r\n")
+        head = await reader.readuntil(b"\r\n\r\n")
+        assert head.startswith(b"HTTP/1.1 200") and b"application/x-ndjson" in head
+        events = [json.loads(await reader.readline()) for _ in range(3)]
+        assert [event["event"] for event in events] == ["queued", "started", "stage"]
+        assert all(event["job"] == 1 for event in events)
+
+        status, running = await exchange(port, b"GET /jobs/1 HTTP/1.1\r\n\r\n")
+        assert (status, running["status"], running["parameters"]["threshold"]) == (200, "running", 0.8)
+        pipeline.release.set()
+        finished = json.loads(await reader.readline())
+        assert await reader.read() == b""
+        writer.close()
+        assert finished["event"] == "finished" and finished["status"] == "ok"
+        assert finished["outputs"] == [f"{tmp_path}/{pipeline.prefixes[0]}.png"]
+
+        status, jobs = await exchange(port, b"GET /jobs HTTP/1.1\r\n\r\n")
+        assert (status, [job["status"] for job in jobs]) == (200, ["ok"])
+    run_with_server(pipeline, str(tmp_path), scenario)
+
+def test_failed_jobs_report_their_error(tmp_path, capture_video):
+    pipeline = GatedPipeline()
+    pipeline.release.set()
+
+    async def scenario(port: int) -> None:
+        await exchange(port, post_job({"video": capture_video, "threshold": 0.2}))
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /jobs/1/events HTTP/1.1\r\n\r\n")
+        lines = (await reader.read()).partition(b"\r\n\r\n")[2].splitlines()
+        writer.close()
+        finished = json.loads(lines[-1])
+        assert finished["status"] == "failed"
+        assert finished["error"] == "ValueError: threshold too low"
+    run_with_server(pipeline, str(tmp_path), scenario)
+
+def test_bad_requests_get_json_errors(tmp_path, capture_video):
+    async def scenario(port: int) -> None:
+        assert await exchange(port, b"GARBAGE\r\n\r\n") == (400, {"error": "Malformed request line"})
+        assert (await exchange(port, post_job({"video": "missing.avi"})))[0] == 400
+        assert (await exchange(port, post_job({"video": capture_video, "colour": "red"})))[0] == 400
+        assert (await exchange(port, post_job([capture_video])))[0] == 400
+        assert (await exchange(port, b"GET /jobs/7 HTTP/1.1\r\n\r\n"))[0] == 404
+        assert (await exchange(port, b"DELETE /health HTTP/1.1\r\n\r\n"))[0] == 404
+        # A request cut short before its body closes the connection without a response.
+        assert await exchange(port, b"POST /jobs HTTP/1.1\r\nContent-Length: 50\r\n\r\n{") == (0, None)
+        status, health = await exchange(port, b"GET /health HTTP/1.1\r\n\r\n")
+        assert (status, health) == (200, {"status": "ok", "queued": 0, "running": 0})
+    run_with_server(GatedPipeline(), str(tmp_path), scenario)
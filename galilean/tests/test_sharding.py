@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pytest
+
+from evaluate_and_align.handler import evaluate_and_align_two_pass
+from image_stacking.handler import image_stacking
+from sharding.handler import (init_sharded_job, pending_shards, reduce_shards,
+                              run_shards)
+from sharding.utils import PartialStatistics, load_job, partial_path
+from tests.conftest import CROP_SIZE, FRAME_COUNT
+
+THRESHOLD = 0.8
+
+
+def run_sharded(work_dir: str, videos, chunk_frames=None, method: str = "median"):
+    job = init_sharded_job(work_dir, videos, CROP_SIZE, THRESHOLD, method, "ecc", False, chunk_frames)
+    run_shards(work_dir, "score", pending_shards(work_dir, "score"))
+    run_shards(work_dir, "stack", pending_shards(work_dir, "stack"))
+    return job
+
+@pytest.fixture(scope="module")
+def two_pass(capture_video):
+    return evaluate_and_align_two_pass([capture_video], CROP_SIZE, THRESHOLD, "ecc")
+
+@pytest.fixture(scope="module")
+def sharded_dir(tmp_path_factory, capture_video) -> str:
+    work_dir = str(tmp_path_factory.mktemp("shards"))
+    job = run_sharded(work_dir, [capture_video], chunk_frames=12)
+    assert len(job.shards) == 3
+    return work_dir
+
+@pytest.mark.parametrize("method", ["mean", "median", "mean_with_median_clipping"])
+def test_sharded_stack_is_bit_identical_to_two_pass(sharded_dir, two_pass, method):
+    stacked, summary = reduce_shards(sharded_dir, method)
+    assert summary["frame_count"] == FRAME_COUNT
+    assert summary["best_index"] == two_pass.best_index
+    assert summary["stacked_count"] == len(two_pass.aligned_images)
+    np.testing.assert_array_equal(summary["residuals"], two_pass.residuals)
+    np.testing.assert_array_equal(stacked, image_stacking(two_pass.aligned_images, method))
+
+def test_sharded_clipped_mean_matches_two_pass(sharded_dir, two_pass):
+    stacked, _ = reduce_shards(sharded_dir, "mean_with_clipping")
+    np.testing.assert_allclose(stacked, image_stacking(two_pass.aligned_images, "mean_with_clipping"), rtol=1e-6)
+
+def test_chunking_does_not_change_the_stack(tmp_path, sharded_dir, capture_video):
+    work_dir = str(tmp_path / "whole")
+    run_sharded(work_dir, [capture_video])
+    np.testing.assert_array_equal(reduce_shards(work_dir)[0], reduce_shards(sharded_dir)[0])
+
+def test_partial_statistics_batches_merge_exactly(uint8_stack):
+    whole = PartialStatistics(uint8_stack.shape[1:], True, 2, len(uint8_stack))
+    whole.push_batch(uint8_stack)
+    batched = PartialStatistics(uint8_stack.shape[1:], True, 2, len(uint8_stack))
+    for start in range(0, len(uint8_stack), 4):
+        batched.push_batch(uint8_stack[start:start + 4])
+    assert batched.arrays().keys() == whole.arrays().keys()
+    for name, array in whole.arrays().items():
+        np.testing.assert_array_equal(batched.arrays()[name], array)
+    assert whole.arrays()["counts_0"].dtype == np.uint8
+
+def test_reinit_with_another_capture_clears_stale_outputs(tmp_path, capture_video):
+    work_dir = str(tmp_path / "reused")
+    first = run_sharded(work_dir, [capture_video])
+    second = init_sharded_job(work_dir, [capture_video, capture_video], CROP_SIZE, THRESHOLD, "median",
+                              "ecc", False, 12)
+    assert second.key != first.key
+    assert sorted(os.listdir(work_dir)) == ["shards.json"]
+    assert pending_shards(work_dir, "score") == list(range(len(second.shards)))
+
+def test_reinit_with_the_same_manifest_resumes(tmp_path, capture_video):
+    work_dir = str(tmp_path / "resumed")
+    first = run_sharded(work_dir, [capture_video], chunk_frames=12)
+    os.remove(partial_path(work_dir, first, 1))
+    second = init_sharded_job(work_dir, [capture_video], CROP_SIZE, THRESHOLD, "median", "ecc", False, 12)
+    assert second.key == first.key == load_job(work_dir).key
+    assert pending_shards(work_dir, "score") == []
+    assert pending_shards(work_dir, "stack") == [1]
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from image_stacking.tiling import (STACKING_BYTES_PER_VALUE, STACKING_FUNCTIONS,
+                                   stacking_tiles, tiled_image_stacking)
+
+METHODS = list(STACKING_FUNCTIONS)
+
+
+@pytest.fixture(scope="module")
+def stack() -> np.ndarray:
+    return np.random.default_rng(3).integers(0, 256, (20, 37, 53, 3), dtype=np.uint8)
+
+@pytest.mark.parametrize("max_memory, first_tile, last_tile", [
+    (200000, (4, 53), (1, 53)),
+    (2520, (1, 3), (1, 2)),
+])
+@pytest.mark.parametrize("as_list", [False, True])
+def test_tiled_stacking_matches_whole_stacking(stack, max_memory, first_tile, last_tile, as_list):
+    bytes_per_value = max(STACKING_BYTES_PER_VALUE.values()) + stack.itemsize
+    tiles = list(stacking_tiles(stack.shape, bytes_per_value, max_memory))
+    plane = stack[0, ..., 0]
+    assert (plane[tiles[0]].shape, plane[tiles[-1]].shape) == (first_tile, last_tile)
+
+    images = list(stack) if as_list else stack
+    for method, stacked in zip(METHODS, tiled_image_stacking(images, METHODS, max_memory)):
+        np.testing.assert_array_equal(stacked, STACKING_FUNCTIONS[method](stack))
@@ -0,0 +1,41 @@
+import time
+
+import numpy as np
+import pytest
+
+from benchmarking.utils import render_planet, synthetic_frames
+from detect_and_crop.handler import crop_around, find_centroid
+from detect_and_crop.tracking import CentroidTracker
+
+CROP_SIZE = 512
+
+
+@pytest.fixture(scope="module")
+def frames() -> list:
+    # Faint sensor noise still sets mask pixels all over the frame, but leaves find_centroid on the disc.
+    return list(synthetic_frames(render_planet(CROP_SIZE), CROP_SIZE * 3 // 2, 12, noise=1.0))
+
+def test_tracked_crops_match_detected_crops(frames):
+    tracker = CentroidTracker()
+    for frame in frames:
+        tracked, detected = tracker.update(frame), find_centroid(frame)
+        assert np.abs(np.subtract(tracked, detected)).max() <= 1
+        difference = crop_around(frame, tracked, CROP_SIZE).astype(int) - crop_around(frame, detected, CROP_SIZE)
+        assert np.abs(difference).mean() < 2
+
+def test_tracking_searches_a_window_around_the_disc(frames):
+    tracker = CentroidTracker()
+    tracker.update(frames[0])
+    left, top, right, bottom = tracker.extent
+    assert max(right - left, bottom - top) < CROP_SIZE
+
+    def best_time(locate) -> float:
+        times = []
+        for _ in range(3):
+            started = time.perf_counter()
+            for frame in frames[1:]:
+                locate(frame)
+            times.append(time.perf_counter() - started)
+        return min(times)
+
+    assert best_time(tracker.update) < 0.5 * best_time(find_centroid)
@@ -0,0 +1,19 @@
+import numpy as np
+
+from evaluate_and_align.handler import evaluate_and_align_two_pass
+from tests.conftest import CROP_SIZE
+
+THRESHOLD = 0.8
+
+
+def test_aligning_to_file_matches_aligning_in_memory(tmp_path, capture_video):
+    in_memory = evaluate_and_align_two_pass([capture_video], CROP_SIZE, THRESHOLD, "ecc")
+    on_disk = evaluate_and_align_two_pass(
+        [capture_video], CROP_SIZE, THRESHOLD, "ecc", aligned_path=str(tmp_path / "aligned.npy")
+    )
+    assert isinstance(on_disk.aligned_images, np.memmap)
+    assert on_disk.best_index == in_memory.best_index
+    np.testing.assert_array_equal(on_disk.selected, in_memory.selected)
+    np.testing.assert_array_equal(on_disk.aligned_images, np.array(in_memory.aligned_images))
+    np.testing.assert_array_equal(on_disk.residuals, in_memory.residuals)
+    np.testing.assert_array_equal(on_disk.warp_matrices, in_memory.warp_matrices)
@@ -0,0 +1,52 @@
+from typing import List
+
+import cv2
+import numpy as np
+import pytest
+
+from video_reader.handler import read_frames, read_selected_frames
+
+FRAMES = 10
+
+
+def write_video(path: str, first_value: int) -> str:
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30.0, (32, 24))
+    for index in range(FRAMES):
+        writer.write(np.full((24, 32, 3), first_value + 10 * index, dtype=np.uint8))
+    writer.release()
+    return path
+
+@pytest.fixture(scope="module")
+def two_videos(tmp_path_factory) -> List[str]:
+    directory = tmp_path_factory.mktemp("videos")
+    return [write_video(str(directory / "a.avi"), 0), write_video(str(directory / "b.avi"), 120)]
+
+@pytest.mark.parametrize("prefetch", [0, 2])
+def test_read_frames_records_decoded_counts(two_videos, prefetch):
+    decoded_counts: List[int] = []
+    frames = [frame.copy() for frame in read_frames(two_videos, prefetch, decoded_counts)]
+    assert len(frames) == 2 * FRAMES
+    assert decoded_counts == [FRAMES, FRAMES]
+
+@pytest.mark.parametrize("prefetch", [0, 3])
+@pytest.mark.parametrize("seek", [False, True])
+def test_selected_frames_follow_decoded_counts(two_videos, prefetch, seek):
+    first = [frame.copy() for frame in read_frames(two_videos[:1])]
+    second = [frame.copy() for frame in read_frames(two_videos[1:])]
+    # The first pass read only 6 frames of the first video, so its global indices end there.
+    frame_counts = [6, FRAMES]
+    selected = {
+        index: frame.copy()
+        for index, frame in read_selected_frames(two_videos, [2, 5, 7, 8, 12, 15], prefetch, seek, frame_counts)
+    }
+    assert sorted(selected) == [2, 5, 7, 8, 12, 15]
+    for index, expected in [(2, first[2]), (5, first[5]), (7, second[1]), (8, second[2]), (12, second[6]),
+                            (15, second[9])]:
+        np.testing.assert_array_equal(selected[index], expected)
+
+@pytest.mark.parametrize("prefetch", [0, 3])
+def test_selected_frames_skip_videos_without_wanted_frames(two_videos, prefetch):
+    second = [frame.copy() for frame in read_frames(two_videos[1:])]
+    selected = list(read_selected_frames(two_videos, [7], prefetch, frame_counts=[4, FRAMES]))
+    assert [index for index, _ in selected] == [7]
+    np.testing.assert_array_equal(selected[0][1], second[3])
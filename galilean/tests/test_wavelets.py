@@ -0,0 +1,38 @@
+import cv2
+import numpy as np
+import pytest
+
+from postprocessing.wavelets import (WaveletSharpener, atrous_decompose,
+                                     calibrated_lab, scale_gains)
+
+GAINS = [1.8, 1.4, 1.2, 1.0, 0.9]
+
+
+@pytest.fixture(scope="module")
+def image() -> np.ndarray:
+    rng = np.random.default_rng(5)
+    smooth = cv2.GaussianBlur(rng.uniform(0, 255, (70, 90, 3)).astype(np.float32), (0, 0), 3)
+    return np.clip(smooth * 2 - 128 + rng.normal(0, 8, smooth.shape), 0, 255).astype(np.uint8)
+
+def test_layers_add_up_to_the_channel(image):
+    lightness = np.ascontiguousarray(calibrated_lab(image)[:, :, 0])
+    np.testing.assert_allclose(np.sum(atrous_decompose(lightness, 5), axis=0), lightness, atol=1e-4)
+
+def test_unit_gains_reproduce_the_calibrated_image(image):
+    sharpener = WaveletSharpener(image, len(GAINS))
+    calibrated = np.clip(cv2.cvtColor(calibrated_lab(image), cv2.COLOR_LAB2BGR) * 255, 0, 255)
+    np.testing.assert_allclose(sharpener.sharpen([1.0] * len(GAINS)), calibrated, atol=0.01)
+    np.testing.assert_array_equal(sharpener.sharpen(scale_gains(GAINS, 0)), sharpener.sharpen([]))
+
+def test_unit_gains_reproduce_a_gray_input(image):
+    gray = cv2.cvtColor(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), cv2.COLOR_GRAY2BGR)
+    np.testing.assert_allclose(WaveletSharpener(gray).sharpen([1.0] * 6), gray, atol=0.5)
+
+def test_retuning_matches_a_fresh_decomposition(image):
+    sharpener = WaveletSharpener(image, len(GAINS))
+    for amount in (0.5, 2.0, 1.0):
+        sharpener.sharpen(scale_gains(GAINS, amount))
+    retuned = sharpener.sharpen(scale_gains(GAINS, 1.5))
+    fresh = WaveletSharpener(image, len(GAINS))
+    np.testing.assert_array_equal(retuned, fresh.sharpen(scale_gains(GAINS, 1.5)))
+    assert not np.array_equal(retuned, sharpener.sharpen([]))
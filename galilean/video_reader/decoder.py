@@ -0,0 +1,200 @@
+import queue
+import threading
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from profiling.handler import span
+from video_reader.utils import open_video_at
+
+POLL_SECONDS = 0.1
+
+
+class VideoPrefetcher(threading.Thread):
+    """Decodes one video on a background thread into a bounded ring of preallocated frame buffers.
+
+    Buffers cycle between a free queue and a ready queue, so at most buffer_size decoded frames
+    are held at once and no frame is allocated after the first. With wanted positions, every other
+    frame is only grabbed, never retrieved, and decoding stops after the last wanted position.
+    With seek, the frames before the first wanted position are seeked over as in open_video_at.
+    """
+
+    def __init__(
+        self,
+        video_path: str,
+        buffer_size: int = 8,
+        wanted: Optional[Sequence[int]] = None,
+        on_finished: Optional[Callable[[int, bool], None]] = None,
+        seek: bool = False,
+    ):
+        super().__init__(daemon=True)
+        self.video_path = video_path
+        self.wanted = wanted
+        self.seek = seek
+        self.on_finished = on_finished
+        self.buffers: List[Optional[np.ndarray]] = [None] * buffer_size
+        self.free: "queue.Queue[int]" = queue.Queue()
+        self.ready: "queue.Queue[Tuple[int, int]]" = queue.Queue()
+        self.stopped = threading.Event()
+        self.error: Optional[BaseException] = None
+        for slot in range(buffer_size):
+            self.free.put(slot)
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def _take_slot(self) -> Optional[int]:
+        while not self.stopped.is_set():
+            try:
+                return self.free.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return None
+
+    def run(self) -> None:
+        position = 0
+        exhausted = False
+        try:
+            with span("decode", 1):
+                cap, position = open_video_at(self.video_path, self.wanted[0] if self.wanted else 0, self.seek)
+            try:
+                cursor = 0
+                while not self.stopped.is_set():
+                    if self.wanted is not None and cursor == len(self.wanted):
+                        exhausted = True
+                        break
+                    if self.wanted is not None and position != self.wanted[cursor]:
+                        with span("decode", 1):
+                            grabbed = cap.grab()
+                        if not grabbed:
+                            break
+                        position += 1
+                        continue
+
+                    slot = self._take_slot()
+                    if slot is None:
+                        break
+                    with span("decode", 1):
+                        ret, frame = cap.read(self.buffers[slot])
+                    if not ret:
+                        self.free.put(slot)
+                        break
+                    self.buffers[slot] = frame
+                    self.ready.put((position, slot))
+                    position += 1
+                    cursor += 1
+            finally:
+                cap.release()
+        except BaseException as error:
+            self.error = error
+        finally:
+            self.ready.put((position, -1))
+            if self.on_finished is not None and self.error is None:
+                self.on_finished(position, exhausted)
+
+    def frames(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield (position, frame) in decode order; each frame is only valid until the next one is requested."""
+        while True:
+            position, slot = self.ready.get()
+            if slot < 0:
+                if self.error is not None:
+                    raise self.error
+                return
+            try:
+                yield position, self.buffers[slot]
+            finally:
+                self.free.put(slot)
+
+
+def prefetch_frames(
+    video_paths: List[str],
+    indices: Optional[Sequence[int]] = None,
+    buffer_size: int = 8,
+    max_videos: int = 2,
+    seek: bool = False,
+    frame_counts: Optional[Sequence[int]] = None,
+    decoded_counts: Optional[List[int]] = None,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """Decode the videos on background threads and yield (global index, frame) in order.
+
+    Up to max_videos videos are decoded at once when every frame is read, and a given
+    decoded_counts list receives the number of frames read from each. When only the frames
+    at the given global indices are wanted, the global position of a video is only known once the
+    previous one has been fully grabbed, or from frame_counts as in read_selected_frames, so each
+    video starts decoding as soon as the previous one has finished, still ahead of the consumer,
+    and with seek skips to its first wanted frame as in open_video_at. Frames are views of reused
+    buffers and are only valid until the next frame is requested.
+    """
+    prefetchers: List[Optional[VideoPrefetcher]] = [None] * len(video_paths)
+    offsets = [0] * len(video_paths)
+    started = [threading.Event() for _ in video_paths]
+    lock = threading.Lock()
+    closing = False
+
+    def start(video: int, wanted: Optional[Sequence[int]] = None, on_finished=None) -> None:
+        with lock:
+            if not closing:
+                prefetchers[video] = VideoPrefetcher(video_paths[video], buffer_size, wanted, on_finished, seek)
+                prefetchers[video].start()
+        started[video].set()
+
+    def skip_from(video: int) -> None:
+        for event in started[video:]:
+            event.set()
+
+    if indices is None:
+        for video in range(min(max_videos, len(video_paths))):
+            start(video)
+    else:
+        wanted = np.unique(np.asarray(indices, dtype=np.int64))
+
+        def start_selected(video: int, offset: int) -> None:
+            remaining = wanted[wanted >= offset] - offset
+            if video >= len(video_paths) or not len(remaining):
+                skip_from(video)
+                return
+            if frame_counts is not None:
+                remaining = remaining[remaining < frame_counts[video]]
+                if not len(remaining):
+                    started[video].set()
+                    start_selected(video + 1, offset + frame_counts[video])
+                    return
+
+            def on_finished(count: int, exhausted: bool) -> None:
+                if frame_counts is not None:
+                    start_selected(video + 1, offset + frame_counts[video])
+                elif exhausted:
+                    skip_from(video + 1)
+                else:
+                    start_selected(video + 1, offset + count)
+
+            offsets[video] = offset
+            start(video, remaining.tolist(), on_finished)
+
+        start_selected(0, 0)
+
+    offset = 0
+    try:
+        for video in range(len(video_paths)):
+            started[video].wait()
+            prefetcher = prefetchers[video]
+            if prefetcher is None:
+                continue
+            if indices is not None:
+                offset = offsets[video]
+            position = -1
+            for position, frame in prefetcher.frames():
+                yield offset + position, frame
+            if indices is None:
+                offset += position + 1
+                if decoded_counts is not None:
+                    decoded_counts.append(position + 1)
+                if video + max_videos < len(video_paths):
+                    start(video + max_videos)
+    finally:
+        with lock:
+            closing = True
+        for prefetcher in prefetchers:
+            if prefetcher is not None:
+                prefetcher.stop()
+                prefetcher.join()
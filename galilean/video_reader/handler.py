@@ -0,0 +1,192 @@
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from profiling.handler import span
+from video_reader.decoder import prefetch_frames
+from video_reader.raw import is_raw_capture, open_raw_capture
+from video_reader.utils import (MAX_GRAB_DISTANCE, get_frame_count,
+                                open_video, open_video_at)
+
+
+def read_frames(
+    video_paths: List[str],
+    prefetch: int = 0,
+    decoded_counts: Optional[List[int]] = None,
+) -> Iterator[np.ndarray]:
+    """Decode the videos one frame at a time, so only a single raw frame is held in memory.
+
+    With prefetch > 0, frames are decoded ahead on background threads into that many reused
+    buffers, and each frame is only valid until the next one is requested. Raw captures are
+    memory-mapped and converted on demand instead, so they are never prefetched. A given
+    decoded_counts list receives the number of frames read from each video, for
+    read_selected_frames to find the same global indices again.
+    """
+    if prefetch > 0 and not any(map(is_raw_capture, video_paths)):
+        for _, frame in prefetch_frames(video_paths, buffer_size=prefetch, decoded_counts=decoded_counts):
+            yield frame
+        return
+    for video_path in video_paths:
+        count = 0
+        if is_raw_capture(video_path):
+            for frame in read_frame_range(video_path):
+                count += 1
+                yield frame
+        else:
+            cap = open_video(video_path)
+            try:
+                while True:
+                    with span("decode", 1):
+                        ret, frame = cap.read()
+                    if not ret:
+                        break
+                    count += 1
+                    yield frame
+            finally:
+                cap.release()
+        if decoded_counts is not None:
+            decoded_counts.append(count)
+
+def read_selected_frames(
+    video_paths: List[str],
+    indices: Iterable[int],
+    prefetch: int = 0,
+    seek: bool = False,
+    frame_counts: Optional[Sequence[int]] = None,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """Decode only the frames at the given global indices, in ascending order.
+
+    Skipped frames are grabbed without being retrieved, which avoids their color conversion
+    and is frame-accurate where container seeking is not. With seek, the frames before the first
+    wanted one of each video are seeked over as in open_video_at. Raw captures jump straight to
+    each wanted frame. With prefetch > 0, decoding runs ahead on background threads as in read_frames.
+    Global indices count the frames grabbed from each video, or with frame_counts, the decoded
+    counts read_frames gave for each video, which a failed read may have cut short.
+    """
+    wanted = sorted(set(int(index) for index in indices))
+    if prefetch > 0 and not any(map(is_raw_capture, video_paths)):
+        yield from prefetch_frames(video_paths, wanted, prefetch, seek=seek, frame_counts=frame_counts)
+        return
+    position = 0
+    cursor = 0
+    for video, video_path in enumerate(video_paths):
+        if cursor == len(wanted):
+            break
+        end = None if frame_counts is None else position + frame_counts[video]
+        if end is not None and wanted[cursor] >= end:
+            position = end
+            continue
+        if is_raw_capture(video_path):
+            capture = open_raw_capture(video_path)
+            while cursor < len(wanted) and wanted[cursor] < position + len(capture):
+                with span("decode", 1):
+                    frame = capture.frame(wanted[cursor] - position)
+                yield wanted[cursor], frame
+                cursor += 1
+            position += len(capture)
+            continue
+        with span("decode", 1):
+            cap, skipped = open_video_at(video_path, wanted[cursor] - position, seek)
+        position += skipped
+        try:
+            while cursor < len(wanted) and (end is None or wanted[cursor] < end):
+                with span("decode", 1):
+                    if not cap.grab():
+                        break
+                    ret = False
+                    if position == wanted[cursor]:
+                        ret, frame = cap.retrieve()
+                if position == wanted[cursor]:
+                    if ret:
+                        yield position, frame
+                    cursor += 1
+                position += 1
+        finally:
+            cap.release()
+        if end is not None:
+            position = end
+            while cursor < len(wanted) and wanted[cursor] < end:
+                cursor += 1
+
+def read_frame_range(
+    video_path: str,
+    start: int = 0,
+    stop: Optional[int] = None,
+    seek: bool = False,
+) -> Iterator[np.ndarray]:
+    """Decode the frames of one video from start up to stop, or to the end when stop is None.
+
+    Leading frames are grabbed without being retrieved, or seeked over with seek, as in
+    open_video_at. Raw captures start at the first frame directly.
+    """
+    if is_raw_capture(video_path):
+        capture = open_raw_capture(video_path)
+        for index in range(start, len(capture) if stop is None else min(stop, len(capture))):
+            with span("decode", 1):
+                frame = capture.frame(index)
+            yield frame
+        return
+    with span("decode", 1):
+        cap, position = open_video_at(video_path, start, seek)
+    try:
+        if position < start:
+            return
+        while stop is None or position < stop:
+            with span("decode", 1):
+                ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+            position += 1
+    finally:
+        cap.release()
+
+def seek_frames(
+    video_paths: List[str],
+    indices: Iterable[int],
+    frame_counts: Optional[List[int]] = None,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """Decode the frames at the given global indices in ascending order, seeking between distant ones.
+
+    Much faster than read_selected_frames for sparse indices in long videos, but seeking may land
+    on a nearby frame in some containers, so it suits previews rather than stacking.
+    """
+    wanted = sorted(set(int(index) for index in indices))
+    if frame_counts is None:
+        frame_counts = [get_frame_count(video_path) for video_path in video_paths]
+    offset = 0
+    cursor = 0
+    for video_path, frame_count in zip(video_paths, frame_counts):
+        local = []
+        while cursor < len(wanted) and wanted[cursor] < offset + frame_count:
+            local.append(wanted[cursor] - offset)
+            cursor += 1
+        if local and is_raw_capture(video_path):
+            capture = open_raw_capture(video_path)
+            for index in local:
+                with span("decode", 1):
+                    frame = capture.frame(index)
+                yield offset + index, frame
+        elif local:
+            cap = open_video(video_path)
+            try:
+                position = 0
+                for index in local:
+                    with span("decode", 1):
+                        if 0 <= index - position <= MAX_GRAB_DISTANCE:
+                            for _ in range(index - position):
+                                cap.grab()
+                        else:
+                            cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+                        ret, frame = cap.read()
+                    position = index + 1
+                    if ret:
+                        yield offset + index, frame
+            finally:
+                cap.release()
+        offset += frame_count
+
+def count_frames(video_paths: List[str]) -> int:
+    """Estimate the total number of frames across all videos."""
+    return sum(get_frame_count(video_path) for video_path in video_paths)
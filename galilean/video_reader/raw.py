@@ -0,0 +1,187 @@
+import os
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+SER_EXTENSIONS = (".ser",)
+FITS_EXTENSIONS = (".fits", ".fit", ".fts")
+RAW_EXTENSIONS = SER_EXTENSIONS + FITS_EXTENSIONS
+
+SER_HEADER = np.dtype([
+    ("file_id", "S14"), ("lu_id", "<i4"), ("color_id", "<i4"), ("little_endian", "<i4"),
+    ("width", "<i4"), ("height", "<i4"), ("pixel_depth", "<i4"), ("frame_count", "<i4"),
+    ("observer", "S40"), ("instrument", "S40"), ("telescope", "S40"),
+    ("date_time", "<i8"), ("date_time_utc", "<i8"),
+])
+SER_MONO, SER_RGB, SER_BGR = 0, 100, 101
+SER_BAYER_PATTERNS = {8: "RGGB", 9: "GRBG", 10: "GBRG", 11: "BGGR"}
+
+FITS_BLOCK = 2880
+FITS_CARD = 80
+FITS_DTYPES = {8: ">u1", 16: ">i2", 32: ">i4", -32: ">f4", -64: ">f8"}
+
+BAYER_TO_BGR = {
+    "RGGB": cv2.COLOR_BayerRGGB2BGR,
+    "GRBG": cv2.COLOR_BayerGRBG2BGR,
+    "GBRG": cv2.COLOR_BayerGBRG2BGR,
+    "BGGR": cv2.COLOR_BayerBGGR2BGR,
+}
+
+
+def is_raw_capture(path: str) -> bool:
+    """Whether a file is an uncompressed SER or FITS capture rather than a video."""
+    return path.lower().endswith(RAW_EXTENSIONS)
+
+
+class RawCapture:
+    """Frames of an uncompressed capture, memory-mapped so any frame is reached in O(1).
+
+    raw returns zero-copy views of the stored samples; frame converts one frame on demand
+    to the 8-bit BGR layout that cv2.VideoCapture produces, debayering mosaic frames, so
+    frames that are never requested are never read from disk.
+    """
+
+    def __init__(self, path: str, frames: np.ndarray, bayer: Optional[str] = None, rgb: bool = False,
+                 shift: Optional[int] = None, flip_sign: bool = False, scale: float = 1.0, offset: float = 0.0,
+                 fps: float = 0.0):
+        self.path = path
+        self.frames = frames
+        self.bayer = bayer
+        self.rgb = rgb
+        self.shift = shift
+        self.flip_sign = flip_sign
+        self.scale = scale
+        self.offset = offset
+        self.fps = fps
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    @property
+    def width(self) -> int:
+        return self.frames.shape[2]
+
+    @property
+    def height(self) -> int:
+        return self.frames.shape[1]
+
+    def raw(self, index: int) -> np.ndarray:
+        """The stored samples of one frame, as a view of the mapped file."""
+        return self.frames[index]
+
+    def _to_uint8(self, samples: np.ndarray) -> np.ndarray:
+        if self.shift is not None:
+            if self.flip_sign:
+                # Unsigned samples stored as signed with a BZERO offset: flipping the sign bit adds the offset exactly.
+                samples = samples.view(samples.dtype.str.replace("i", "u")) ^ (1 << (8 * samples.itemsize - 1))
+            if samples.dtype == np.uint8 and not self.shift:
+                return samples
+            return (samples >> self.shift).astype(np.uint8)
+        return np.clip(samples * self.scale + self.offset, 0, 255).astype(np.uint8)
+
+    def frame(self, index: int) -> np.ndarray:
+        """One frame as contiguous 8-bit BGR."""
+        samples = self._to_uint8(self.raw(index))
+        if samples.ndim == 3:
+            return cv2.cvtColor(samples, cv2.COLOR_RGB2BGR) if self.rgb else np.ascontiguousarray(samples)
+        if self.bayer is not None:
+            return cv2.cvtColor(samples, BAYER_TO_BGR[self.bayer])
+        return cv2.cvtColor(samples, cv2.COLOR_GRAY2BGR)
+
+    def iter_frames(self, start: int = 0, stop: Optional[int] = None) -> Iterator[np.ndarray]:
+        """Convert the frames from start up to stop, or to the end when stop is None."""
+        for index in range(start, min(len(self), stop) if stop is not None else len(self)):
+            yield self.frame(index)
+
+
+def open_ser(path: str) -> RawCapture:
+    """Map a SER capture.
+
+    Most capture software writes the LittleEndian flag inverted, so 16-bit samples are read as
+    little-endian when it is 0, as other SER readers do.
+    """
+    header = np.fromfile(path, dtype=SER_HEADER, count=1)
+    if len(header) == 0 or not header["file_id"][0].startswith(b"LUCAM-RECORDER"):
+        raise ValueError(f"Not a SER file: {path}")
+    header = header[0]
+    color_id, depth = int(header["color_id"]), int(header["pixel_depth"])
+    width, height = int(header["width"]), int(header["height"])
+    planes = 3 if color_id in (SER_RGB, SER_BGR) else 1
+    if color_id not in (SER_MONO, SER_RGB, SER_BGR) and color_id not in SER_BAYER_PATTERNS:
+        raise ValueError(f"Unsupported SER color format {color_id}: {path}")
+
+    dtype = np.dtype(np.uint8) if depth <= 8 else np.dtype("<u2" if header["little_endian"] == 0 else ">u2")
+    frame_bytes = width * height * planes * dtype.itemsize
+    frame_count = min(int(header["frame_count"]), (os.path.getsize(path) - SER_HEADER.itemsize) // frame_bytes)
+    shape = (frame_count, height, width) + ((planes,) if planes > 1 else ())
+    frames = np.memmap(path, dtype=dtype, mode="r", offset=SER_HEADER.itemsize, shape=shape) if frame_count else \
+        np.empty(shape, dtype=dtype)
+    return RawCapture(path, frames, SER_BAYER_PATTERNS.get(color_id), color_id == SER_RGB, shift=max(depth - 8, 0))
+
+def _fits_value(text: str) -> Any:
+    text = text.strip()
+    if text.startswith("'"):
+        return text[1:].split("'")[0].rstrip()
+    text = text.split("/")[0].strip()
+    if text in ("T", "F"):
+        return text == "T"
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+def read_fits_header(path: str) -> Tuple[Dict[str, Any], int]:
+    """Parse the primary FITS header, returning its keywords and the offset of the data."""
+    cards: Dict[str, Any] = {}
+    with open(path, "rb") as file:
+        offset = 0
+        while True:
+            block = file.read(FITS_BLOCK)
+            if len(block) < FITS_BLOCK:
+                raise ValueError(f"Truncated FITS header: {path}")
+            offset += FITS_BLOCK
+            for start in range(0, FITS_BLOCK, FITS_CARD):
+                card = block[start:start + FITS_CARD].decode("ascii", errors="replace")
+                key = card[:8].strip()
+                if key == "END":
+                    return cards, offset
+                if card[8:10] == "= ":
+                    cards[key] = _fits_value(card[10:])
+
+def open_fits(path: str) -> RawCapture:
+    """Map a FITS image or cube of frames (NAXIS3), in file row order.
+
+    Integer samples are reduced to 8 bits by dropping their low bits, with the usual BZERO
+    offset for unsigned 16-bit data; floating point samples are taken to be in [0, 1].
+    """
+    cards, offset = read_fits_header(path)
+    if cards.get("SIMPLE") is not True:
+        raise ValueError(f"Not a FITS file: {path}")
+    bitpix, naxis = cards.get("BITPIX"), cards.get("NAXIS", 0)
+    if bitpix not in FITS_DTYPES or naxis not in (2, 3):
+        raise ValueError(f"Unsupported FITS layout (BITPIX={bitpix}, NAXIS={naxis}): {path}")
+    width, height = cards["NAXIS1"], cards["NAXIS2"]
+    frame_count = cards["NAXIS3"] if naxis == 3 else 1
+    dtype = np.dtype(FITS_DTYPES[bitpix])
+    frames = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(frame_count, height, width))
+
+    bscale, bzero = float(cards.get("BSCALE", 1.0)), float(cards.get("BZERO", 0.0))
+    bayer = cards.get("BAYERPAT")
+    bayer = bayer.upper() if isinstance(bayer, str) and bayer.upper() in BAYER_TO_BGR else None
+    if bitpix == 8 and (bscale, bzero) == (1.0, 0.0):
+        return RawCapture(path, frames, bayer, shift=0)
+    if bitpix == 16 and (bscale, bzero) == (1.0, 32768.0):
+        return RawCapture(path, frames, bayer, shift=8, flip_sign=True)
+    full_scale = 1.0 if bitpix < 0 else float(2 ** bitpix - 1)
+    return RawCapture(path, frames, bayer, scale=bscale * 255 / full_scale, offset=bzero * 255 / full_scale)
+
+def open_raw_capture(path: str) -> RawCapture:
+    """Map a SER or FITS capture, chosen by file extension."""
+    if path.lower().endswith(SER_EXTENSIONS):
+        return open_ser(path)
+    if path.lower().endswith(FITS_EXTENSIONS):
+        return open_fits(path)
+    raise ValueError(f"Not a raw capture: {path}")
@@ -0,0 +1,78 @@
+from typing import NamedTuple, Tuple
+
+import cv2
+
+from video_reader.raw import is_raw_capture, open_raw_capture
+
+# Forward gaps up to this many frames are grabbed through rather than seeked over.
+MAX_GRAB_DISTANCE = 16
+
+
+class VideoInfo(NamedTuple):
+    """Container metadata of a video, read without decoding any frames."""
+    width: int
+    height: int
+    frame_count: int
+    fps: float
+
+
+def open_video(video_path: str) -> cv2.VideoCapture:
+    """Open a video file for decoding, raising if it cannot be read."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video: {video_path}")
+    return cap
+
+def open_video_at(video_path: str, start: int = 0, seek: bool = False) -> Tuple[cv2.VideoCapture, int]:
+    """Open a video positioned before frame start, returning the capture and the frame it is at.
+
+    Leading frames are grabbed without being retrieved, which is frame-accurate where container
+    seeking is not. With seek, gaps beyond MAX_GRAB_DISTANCE within the reported frame count are
+    seeked over instead, falling back to grabbing when the capture does not report landing exactly
+    on start. The returned position is short of start only when the video is.
+    """
+    cap = open_video(video_path)
+    if seek and MAX_GRAB_DISTANCE < start < cap.get(cv2.CAP_PROP_FRAME_COUNT):
+        if cap.set(cv2.CAP_PROP_POS_FRAMES, start) and int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == start:
+            return cap, start
+        cap.release()
+        cap = open_video(video_path)
+    position = 0
+    while position < start and cap.grab():
+        position += 1
+    return cap, position
+
+def get_video_resolution(video_path: str) -> Tuple[int, int]:
+    """Return the (width, height) of a video without decoding any frames."""
+    if is_raw_capture(video_path):
+        capture = open_raw_capture(video_path)
+        return capture.width, capture.height
+    cap = cv2.VideoCapture(video_path)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    return width, height
+
+def get_frame_count(video_path: str) -> int:
+    """Return the frame count reported by the container (may be approximate)."""
+    if is_raw_capture(video_path):
+        return len(open_raw_capture(video_path))
+    cap = cv2.VideoCapture(video_path)
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return max(count, 0)
+
+def probe_video(video_path: str) -> VideoInfo:
+    """Read the resolution, frame count and frame rate of a video with a single open."""
+    if is_raw_capture(video_path):
+        capture = open_raw_capture(video_path)
+        return VideoInfo(capture.width, capture.height, len(capture), capture.fps)
+    cap = open_video(video_path)
+    info = VideoInfo(
+        int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0),
+        float(cap.get(cv2.CAP_PROP_FPS)),
+    )
+    cap.release()
+    return info